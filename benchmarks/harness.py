@@ -0,0 +1,93 @@
+import resource
+from time import perf_counter_ns
+from typing import Callable, Optional
+
+
+class BenchmarkResult:
+
+    def __init__(self,
+                 name: str,
+                 latencies_in_ns: list,
+                 elapsed_in_ns: int,
+                 operations_count: int,
+                 extra: Optional[dict] = None):
+        self.name = name
+        self.latencies_in_ns = sorted(latencies_in_ns)
+        self.elapsed_in_ns = elapsed_in_ns
+        self.operations_count = operations_count
+        self.extra = extra or {}
+
+    def percentile_in_us(self, percentile: float) -> float:
+        if not self.latencies_in_ns:
+            return 0.0
+        index = min(int(len(self.latencies_in_ns) * percentile / 100), len(self.latencies_in_ns) - 1)
+        return self.latencies_in_ns[index] / 1000
+
+    @property
+    def ops_per_s(self) -> float:
+        return self.operations_count * 1e9 / self.elapsed_in_ns if self.elapsed_in_ns else 0.0
+
+    def to_dict(self) -> dict:
+        return dict({
+            "p50_us": round(self.percentile_in_us(50), 3),
+            "p99_us": round(self.percentile_in_us(99), 3),
+            "ops_per_s": round(self.ops_per_s, 1),
+            "peak_rss_kb": peak_rss_in_kb()
+        }, **self.extra)
+
+
+def peak_rss_in_kb() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def time_operations(name: str,
+                    operation: Callable[[int], object],
+                    iterations: int,
+                    batch_size: int = 1) -> BenchmarkResult:
+    """
+    Calls operation(i) for i in range(iterations) and records latencies.
+    Operations faster than the clock resolution should be timed in batches:
+    the latency of a batch is then divided by batch_size.
+    """
+    latencies = []
+    started_at = perf_counter_ns()
+    for batch_start in range(0, iterations, batch_size):
+        batch = range(batch_start, min(batch_start + batch_size, iterations))
+        batch_started_at = perf_counter_ns()
+        for i in batch:
+            operation(i)
+        latencies.append((perf_counter_ns() - batch_started_at) // len(batch))
+    return BenchmarkResult(name, latencies, perf_counter_ns() - started_at, iterations)
+
+
+# Lower is better for latencies and memory, higher is better for throughput
+REGRESSION_DIRECTIONS = {
+    "p50_us": 1,
+    "p99_us": 1,
+    "peak_rss_kb": 1,
+    "ops_per_s": -1,
+}
+
+
+def find_regressions(results: dict,
+                     baseline: dict,
+                     threshold: float) -> list:
+    """
+    Compares results with a baseline, both mapping benchmark names to metrics.
+    :param threshold: tolerated relative degradation (0.2 means 20%)
+    :return: a human readable line for each metric degraded by more than threshold
+    """
+    regressions = []
+    for name, metrics in results.items():
+        baseline_metrics = baseline.get(name)
+        if baseline_metrics is None:
+            continue
+        for metric, direction in REGRESSION_DIRECTIONS.items():
+            value = metrics.get(metric)
+            reference = baseline_metrics.get(metric)
+            if not value or not reference:
+                continue
+            degradation = direction * (value - reference) / reference
+            if degradation > threshold:
+                regressions.append(f"{name}.{metric}: {reference} -> {value} ({degradation:+.0%})")
+    return regressions
@@ -0,0 +1,84 @@
+"""
+Runs the benchmark suite, records p50/p99 latency, ops/sec and peak RSS as JSON,
+and compares them with a stored baseline.
+
+Each benchmark runs in its own interpreter so that peak RSS is measured per benchmark,
+and so that asyncio benchmarks run in a process that is not monkey patched by gevent.
+
+    PYTHONPATH=. python -m benchmarks.run --save-baseline     # record benchmarks/baseline.json on this machine
+    PYTHONPATH=. python -m benchmarks.run                     # exits with 1 on a regression above --threshold
+    PYTHONPATH=. python -m benchmarks.run --only gateway_op_receive --only command_round_trip
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from .harness import find_regressions
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE_PATH = os.path.join(BENCHMARKS_DIRECTORY, "baseline.json")
+DEFAULT_THRESHOLD = 0.2
+
+
+def run_in_worker(name: str) -> dict:
+    completed = subprocess.run([sys.executable, "-m", "benchmarks.run", "--worker", name],
+                               stdout=subprocess.PIPE, check=True)
+    return json.loads(completed.stdout.decode("utf-8").splitlines()[-1])
+
+
+def run_worker(name: str) -> None:
+    if not name.endswith("_asyncio"):
+        from gevent import monkey
+        monkey.patch_all()
+
+    from .suite import BENCHMARKS
+    result = BENCHMARKS[name]()
+    print(json.dumps(result.to_dict()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", action="append", help="benchmark to run (repeatable, default: all)")
+    parser.add_argument("--output", help="where to write results as JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="tolerated relative degradation before failing (default: %(default)s)")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker)
+        return
+
+    from .suite import BENCHMARKS
+    results = {}
+    for name in args.only or BENCHMARKS:
+        results[name] = run_in_worker(name)
+        print(f"{name:40} {json.dumps(results[name])}", flush=True)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}, run with --save-baseline to record one")
+        return
+
+    with open(args.baseline) as baseline_file:
+        regressions = find_regressions(results, json.load(baseline_file), args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
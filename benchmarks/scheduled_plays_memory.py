@@ -0,0 +1,71 @@
+"""
+Measures the memory held by concurrent !roulette plays while they wait for their suspense delay.
+
+Compares the former in-handler `sleep` (one parked greenlet per play) with continuations
+scheduled on the shared timer queue.
+
+    PYTHONPATH=. python benchmarks/scheduled_plays_memory.py --plays 10000
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import gc
+import tracemalloc
+
+import gevent
+
+from discord.scheduler import Scheduler
+
+SUSPENSE_DELAY_IN_S = 3
+
+
+def continuation(play: dict) -> None:
+    play.clear()
+
+
+def sleeping_handler(play: dict) -> None:
+    gevent.sleep(SUSPENSE_DELAY_IN_S)
+    continuation(play)
+
+
+def measure(start_plays, plays: int) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    holders = start_plays(plays)
+    gevent.sleep(0)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    for holder in holders:
+        if hasattr(holder, "kill"):
+            holder.kill(block=False)
+        else:
+            holder.cancel()
+    return after - before
+
+
+def sleeping_plays(plays: int) -> list:
+    return [gevent.spawn(sleeping_handler, {"play": i}) for i in range(plays)]
+
+
+def scheduled_plays(plays: int) -> list:
+    scheduler = Scheduler()
+    return [scheduler.schedule(SUSPENSE_DELAY_IN_S, continuation, {"play": i}) for i in range(plays)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plays", type=int, default=10_000)
+    args = parser.parse_args()
+
+    sleeping = measure(sleeping_plays, args.plays)
+    scheduled = measure(scheduled_plays, args.plays)
+
+    print(f"{args.plays} concurrent plays")
+    print(f"  sleeping greenlets : {sleeping / 1024:10.1f} KiB ({sleeping / args.plays:7.0f} B/play)")
+    print(f"  scheduled tasks    : {scheduled / 1024:10.1f} KiB ({scheduled / args.plays:7.0f} B/play)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+import asyncio
+import io
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from time import perf_counter_ns, sleep
+
+import gevent
+from gevent.event import Event
+
+from discord.callback_holder import Callback, CallbackHolder
+from discord.entities import EntityCache
+from discord.discord_client import DiscordClient, DiscordGatewayConnectionError, DiscordGatewayOp, GatewayUrlCache
+from discord.fake_discord import FakeDiscord
+from discord.key_value import FileStorageKeyIntValue, InMemoryKeyIntValue, PartitionedFileStorageKeyIntValue
+from discord.leaderboard import Leaderboard
+from discord.storage_admin import export_ndjson, import_ndjson
+from roulette import OutcomeStream, simulate
+
+from .harness import BenchmarkResult, time_operations
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    def decorator(function):
+        BENCHMARKS[name] = function
+        return function
+
+    return decorator
+
+
+class Pinger:
+    def pong(self, message) -> None:
+        message.respond("pong")
+
+    def noop(self, *args) -> None:
+        pass
+
+
+MESSAGE_CREATE_FRAME = json.dumps({
+    "op": 0,
+    "s": 42,
+    "t": "MESSAGE_CREATE",
+    "d": {
+        "id": "870000000000000000",
+        "type": 0,
+        "content": "!roulette",
+        "channel_id": "860000000000000000",
+        "guild_id": "850000000000000000",
+        "author": {"id": "840000000000000000", "username": "player", "discriminator": "0000", "avatar": None},
+        "member": {"roles": [], "joined_at": "2021-07-01T00:00:00.000000+00:00", "deaf": False, "mute": False},
+        "timestamp": "2021-07-01T00:00:00.000000+00:00",
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "nonce": "870000000000000001"
+    }
+})
+
+
+@benchmark("gateway_op_receive")
+def gateway_op_receive() -> BenchmarkResult:
+    return time_operations("gateway_op_receive",
+                           lambda i: DiscordGatewayOp.receive(MESSAGE_CREATE_FRAME),
+                           iterations=50_000,
+                           batch_size=10)
+
+
+@benchmark("in_flight_command_memory")
+def in_flight_command_memory(commands_count: int = 10_000, users_count: int = 1000) -> BenchmarkResult:
+    """
+    Memory held by commands between their dispatch and their handler run, measured as bytes per command.
+    """
+    discord_client = DiscordClient(token="benchmark")
+    discord_client.register_callback("!roulette", Pinger(), Pinger.noop)
+    frames = [MESSAGE_CREATE_FRAME.replace('"840000000000000000"', f'"{840000000000000000 + i % users_count}"')
+              .replace('"870000000000000000"', f'"{870000000000000000 + i}"')
+              for i in range(commands_count)]
+
+    in_flight = []
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = time_operations("in_flight_command_memory",
+                             lambda i: in_flight.append(DiscordGatewayOp.receive(frames[i]).handle_event(discord_client)),
+                             iterations=commands_count,
+                             batch_size=10)
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    gevent.killall(in_flight)
+
+    result.extra["bytes_per_command"] = held // commands_count
+    return result
+
+
+@benchmark("callback_holder_matching_callback")
+def callback_holder_matching_callback() -> BenchmarkResult:
+    callback_holder = CallbackHolder()
+    for command in range(50):
+        callback_holder.register_callback(f"!command{command}", Pinger(), Pinger.noop)
+    contents = ["!command7", "just chatting about the roulette", "!command42", "!unknown"]
+    return time_operations("callback_holder_matching_callback",
+                           lambda i: callback_holder.matching_callback(contents[i & 3]),
+                           iterations=1_000_000,
+                           batch_size=1000)
+
+
+def callback_fire_with_cooldown(users_count: int) -> BenchmarkResult:
+    callback = Callback(Pinger(), Pinger.noop, rearm_timeout_in_s=60 * 60)
+    user_ids = [str(840000000000000000 + user) for user in range(users_count)]
+    return time_operations(f"callback_fire_cooldown_{users_count}",
+                           lambda i: callback.fire(None, user_id=user_ids[i]),
+                           iterations=users_count,
+                           batch_size=10)
+
+
+@benchmark("callback_fire_cooldown_10k")
+def callback_fire_cooldown_10k() -> BenchmarkResult:
+    return callback_fire_with_cooldown(10_000)
+
+
+@benchmark("callback_fire_cooldown_100k")
+def callback_fire_cooldown_100k() -> BenchmarkResult:
+    return callback_fire_with_cooldown(100_000)
+
+
+@benchmark("callback_fire_cooldown_1m")
+def callback_fire_cooldown_1m() -> BenchmarkResult:
+    return callback_fire_with_cooldown(1_000_000)
+
+
+@benchmark("key_value_increment_int")
+def key_value_increment_int() -> BenchmarkResult:
+    with tempfile.TemporaryDirectory() as directory:
+        kv = FileStorageKeyIntValue(os.path.join(directory, "benchmark.db"))
+        keys = [f"roulette.{840000000000000000 + user}" for user in range(1000)]
+        result = time_operations("key_value_increment_int",
+                                 lambda i: kv.increment_int(keys[i % 1000], 1),
+                                 iterations=20_000,
+                                 batch_size=10)
+        del kv
+    return result
+
+
+@benchmark("key_value_increment_int_partitioned")
+def key_value_increment_int_partitioned() -> BenchmarkResult:
+    with tempfile.TemporaryDirectory() as directory:
+        kv = PartitionedFileStorageKeyIntValue(directory)
+        keys = [f"guild.{850000000000000000 + user % 10}.roulette.{840000000000000000 + user}" for user in range(1000)]
+        result = time_operations("key_value_increment_int_partitioned",
+                                 lambda i: kv.increment_int(keys[i % 1000], 1),
+                                 iterations=20_000,
+                                 batch_size=10)
+        result.extra["open_partitions"] = kv.open_partitions_count()
+        kv.close()
+    return result
+
+
+@benchmark("key_value_bulk_import_export")
+def key_value_bulk_import_export(keys_count: int = 200_000, chunk_size: int = 10_000) -> BenchmarkResult:
+    """
+    NDJSON import of keys_count keys into a partitioned storage (latency per chunk of chunk_size keys),
+    export of them back, and one key at a time put_int for comparison.
+    """
+    lines = [f'{{"key": "guild.{850000000000000000 + user % 10}.roulette.{840000000000000000 + user}", '
+             f'"value": {user % 100}}}\n' for user in range(keys_count)]
+    with tempfile.TemporaryDirectory() as directory:
+        kv = PartitionedFileStorageKeyIntValue(directory)
+        result = time_operations("key_value_bulk_import_export",
+                                 lambda i: import_ndjson(kv, lines[i * chunk_size:(i + 1) * chunk_size]),
+                                 iterations=keys_count // chunk_size)
+        result.operations_count = keys_count
+
+        started_at = perf_counter_ns()
+        exported_count = export_ndjson(kv, io.StringIO())
+        result.extra["export_keys_per_s"] = round(exported_count * 1e9 / (perf_counter_ns() - started_at))
+
+        started_at = perf_counter_ns()
+        for user in range(chunk_size):
+            kv.put_int(f"single.{user}", user)
+        result.extra["put_int_keys_per_s"] = round(chunk_size * 1e9 / (perf_counter_ns() - started_at))
+        kv.close()
+    return result
+
+
+@benchmark("leaderboard_1m")
+def leaderboard_1m(players_count: int = 1_000_000) -> BenchmarkResult:
+    """
+    Score updates interleaved with rank and top 10 queries on a leaderboard of a million players.
+    """
+    kv = InMemoryKeyIntValue()
+    for player in range(players_count):
+        kv.put_int(f"roulette.{840000000000000000 + player}", player % 1000)
+    started_at = perf_counter_ns()
+    leaderboard = Leaderboard(kv, "roulette.")
+    rebuild_in_ms = (perf_counter_ns() - started_at) // 1_000_000
+
+    ids = [str(840000000000000000 + player) for player in range(0, players_count, 97)]
+
+    def operation(i: int) -> None:
+        id = ids[i % len(ids)]
+        leaderboard.increment_int(f"roulette.{id}", 1)
+        leaderboard.rank(id)
+        leaderboard.top(10)
+
+    result = time_operations("leaderboard_1m", operation, iterations=20_000, batch_size=10)
+    result.extra["rebuild_ms"] = rebuild_in_ms
+    return result
+
+
+def import_time_in_ms(module: str) -> float:
+    completed = subprocess.run([sys.executable, "-c",
+                                f"from time import perf_counter; started_at = perf_counter(); import {module}; "
+                                f"print((perf_counter() - started_at) * 1000)"],
+                               stdout=subprocess.PIPE, check=True)
+    return round(float(completed.stdout), 1)
+
+
+@benchmark("entity_cache_memory_per_guild")
+def entity_cache_memory_per_guild(guilds_count: int = 1000,
+                                  channels_count: int = 20,
+                                  members_count: int = 100) -> BenchmarkResult:
+    """
+    Memory held by the entity cache per guild of channels_count channels and members_count active members,
+    and the cost of caching the guild and member of a MESSAGE_CREATE.
+    """
+    entity_cache = EntityCache(max_guilds=guilds_count)
+    guilds = [{
+        "id": str(850000000000000000 + guild),
+        "name": f"guild {guild}",
+        "member_count": members_count,
+        "channels": [{"id": str(860000000000000000 + guild * channels_count + channel), "type": 0,
+                      "name": f"channel-{channel}"} for channel in range(channels_count)],
+        "members": [{"user": {"id": str(840000000000000000 + member), "username": f"player {member}"},
+                     "nick": None, "roles": ["870000000000000000"]} for member in range(members_count)]
+    } for guild in range(guilds_count)]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for guild in guilds:
+        entity_cache.update("GUILD_CREATE", guild)
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    messages = [json.loads(MESSAGE_CREATE_FRAME)["d"] for _ in range(100)]
+    for (i, message) in enumerate(messages):
+        message["guild_id"] = guilds[i % guilds_count]["id"]
+        message["author"]["id"] = str(840000000000000000 + i % members_count)
+    result = time_operations("entity_cache_memory_per_guild",
+                             lambda i: entity_cache.update("MESSAGE_CREATE", messages[i % 100]),
+                             iterations=100_000,
+                             batch_size=10)
+    result.extra["bytes_per_guild"] = held // guilds_count
+    result.extra["bytes_per_member"] = held // (guilds_count * members_count)
+    return result
+
+
+@benchmark("roulette_pull")
+def roulette_pull() -> BenchmarkResult:
+    """
+    Trigger pulls served from the outcome buffer, refilled every OUTCOMES_BATCH_SIZE pulls.
+    """
+    stream = OutcomeStream(seed=42)
+    result = time_operations("roulette_pull", lambda i: stream.pull(), iterations=1_000_000, batch_size=100)
+    result.extra["monte_carlo_10m_plays_s"] = simulate(10_000_000, players=10_000, seed=42)["elapsed_s"]
+    return result
+
+
+@benchmark("startup_time_to_ready")
+def startup_time_to_ready(runs: int = 10, rest_latency_in_s: float = 0.1) -> BenchmarkResult:
+    """
+    Time from client creation to READY against a fake Discord answering REST calls in rest_latency_in_s,
+    with a warm gateway URL cache (latencies) and with a cold one (cold_p50_ms).
+    Import time of discord.bot is measured in a fresh interpreter.
+    """
+    fake_discord = FakeDiscord(rest_latency_in_s=rest_latency_in_s)
+    fake_discord.start()
+
+    def time_to_ready(gateway_url_cache: GatewayUrlCache) -> int:
+        started_at = perf_counter_ns()
+        discord_client = DiscordClient(token="benchmark", base_url=fake_discord.api_base_url,
+                                       gateway_url_cache=gateway_url_cache)
+        greenlets = discord_client.start()
+        discord_client.connected_to_gateway_event.wait(timeout=10)
+        elapsed = perf_counter_ns() - started_at
+        gevent.killall(greenlets)
+        discord_client.websocket.ws.close()
+        return elapsed
+
+    with tempfile.TemporaryDirectory() as directory:
+        cold = sorted(time_to_ready(GatewayUrlCache(os.path.join(directory, f"cold-{run}.json"))) for run in range(runs))
+        warm_cache = GatewayUrlCache(os.path.join(directory, "warm.json"))
+        time_to_ready(warm_cache)
+        warm = [time_to_ready(warm_cache) for run in range(runs)]
+    fake_discord.stop()
+
+    return BenchmarkResult("startup_time_to_ready", warm, sum(warm), runs,
+                           extra={"cold_p50_ms": round(cold[runs // 2] / 1e6, 1),
+                                  "import_ms": import_time_in_ms("discord.bot")})
+
+
+@benchmark("replay_dispatch")
+def replay_dispatch(frames_count: int = 50_000) -> BenchmarkResult:
+    """
+    Parse and dispatch throughput of a recorded traffic log replayed as fast as possible,
+    one frame out of two being a command.
+    """
+    from discord.traffic import TrafficRecorder, replay
+
+    with tempfile.TemporaryDirectory() as directory:
+        log_file_name = os.path.join(directory, "traffic.log")
+        recorder = TrafficRecorder(log_file_name)
+        for i in range(frames_count):
+            recorder.record(MESSAGE_CREATE_FRAME.replace('"870000000000000000"', f'"{870000000000000000 + i}"')
+                            .replace('"!roulette"', '"!roulette"' if i % 2 else '"just chatting"'))
+        recorder.close()
+        log_size = os.path.getsize(log_file_name)
+
+        discord_client = DiscordClient(token="benchmark")
+        discord_client.register_callback("!roulette", Pinger(), Pinger.noop)
+        started_at = perf_counter_ns()
+        replayed = replay(discord_client, log_file_name, speed=0)
+        elapsed = perf_counter_ns() - started_at
+
+    return BenchmarkResult("replay_dispatch", [], elapsed, replayed,
+                           extra={"log_bytes_per_frame": log_size // frames_count})
+
+
+@benchmark("command_round_trip")
+def command_round_trip(messages_count: int = 1000, events_per_s: float = 200) -> BenchmarkResult:
+    """
+    Full command path: MESSAGE_CREATE frame sent by a local fake Discord, reply posted back to its REST stub.
+    """
+    posted_at = {}
+    all_posted = Event()
+
+    class RoundTripFakeDiscord(FakeDiscord):
+        def message_posted(self, message: dict) -> None:
+            super().message_posted(message)
+            posted_at[message["message_reference"]["message_id"]] = perf_counter_ns()
+            if len(posted_at) == messages_count:
+                all_posted.set()
+
+    fake_discord = RoundTripFakeDiscord()
+    fake_discord.start()
+    discord_client = DiscordClient(token="benchmark", base_url=fake_discord.api_base_url)
+    discord_client.register_callback("!ping", Pinger(), Pinger.pong)
+    greenlets = discord_client.start()
+    discord_client.connected_to_gateway_event.wait(timeout=10)
+
+    dispatched_at = {}
+    interval_in_ns = int(1e9 / events_per_s)
+    started_at = perf_counter_ns()
+    for i in range(messages_count):
+        sent_at = perf_counter_ns()
+        dispatched_at[fake_discord.dispatch_message_create("!ping", user_id=str(i))] = sent_at
+        gevent.sleep(max(started_at + (i + 1) * interval_in_ns - perf_counter_ns(), 0) / 1e9)
+    all_posted.wait(timeout=30)
+    elapsed = max(posted_at.values(), default=started_at) - started_at
+
+    gevent.killall(greenlets)
+    fake_discord.stop()
+
+    latencies = [posted_at[message_id] - sent_at
+                 for (message_id, sent_at) in dispatched_at.items() if message_id in posted_at]
+    return BenchmarkResult("command_round_trip", latencies, elapsed, len(latencies),
+                           extra={"lost": messages_count - len(latencies)})
+
+
+def start_fake_discord_process(events_per_s: float, duration_in_s: float, content: str) -> tuple:
+    """
+    Starts a fake Discord in its own process, so that it does not share the runtime of the client under test.
+    :return: the process and the API base URL, once it accepts connections
+    """
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    process = subprocess.Popen([sys.executable, "-m", "discord.fake_discord", "--port", str(port),
+                                "--events-per-s", str(events_per_s), "--duration", str(duration_in_s),
+                                "--content", content],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    for attempt in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            break
+        except OSError:
+            sleep(0.05)
+    return process, f"http://127.0.0.1:{port}/api"
+
+
+def backend_throughput(backend: str, events_per_s: float = 1000, duration_in_s: float = 5) -> BenchmarkResult:
+    """
+    Same synthetic load replayed against the gevent and the asyncio clients.
+    Throughput is the rate of replies received by the fake Discord, cpu_s the CPU time spent by the client process.
+    """
+    fake_discord, base_url = start_fake_discord_process(events_per_s, duration_in_s, "!ping")
+
+    if backend == "asyncio":
+        from discord.aio_client import AsyncDiscordClient
+        discord_client = AsyncDiscordClient(token="benchmark", base_url=base_url)
+        discord_client.register_callback("!ping", Pinger(), Pinger.pong)
+
+        async def run_until_disconnected():
+            try:
+                await discord_client.start()
+            except DiscordGatewayConnectionError:
+                pass
+
+        asyncio.run(run_until_disconnected())
+    else:
+        discord_client = DiscordClient(token="benchmark", base_url=base_url)
+        discord_client.register_callback("!ping", Pinger(), Pinger.pong)
+        greenlets = discord_client.start()
+        fake_discord.wait()
+        gevent.killall(greenlets)
+
+    stats = json.loads(fake_discord.communicate()[0].decode("utf-8").splitlines()[-1])
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return BenchmarkResult(f"backend_throughput_{backend}", [], int(stats["elapsed_s"] * 1e9), stats["posted"],
+                           extra={"lost": stats["dispatched"] - stats["posted"],
+                                  "cpu_s": round(usage.ru_utime + usage.ru_stime, 3)})
+
+
+@benchmark("backend_throughput_gevent")
+def backend_throughput_gevent() -> BenchmarkResult:
+    return backend_throughput("gevent")
+
+
+@benchmark("backend_throughput_asyncio")
+def backend_throughput_asyncio() -> BenchmarkResult:
+    return backend_throughput("asyncio")
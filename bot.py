@@ -1,41 +1,120 @@
-from gevent import monkey
-monkey.patch_all()
-
 import os
+
+BACKEND_ENVIRONMENT_VARIABLE_NAME = "DISCORD_ROULETTE_BACKEND"
+BACKEND = os.environ.get(BACKEND_ENVIRONMENT_VARIABLE_NAME, "gevent")
+
+if BACKEND == "gevent":
+    from gevent import monkey
+    monkey.patch_all()
+
 import logging
-from gevent import sleep
-from random import randint
+import signal
+import sys
+from datetime import datetime
+from typing import Optional
 from dotenv import load_dotenv
 from discord import Bot, Message, User
+from discord.discord_client import DISCORD_API_BASE_URL
+from discord.dispatch import USER_LANES
+from discord.leaderboard import Leaderboard
+from discord.profiling import GreenletProfiler
+from roulette import DEATH_POINTS_PENALTY, WIN_POINTS_REWARD, OutcomeStream, derive_seed
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(name)s %(levelname)s %(message)s')
 logger = logging.getLogger(__name__)
 
 ONE_HOUR = 60 * 60
-BULLETS_COUNT = 6
-WIN_POINTS_REWARD = 1
-DEATH_POINTS_PENALTY = 3
-PLAYER_POINTS_FORMAT = "roulette.{user_id}"
+SUSPENSE_DELAY_IN_S = 3
+PLAYER_POINTS_PREFIX = "roulette."
+PLAYER_POINTS_FORMAT = PLAYER_POINTS_PREFIX + "{user_id}"
+OUTCOME_BATCHES_FORMAT = "outcomes.{stream_seed}.batches"
+LEADERBOARD_SIZE = 10
 BOT_TOKEN_ENVIRONMENT_VARIABLE_NAME = "DISCORD_ROULETTE_BOT_TOKEN"
+API_BASE_URL_ENVIRONMENT_VARIABLE_NAME = "DISCORD_ROULETTE_API_BASE_URL"
+PROFILING_ENVIRONMENT_VARIABLE_NAME = "DISCORD_ROULETTE_PROFILING_BLOCKING_THRESHOLD"
+RECORD_TRAFFIC_ENVIRONMENT_VARIABLE_NAME = "DISCORD_ROULETTE_RECORD_TRAFFIC"
+HEALTH_PORT_ENVIRONMENT_VARIABLE_NAME = "DISCORD_ROULETTE_HEALTH_PORT"
+SEED_ENVIRONMENT_VARIABLE_NAME = "DISCORD_ROULETTE_SEED"
+PUBLIC_KEY_ENVIRONMENT_VARIABLE_NAME = "DISCORD_ROULETTE_PUBLIC_KEY"
+INTERACTIONS_PORT_ENVIRONMENT_VARIABLE_NAME = "DISCORD_ROULETTE_INTERACTIONS_PORT"
+LEGACY_GUILD_ENVIRONMENT_VARIABLE_NAME = "DISCORD_ROULETTE_LEGACY_GUILD_ID"
+SNAPSHOTS_DIRECTORY = "snapshots"
 
 
 class RouletteBot(Bot):
+    def __init__(self, token: str, seed: Optional[int] = None, **kwargs):
+        """
+        :param seed: makes trigger pulls reproducible, each bot drawing from its own stream derived from it.
+        The batches count of a seeded stream is stored each time it draws a batch, a restarted bot resumes its stream
+        at the next batch instead of replaying it.
+        """
+        super().__init__(token, **kwargs)
+        self.leaderboards = {}
+        self.outcomes = OutcomeStream(seed=derive_seed(seed, self.storage_name(token)))
+        self.outcome_batches_key = None
+        if seed is not None:
+            self.outcome_batches_key = OUTCOME_BATCHES_FORMAT.format(stream_seed=self.outcomes.seed)
+            self.outcomes.resume(self.kv.get_int(self.outcome_batches_key))
+        logger.info(f"trigger pulls drawn from stream {self.outcomes.seed}, from pull {self.outcomes.pulls_count}")
+
     @Bot.register_command("!roulette", cooldown=ONE_HOUR)
     def handle_roulette_command(self, message: Message):
         message.respond(f"😣🔫 {message.author.mention()} places the muzzle against their head...")
-        sleep(3)
-        if randint(0, BULLETS_COUNT) == 0:
-            self.kv.decrement_int(self.__player_score_key(message.author), DEATH_POINTS_PENALTY)
+        self.schedule(SUSPENSE_DELAY_IN_S, self.__pull_the_trigger, message)
+
+    def __pull_the_trigger(self, message: Message):
+        batches_count = self.outcomes.batches_count
+        chamber = self.outcomes.pull()
+        if self.outcome_batches_key is not None and self.outcomes.batches_count != batches_count:
+            self.kv.put_int(self.outcome_batches_key, self.outcomes.batches_count)
+        logger.debug(f"pull {self.outcomes.pulls_count} of stream {self.outcomes.seed}: chamber {chamber}")
+        if chamber == 0:
+            self.__leaderboard(message).decrement_int(self.__player_score_key(message.author), DEATH_POINTS_PENALTY)
             message.respond(f"☠ {message.author.mention()} dies and loses {DEATH_POINTS_PENALTY}!")
         else:
-            self.kv.increment_int(self.__player_score_key(message.author), WIN_POINTS_REWARD)
+            self.__leaderboard(message).increment_int(self.__player_score_key(message.author), WIN_POINTS_REWARD)
             message.respond(f"🥵 {message.author.mention()} lives and wins **{WIN_POINTS_REWARD} points**!")
 
     @Bot.register_command("!points")
     def handle_points_command(self, message: Message):
-        points = self.kv.get_int(self.__player_score_key(message.author), default=0)
+        points = self.__leaderboard(message).get_int(self.__player_score_key(message.author), default=0)
         message.respond(f"{message.author.mention()}, you have **{points} points**!")
 
+    @Bot.register_command("!top")
+    def handle_top_command(self, message: Message):
+        top = self.__leaderboard(message).top(LEADERBOARD_SIZE)
+        if not top:
+            message.respond("Nobody has played yet!")
+            return
+        lines = [f"**#{rank}** <@{user_id}> with **{points} points**" for (rank, user_id, points) in top]
+        message.respond("\n".join(["🏆 Top players:"] + lines))
+
+    @Bot.register_command("!rank")
+    def handle_rank_command(self, message: Message):
+        leaderboard = self.__leaderboard(message)
+        rank = leaderboard.rank(message.author.id)
+        if rank is None:
+            message.respond(f"{message.author.mention()}, you are not ranked yet: play `!roulette` first!")
+            return
+        points = leaderboard.get_int(self.__player_score_key(message.author), default=0)
+        message.respond(f"{message.author.mention()}, you are ranked **#{rank}** of {len(leaderboard)} players "
+                        f"with **{points} points**!")
+
+    def purgeable(self, key: str) -> bool:
+        # a player at exactly 0 points is still ranked
+        return not self.split_guild_key(key)[1].startswith(PLAYER_POINTS_PREFIX)
+
+    def __leaderboard(self, message: Message) -> Leaderboard:
+        """
+        Points and ranks of the guild the message was sent in, loaded on the first command of the guild
+        from the single partition holding the keys of the guild
+        """
+        leaderboard = self.leaderboards.get(message.guild_id)
+        if leaderboard is None:
+            leaderboard = Leaderboard(self.guild_kv(message.guild_id), PLAYER_POINTS_PREFIX)
+            self.leaderboards[message.guild_id] = leaderboard
+        return leaderboard
+
     @staticmethod
     def __player_score_key(user: User):
         return PLAYER_POINTS_FORMAT.format(user_id=user.id)
@@ -50,5 +129,56 @@ if __name__ == "__main__":
         logger.error(f"Token is not defined. Please set '{BOT_TOKEN_ENVIRONMENT_VARIABLE_NAME}' environment variable")
         exit(1)
 
-    bot = RouletteBot(bot_token)
-    RouletteBot.run_forever()
+    public_key = os.environ.get(PUBLIC_KEY_ENVIRONMENT_VARIABLE_NAME)
+    if public_key and BACKEND != "gevent":
+        logger.error(f"Slash command interactions are only served by the gevent backend: "
+                     f"unset '{PUBLIC_KEY_ENVIRONMENT_VARIABLE_NAME}' or '{BACKEND_ENVIRONMENT_VARIABLE_NAME}'")
+        exit(1)
+
+    api_base_url = os.environ.get(API_BASE_URL_ENVIRONMENT_VARIABLE_NAME, DISCORD_API_BASE_URL)
+
+    profiling_blocking_threshold = os.environ.get(PROFILING_ENVIRONMENT_VARIABLE_NAME)
+    if profiling_blocking_threshold and BACKEND == "gevent":
+        profiler = GreenletProfiler(blocking_threshold_in_s=float(profiling_blocking_threshold))
+        profiler.start()
+        profiler.install_signal_handler()
+        logger.info(f"Profiling enabled: send SIGUSR1 to process {os.getpid()} to dump CPU time per task")
+
+    # the commands of a player are handled in order, different players are handled concurrently
+    seed = os.environ.get(SEED_ENVIRONMENT_VARIABLE_NAME)
+    bot = RouletteBot(bot_token, seed=int(seed) if seed else None,
+                      base_url=api_base_url, backend=BACKEND, ordering=USER_LANES,
+                      legacy_guild_id=os.environ.get(LEGACY_GUILD_ENVIRONMENT_VARIABLE_NAME))
+
+    record_traffic_file_name = os.environ.get(RECORD_TRAFFIC_ENVIRONMENT_VARIABLE_NAME)
+    if record_traffic_file_name:
+        from discord.traffic import TrafficRecorder
+        bot.discord_client.recorder = TrafficRecorder(record_traffic_file_name)
+        logger.info(f"Recording gateway traffic to '{record_traffic_file_name}'")
+
+    # the platform stops the bot with SIGTERM: exiting unwinds the loops below, so that the recorder is closed
+    signal.signal(signal.SIGTERM, lambda signal_number, frame: sys.exit(0))
+
+    if BACKEND == "gevent":
+        import gevent
+        gevent.signal_handler(signal.SIGUSR2, lambda: bot.snapshot_storage(
+            os.path.join(SNAPSHOTS_DIRECTORY, datetime.now().strftime("%Y%m%d-%H%M%S"))))
+        logger.info(f"Send SIGUSR2 to process {os.getpid()} to snapshot the storage into '{SNAPSHOTS_DIRECTORY}'")
+
+        health_port = os.environ.get(HEALTH_PORT_ENVIRONMENT_VARIABLE_NAME)
+        if health_port:
+            from discord.health import HealthServer
+            HealthServer(port=int(health_port)).start()
+
+    try:
+        if public_key:
+            interactions_port = os.environ.get(INTERACTIONS_PORT_ENVIRONMENT_VARIABLE_NAME)
+            logger.info("Receiving commands as slash command interactions, without connecting to the gateway")
+            bot.serve_interactions(public_key, port=int(interactions_port) if interactions_port else None)
+        else:
+            RouletteBot.run_forever()
+    finally:
+        if bot.discord_client.recorder is not None:
+            # the last frames are still buffered
+            bot.discord_client.recorder.close()
+            logger.info(f"Recorded {bot.discord_client.recorder.frames_count} gateway frames")
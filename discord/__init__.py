@@ -1,7 +1,27 @@
 import logging
+from importlib import import_module
 
-from .bot import Bot
-from .user import User
-from .discord_client import Message
+logging.getLogger(__name__).addHandler(logging.NullHandler())
 
-logging.getLogger(__name__).addHandler(logging.NullHandler())
\ No newline at end of file
+__all__ = ["Bot", "Message", "User"]
+
+# Public names are imported on first access (PEP 562): importing a light module such as discord.user
+# does not pull the Discord client, its HTTP and websocket libraries and the storage in.
+_LAZY_ATTRIBUTES = {
+    "Bot": ".bot",
+    "Message": ".discord_client",
+    "User": ".user",
+}
+
+
+def __getattr__(name: str):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,261 @@
+"""
+asyncio implementation of the Discord client, for services that cannot monkey patch their process with gevent.
+
+It shares gateway operations, the callback registry and reply payloads with the gevent DiscordClient,
+so that commands registered with Bot.register_command run on either runtime.
+REST calls go through a pooled aiohttp session and the gateway through aiohttp's native websocket.
+"""
+import asyncio
+import inspect
+import logging
+from random import random
+from time import monotonic
+from typing import Awaitable, Callable, Optional
+
+import aiohttp
+
+from .callback_holder import Callback
+from .dispatch import Lanes
+from .entities import EntityCache
+from .discord_client import BaseDiscordClient, DiscordGatewayCommand, DiscordGatewayConnectionError, \
+    DiscordGatewayDispatch, DiscordGatewayHeartbeat, DiscordGatewayHello, DiscordGatewayIdentify, DiscordGatewayOp, \
+    Message, DISCORD_API_BASE_URL, DISCORD_API_VERSION, DISCORD_CREATE_MESSAGE_PATH, DISCORD_GATEWAY_API_VERSION, \
+    DISCORD_GATEWAY_PATH, DISCORD_REST_CONNECTIONS_LIMIT, GatewayUrlCache
+
+logger = logging.getLogger(__name__)
+
+
+async def _call(function: Callable, *args) -> None:
+    result = function(*args)
+    if inspect.isawaitable(result):
+        await result
+
+
+class TaskSet:
+    """
+    Keeps the tasks it creates until they are done: the event loop only holds weak references to tasks,
+    a task nothing else references may be garbage collected before it completes.
+    """
+
+    def __init__(self):
+        self._tasks = set()
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def create_task(self, coroutine: Awaitable) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+
+class AsyncScheduler:
+    """
+    Scheduler backed by the running event loop's timer queue.
+    Scheduled functions may be plain functions or coroutine functions.
+    """
+
+    def __init__(self):
+        self.tasks = TaskSet()
+
+    def schedule(self,
+                 delay_in_s: float,
+                 function: Callable,
+                 *args) -> asyncio.TimerHandle:
+        return asyncio.get_running_loop().call_later(max(delay_in_s, 0),
+                                                     lambda: self.tasks.create_task(_call(function, *args)))
+
+
+class AsyncLanes(Lanes):
+    """
+    Lanes run by tasks of the running event loop. Submitted functions may be coroutine functions.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.tasks = TaskSet()
+
+    def _start_worker(self, lane) -> asyncio.Task:
+        return self.tasks.create_task(self._drain_async(lane))
+
+    async def _drain_async(self, lane) -> None:
+        task = self._next(lane)
+        while task is not None:
+            function, args = task
+            try:
+                await _call(function, *args)
+            except Exception:
+                logger.exception(f"{getattr(function, '__name__', function)} failed in lane {lane}")
+            task = self._next(lane)
+
+
+class AsyncDiscordClient(BaseDiscordClient):
+
+    def __init__(self,
+                 token: str,
+                 api_version=DISCORD_API_VERSION,
+                 gateway_api_version=DISCORD_GATEWAY_API_VERSION,
+                 scheduler: Optional[AsyncScheduler] = None,
+                 base_url: str = DISCORD_API_BASE_URL,
+                 gateway_url: Optional[str] = None,
+                 connections_limit: int = DISCORD_REST_CONNECTIONS_LIMIT,
+                 gateway_url_cache: Optional[GatewayUrlCache] = None,
+                 ordering: Optional[str] = None,
+                 entity_cache: Optional[EntityCache] = None):
+
+        # asyncio primitives are bound to the loop running the client, they are created by start()
+        self.connected_to_gateway_event: Optional[asyncio.Event] = None
+        self.heartbeat_event: Optional[asyncio.Event] = None
+        self.event_queue: Optional[asyncio.Queue] = None
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.websocket: Optional[aiohttp.ClientWebSocketResponse] = None
+        self.lanes = AsyncLanes() if ordering else None
+        # handlers, replies and blocking calls run in tasks that nothing awaits
+        self.tasks = TaskSet()
+
+        super().__init__(token,
+                         api_version=api_version,
+                         gateway_api_version=gateway_api_version,
+                         scheduler=scheduler or AsyncScheduler(),
+                         base_url=base_url,
+                         gateway_url=gateway_url,
+                         connections_limit=connections_limit,
+                         gateway_url_cache=gateway_url_cache,
+                         ordering=ordering,
+                         entity_cache=entity_cache)
+
+    async def gateway_base_url(self) -> str:
+        gateway_url = self.known_gateway_url()
+        if gateway_url is None:
+            async with self.session.get(self.api_url(ressource_path=DISCORD_GATEWAY_PATH)) as result:
+                gateway_url = (await result.json())["url"]
+            self.gateway_url_fetched(gateway_url)
+        return gateway_url + self.gateway_query
+
+    async def receive(self) -> str:
+        received = await self.websocket.receive()
+        if received.type != aiohttp.WSMsgType.TEXT:
+            raise DiscordGatewayConnectionError(f"Gateway connection lost: {received.type.name} {received.data}")
+        logger.info(f"< received message {received.data}")
+        return received.data
+
+    async def send(self, command: DiscordGatewayCommand) -> None:
+        logger.info(f"> sending command {command}")
+        await self.websocket.send_str(str(command))
+
+    async def connect_to_gateway(self) -> None:
+
+        uri = await self.gateway_base_url()
+        try:
+            self.websocket = await self.session.ws_connect(uri, max_msg_size=0)
+        except Exception:
+            self.gateway_connection_failed()
+            raise
+
+        hello = DiscordGatewayHello.expect(await self.receive())
+        self.heartbeat_interval_in_ms = hello.heartbeat_interval
+
+        # starting heartbeat loop
+        heartbeat = self.tasks.create_task(self.heartbeat(interval=hello.heartbeat_interval))
+        self.heartbeat_on()
+
+        await self.send(DiscordGatewayIdentify.build(self.token, self.intents))
+
+        ready = DiscordGatewayDispatch.expect(await self.receive())
+        self.cache_entities(ready)
+
+        # Signals that connection is OK
+        self.connected_to_gateway_event.set()
+        self.ready()
+
+        await heartbeat
+
+    def heartbeat_on(self) -> None:
+        self.last_heartbeat_ack_at = monotonic()
+        self.heartbeat_event.set()
+
+    def heartbeat_off(self) -> None:
+        self.heartbeat_event.clear()
+
+    async def heartbeat(self,
+                        interval: int) -> None:
+        while True:
+            await self.heartbeat_event.wait()
+            await asyncio.sleep((interval * random()) / 1000)
+            logger.info("heartbeat!")
+            await self.send(DiscordGatewayHeartbeat.build())
+            self.heartbeat_off()
+
+    async def queue_events(self) -> None:
+        await self.connected_to_gateway_event.wait()
+        logger.info("queuing events...")
+        while True:
+            frame = await self.receive()
+            if self.recorder is not None:
+                self.recorder.record(frame)
+            event = DiscordGatewayOp.receive(frame, self.dispatched_types)
+            if event is not None:
+                self.event_queue.put_nowait(event)
+
+    async def handle_events(self) -> None:
+        await self.connected_to_gateway_event.wait()
+        logger.info("...unqueuing events")
+        while True:
+            event = await self.event_queue.get()
+            try:
+                event.handle_event(self)
+            except Exception:
+                logger.exception(f"failed to handle event {event!r}")
+
+    def fire(self,
+             callback: Callback,
+             message: Message,
+             user_id: str) -> Optional[asyncio.Task]:
+        if callback.accept(user_id):
+            if self.lanes is not None:
+                return self.lanes.submit(self.lane_of(message), callback.callback_function, callback.caller, message)
+            return self.tasks.create_task(_call(callback.callback_function, callback.caller, message))
+
+    def respond_with(self,
+                     response: str,
+                     message: Message) -> asyncio.Task:
+
+        async def respond(channel_id: str, response_message: dict):
+            logger.debug(f"respond message=${response_message}")
+            async with self.session.post(
+                    self.api_url(ressource_path=DISCORD_CREATE_MESSAGE_PATH.format(channel_id=channel_id)),
+                    json=response_message) as result:
+                content = await result.text()
+                logger.debug(f"respond result={result.status}, reason={result.reason}, content={content}")
+
+        return self.tasks.create_task(respond(message.channel_id, self.reply(response, message)))
+
+    def call_blocking(self,
+                      function: Callable,
+                      args: tuple,
+                      callback: Callable) -> asyncio.Task:
+        loop = asyncio.get_running_loop()
+
+        async def call():
+            return callback(await loop.run_in_executor(None, function, *args))
+
+        return self.tasks.create_task(call())
+
+    async def start(self) -> None:
+        self.connected_to_gateway_event = asyncio.Event()
+        self.heartbeat_event = asyncio.Event()
+        self.event_queue = asyncio.Queue()
+        self.session = aiohttp.ClientSession(headers=self.header,
+                                             connector=aiohttp.TCPConnector(limit=self.connections_limit))
+        try:
+            await asyncio.gather(
+                self.connect_to_gateway(),
+                self.queue_events(),
+                self.handle_events()
+            )
+        finally:
+            await self.session.close()
+
+    def run(self) -> None:
+        asyncio.run(self.start())
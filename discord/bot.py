@@ -1,9 +1,14 @@
+import hashlib
 import logging
+import os
+from functools import wraps
+from typing import Callable, List, Optional, Tuple
 
-import gevent
-
-from .discord_client import DiscordClient, Message
-from .key_value import FileStorageKeyIntValue
+from .discord_client import DiscordClient, GatewayUrlCache, Message, DISCORD_API_BASE_URL, \
+    GATEWAY_URL_CACHE_TTL_IN_S
+from .entities import EntityCache
+from .key_value import CompactionReport, KeyIntValue, PartitionedFileStorageKeyIntValue, ScopedKeyIntValue
+from .scheduler import ScheduledTask
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +17,20 @@ bots = {}
 
 registered_commands = {}
 
+GEVENT_BACKEND = "gevent"
+ASYNCIO_BACKEND = "asyncio"
+
+PROCESS_EXECUTOR = "process"
+
+DEFAULT_STORAGE_DIRECTORY = "storage"
+# single storage file of the versions that had neither partitions nor guilds
+LEGACY_STORAGE_FILE_NAME = "key-value.db"
+LEGACY_SCOPE = "legacy"
+GUILD_SCOPE_PREFIX = "guild."
+DIRECT_MESSAGES_SCOPE = "dm"
+COMPACTION_INTERVAL_IN_S = 24 * 60 * 60
+GATEWAY_URL_CACHE_FILE_NAME = "gateway-url.json"
+
 
 class CommandCallback:
     def __init__(self, callback_method, cooldown_in_s: int):
@@ -20,17 +39,159 @@ class CommandCallback:
 
 
 class Bot:
-    def __init__(self, token: str):
+    def __init__(self,
+                 token: str,
+                 base_url: str = DISCORD_API_BASE_URL,
+                 backend: str = GEVENT_BACKEND,
+                 storage_directory: str = DEFAULT_STORAGE_DIRECTORY,
+                 compaction_interval_in_s: Optional[float] = COMPACTION_INTERVAL_IN_S,
+                 gateway_url_ttl_in_s: Optional[float] = GATEWAY_URL_CACHE_TTL_IN_S,
+                 ordering: Optional[str] = None,
+                 cache_entities: bool = True,
+                 legacy_storage_file_name: Optional[str] = LEGACY_STORAGE_FILE_NAME,
+                 legacy_guild_id: Optional[str] = None):
+        """
+        :param ordering: discord.dispatch.USER_LANES or CHANNEL_LANES to handle the commands of a user
+        (or of a channel) one after the other
+        :param cache_entities: keeps the guilds, channels and members sent by the gateway,
+        for handlers to read them from messages (see discord.entities)
+        :param legacy_storage_file_name: storage file of previous versions, migrated on the first start of a bot
+        whose storage is still empty
+        :param legacy_guild_id: guild the keys of the legacy storage are migrated to, a scope named LEGACY_SCOPE
+        by default
+        """
         self.token = token
-        self.kv = FileStorageKeyIntValue()
-        self.discord_client = DiscordClient(token=token)
+        # partitions are opened by the first command that needs them
+        self.kv = PartitionedFileStorageKeyIntValue(os.path.join(storage_directory, self.storage_name(token)))
+        self.guild_kvs = {}
+        if legacy_storage_file_name and os.path.exists(legacy_storage_file_name) \
+                and not self.kv.existing_partitions_count():
+            from .storage_admin import migrate_legacy_storage
+            migrate_legacy_storage(legacy_storage_file_name, self.guild_kv(legacy_guild_id or LEGACY_SCOPE))
+        self.compaction_interval_in_s = compaction_interval_in_s
+        self.compaction_scheduled = False
+        # set once the bot receives its commands as interactions instead of through the gateway
+        self.interactions_server = None
+        self.last_compaction_reports: List[CompactionReport] = []
+        gateway_url_cache = GatewayUrlCache(os.path.join(storage_directory, GATEWAY_URL_CACHE_FILE_NAME),
+                                            ttl_in_s=gateway_url_ttl_in_s) if gateway_url_ttl_in_s else None
+        entity_cache = EntityCache() if cache_entities else None
+        if backend == ASYNCIO_BACKEND:
+            from .aio_client import AsyncDiscordClient
+            self.discord_client = AsyncDiscordClient(token=token, base_url=base_url,
+                                                     gateway_url_cache=gateway_url_cache, ordering=ordering,
+                                                     entity_cache=entity_cache)
+        else:
+            self.discord_client = DiscordClient(token=token, base_url=base_url,
+                                                gateway_url_cache=gateway_url_cache, ordering=ordering,
+                                                entity_cache=entity_cache)
 
         [self.discord_client.register_callback(content, self, callback.callback_method, callback.cooldown_in_s) for
          (content, callback) in registered_commands.items()]
+        if compaction_interval_in_s:
+            self.discord_client.on_ready(self.__schedule_compaction)
         bots[token] = self
 
+    @staticmethod
+    def storage_name(token: str) -> str:
+        """
+        Name of the storage directory of the bot owning token, that does not disclose the token
+        """
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+
+    def guild_kv(self, guild_id: Optional[str]) -> KeyIntValue:
+        """
+        Storage scoped to a guild. Direct messages, that have no guild, share a scope of their own.
+        """
+        scope = guild_id or DIRECT_MESSAGES_SCOPE
+        kv = self.guild_kvs.get(scope)
+        if kv is None:
+            kv = ScopedKeyIntValue(self.kv, f"{GUILD_SCOPE_PREFIX}{scope}.")
+            self.guild_kvs[scope] = kv
+        return kv
+
+    @staticmethod
+    def split_guild_key(key: str) -> Tuple[Optional[str], str]:
+        """
+        :return: the guild id and the key in the guild's scope of a key of the storage,
+        the guild id being None for direct messages
+        """
+        scope, _, guild_key = key[len(GUILD_SCOPE_PREFIX):].partition(".")
+        return (None if scope == DIRECT_MESSAGES_SCOPE else scope), guild_key
+
+    def snapshot_storage(self, snapshot_directory: str) -> None:
+        """
+        Copies the storage of this bot to snapshot_directory while it keeps running
+        """
+        self.kv.snapshot(snapshot_directory)
+        logger.info(f"storage snapshot saved to {snapshot_directory}")
+
+    def purgeable(self, key: str) -> bool:
+        """
+        Whether compaction may delete key when it holds 0, the value missing keys are read as.
+        Keys whose 0 is meaningful (a score that is ranked, for instance) must not be purged.
+        """
+        return True
+
+    def compact_storage(self):
+        """
+        Purges keys holding default values and reorganizes storage files, in a thread: gdbm blocks the whole runtime
+        """
+        return self.discord_client.call_in_thread(self.kv.compact, ("0", self.purgeable), self.__compacted)
+
+    def __compacted(self, reports: List[CompactionReport]) -> None:
+        self.last_compaction_reports = reports
+        logger.info(f"storage compacted: "
+                    f"{sum(report.size_before for report in reports)} -> "
+                    f"{sum(report.size_after for report in reports)} bytes, "
+                    f"{sum(report.keys_before for report in reports)} -> "
+                    f"{sum(report.keys_after for report in reports)} keys in "
+                    f"{sum(report.elapsed_in_s for report in reports):.3f} s")
+
+    def __schedule_compaction(self) -> None:
+        # the gateway is ready again after each reconnection, compaction must only be scheduled once
+        if not self.compaction_scheduled:
+            self.compaction_scheduled = True
+            self.schedule(self.compaction_interval_in_s, self.__compact_periodically)
+
+    def __compact_periodically(self) -> None:
+        self.schedule(self.compaction_interval_in_s, self.__compact_periodically)
+        self.compact_storage()
+
+    def schedule(self, delay_in_s: float, function: Callable, *args) -> ScheduledTask:
+        """
+        Continues a command later without holding a greenlet (or a task) while waiting.
+        function(*args) is called by the client's scheduler once delay_in_s seconds have elapsed.
+        """
+        return self.discord_client.scheduler.schedule(delay_in_s, function, *args)
+
+    def run_in_process(self, handler_name: str, message: Message):
+        """
+        Runs a handler of this bot's class in the shared process pool, then posts its replies on message
+        """
+        from .process_pool import MessageContext, process_pool
+        return self.discord_client.call_blocking(process_pool.run,
+                                                 (self.__class__, handler_name, MessageContext.of(message)),
+                                                 lambda context: context.replay_on(message))
+
     def run(self):
-        gevent.joinall(self.discord_client.start())
+        self.discord_client.run()
+
+    def serve_interactions(self,
+                           public_key: str,
+                           host: str = "0.0.0.0",
+                           port: Optional[int] = None) -> None:
+        """
+        Receives commands as slash command interactions over HTTP instead of the gateway (gevent backend only),
+        see discord.interactions
+        """
+        from .interactions import INTERACTIONS_DEFAULT_PORT, InteractionsServer
+        server = InteractionsServer(self.discord_client, public_key, host=host, port=port or INTERACTIONS_DEFAULT_PORT)
+        self.interactions_server = server
+        server.start()
+        # there is no gateway to get ready, the endpoint is ready to handle commands instead
+        self.discord_client.ready()
+        server.serve_forever()
 
     @staticmethod
     def run_forever():
@@ -38,13 +199,26 @@ class Bot:
         [bot.run() for bot in bots.values()]
 
     @staticmethod
-    def register_command(command_name, cooldown: int = 0):
+    def register_command(command_name, cooldown: int = 0, executor: Optional[str] = None):
+        """
+        Registers the decorated method as the handler of command_name.
+        With executor="process", the handler runs in a worker process: it is given a bare instance of the bot
+        class and a picklable MessageContext, so it must only rely on the message and on CPU work.
+        """
         def decorator(function):
             logger.info(f"I am the decorator of function {function}")
 
-            def wrapper(bot: Bot, message: Message):
-                logger.info(f"Bot {bot} is receiving message {message} related to command {command_name}")
-                return function(bot, message)
+            if executor == PROCESS_EXECUTOR:
+                @wraps(function)
+                def wrapper(bot: Bot, message: Message):
+                    logger.info(f"Bot {bot} is sending message {message} related to command {command_name} "
+                                f"to a worker process")
+                    return bot.run_in_process(function.__name__, message)
+            else:
+                @wraps(function)
+                def wrapper(bot: Bot, message: Message):
+                    logger.info(f"Bot {bot} is receiving message {message} related to command {command_name}")
+                    return function(bot, message)
 
             registered_commands[command_name] = CommandCallback(callback_method=wrapper, cooldown_in_s=cooldown)
             return wrapper
@@ -1,9 +1,11 @@
 import logging
-from typing import Optional, Callable
+from time import monotonic
+from typing import Callable, Iterable, Optional
 
-import gevent
 from gevent import Greenlet
 
+from .profiling import spawn
+
 logger = logging.getLogger(__name__)
 
 
@@ -17,28 +19,43 @@ class Callback:
         self.callback_function = callback_function
         self.rearm_timeout_in_s = rearm_timeout_in_s
         self.disarmed_users = {}
+        self.task_name = f"handler:{self}"
 
     def _disarm_user(self,
                      user_id: str) -> None:
         if user_id and self.rearm_timeout_in_s > 0:
             logger.debug(f"disarming callback {self} for user {user_id} during {self.rearm_timeout_in_s}s")
-            self.disarmed_users[user_id] = gevent.spawn(lambda: gevent.sleep(self.rearm_timeout_in_s))
+            self.disarmed_users[user_id] = monotonic() + self.rearm_timeout_in_s
 
     def _is_user_armed(self,
                        user_id: str) -> bool:
         if not user_id:
             return True
         else:
-            disarmed_user = self.disarmed_users.get(user_id, None)
-            logger.debug(f"is callback {self} for user{user_id} armed ? {(not disarmed_user) or disarmed_user.dead}")
-            return (not disarmed_user) or disarmed_user.dead
+            rearm_deadline = self.disarmed_users.get(user_id, None)
+            if rearm_deadline is not None and rearm_deadline <= monotonic():
+                del self.disarmed_users[user_id]
+                rearm_deadline = None
+            return rearm_deadline is None
+
+    def accept(self,
+               user_id: str = None) -> bool:
+        """
+        Tells whether the callback can be fired for the given user, and starts the user's cooldown if so.
+        This does not depend on the runtime the callback is then called on.
+        """
+        if self._is_user_armed(user_id):
+            self._disarm_user(user_id)
+            return True
+        else:
+            logger.debug(f"callback {self} is cooling down for user {user_id}")
+            return False
 
     def fire(self,
              *args,
              user_id: str = None) -> Optional[Greenlet]:
-        if self._is_user_armed(user_id):
-            self._disarm_user(user_id)
-            return gevent.spawn(self.callback_function, self.caller, *args)
+        if self.accept(user_id):
+            return spawn(self.task_name, self.callback_function, self.caller, *args)
 
     def __str__(self) -> str:
         return f"{self.caller.__class__.__name__}.{self.callback_function.__name__}"
@@ -68,6 +85,9 @@ class CallbackHolder:
         logger.info(f"registered {caller}.{callback_method} to handle {key}")
         self._callback_registry[key] = Callback(caller, callback_method, rearm_timeout_in_s)
 
+    def callbacks(self) -> Iterable[Callback]:
+        return self._callback_registry.values()
+
     def matching_callback(self,
                           key_value: str) -> Optional[Callback]:
         return self._callback_registry.get(key_value, None)
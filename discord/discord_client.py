@@ -3,23 +3,27 @@ from __future__ import annotations
 import copy
 import json
 import logging
+import os
 import sys
+import time
 from collections.abc import Sequence
-from datetime import datetime
+from datetime import datetime, timezone
 from enum import Enum, IntEnum
 from random import random
-from typing import Optional
+from typing import Callable, Container, Optional
 
 import gevent
-import requests
 from gevent import Greenlet
 from gevent.event import Event
 from gevent.queue import Queue
-from pytz import utc
-from ws4py.client.geventclient import WebSocketClient
 
-from .callback_holder import CallbackHolder
-from .user import User
+from .callback_holder import Callback, CallbackHolder
+from .dispatch import CHANNEL_LANES, Lanes, SeenSet, USER_LANES
+from .entities import Channel, EntityCache, Guild, Member
+from .gateway_sender import GatewaySender, HEARTBEAT_PRIORITY, IDENTIFY_PRIORITY
+from .profiling import spawn
+from .scheduler import ScheduledTask, Scheduler, scheduler
+from .user import User, users
 
 logger = logging.getLogger(__name__)
 
@@ -34,8 +38,11 @@ DISCORD_API_BASE_URL = "https://discord.com/api"
 DISCORD_GATEWAY_PATH = "/gateway/bot"
 DISCORD_CURRENT_USER_PATH = "/users/@me"
 DISCORD_CREATE_MESSAGE_PATH = "/channels/{channel_id}/messages"
+DISCORD_INTERACTION_FOLLOW_UP_PATH = "/webhooks/{application_id}/{interaction_token}"
 
 DISCORD_AUTHORIZATION_HEADER = "Bot {token}"
+DISCORD_REST_CONNECTIONS_LIMIT = 100
+GATEWAY_URL_CACHE_TTL_IN_S = 24 * 60 * 60
 DISCORD_USER_AGENT_HEADER = f"DiscordBot ({DISCORD_API_CLIENT_URL}, {DISCORD_API_CLIENT_VERSION})"
 
 
@@ -113,7 +120,26 @@ class DiscordGatewayOpCode(IntEnum):
 class DiscordGatewayEventName(Enum):
     Unknown = None
     Ready = "READY"
+    Resumed = "RESUMED"
+    GuildCreate = "GUILD_CREATE"
+    GuildUpdate = "GUILD_UPDATE"
+    GuildDelete = "GUILD_DELETE"
+    ChannelCreate = "CHANNEL_CREATE"
+    ChannelUpdate = "CHANNEL_UPDATE"
+    ChannelDelete = "CHANNEL_DELETE"
     MessageCreate = "MESSAGE_CREATE"
+    MessageUpdate = "MESSAGE_UPDATE"
+    MessageDelete = "MESSAGE_DELETE"
+    MessageReactionAdd = "MESSAGE_REACTION_ADD"
+    MessageReactionRemove = "MESSAGE_REACTION_REMOVE"
+    TypingStart = "TYPING_START"
+
+    @classmethod
+    def of(cls, event_type: Optional[str]) -> DiscordGatewayEventName:
+        """
+        :return: the event name of a dispatch "t" field, Unknown for the types this client does not know about
+        """
+        return cls._value2member_map_.get(event_type, cls.Unknown)
 
 
 class DiscordGatewayIntent(IntEnum):
@@ -134,6 +160,26 @@ class DiscordGatewayIntent(IntEnum):
     DirectMessageTyping = 1 << 14
 
 
+# Intents a client must declare to receive each dispatched event (READY and RESUMED need none)
+DISCORD_EVENT_INTENTS = {
+    DiscordGatewayEventName.GuildCreate: DiscordGatewayIntent.Guilds,
+    DiscordGatewayEventName.GuildUpdate: DiscordGatewayIntent.Guilds,
+    DiscordGatewayEventName.GuildDelete: DiscordGatewayIntent.Guilds,
+    DiscordGatewayEventName.ChannelCreate: DiscordGatewayIntent.Guilds,
+    DiscordGatewayEventName.ChannelUpdate: DiscordGatewayIntent.Guilds,
+    DiscordGatewayEventName.ChannelDelete: DiscordGatewayIntent.Guilds,
+    DiscordGatewayEventName.MessageCreate: DiscordGatewayIntent.GuildMessages | DiscordGatewayIntent.DirectMessages,
+    DiscordGatewayEventName.MessageUpdate: DiscordGatewayIntent.GuildMessages | DiscordGatewayIntent.DirectMessages,
+    DiscordGatewayEventName.MessageDelete: DiscordGatewayIntent.GuildMessages | DiscordGatewayIntent.DirectMessages,
+    DiscordGatewayEventName.MessageReactionAdd:
+        DiscordGatewayIntent.GuildMessageReactions | DiscordGatewayIntent.DirectMessageReactions,
+    DiscordGatewayEventName.MessageReactionRemove:
+        DiscordGatewayIntent.GuildMessageReactions | DiscordGatewayIntent.DirectMessageReactions,
+    DiscordGatewayEventName.TypingStart:
+        DiscordGatewayIntent.GuildMessageTyping | DiscordGatewayIntent.DirectMessageTyping,
+}
+
+
 # Gateway Operations Hierarchy
 class DiscordGatewayOp():
     _last_message_seq: Optional[int] = None
@@ -159,7 +205,7 @@ class DiscordGatewayOp():
 
     def event_name(self) -> DiscordGatewayEventName:
         if isinstance(self.operation, dict):
-            return DiscordGatewayEventName(self.operation.get("t", DiscordGatewayEventName.Unknown.value))
+            return DiscordGatewayEventName.of(self.operation.get("t"))
         else:
             return DiscordGatewayEventName.Unknown
 
@@ -179,7 +225,7 @@ class DiscordGatewayOp():
             pass
 
     def handle_event(self,
-                     discord_client: DiscordClient) -> Optional[Greenlet]:
+                     discord_client: BaseDiscordClient) -> Optional[Greenlet]:
         logger.info(f"Nothing has to be done to handle event on Gateway operation {self.__class__.__name__}")
         return None
 
@@ -200,28 +246,34 @@ class DiscordGatewayOp():
         DiscordGatewayOp._last_message_seq = payload.get("s", None)
 
         return cls(DiscordGatewayOpCode(payload.get("op", DiscordGatewayOpCode.NO_OP.value)),
-                   copy.deepcopy(payload))
+                   payload)
 
     @staticmethod
-    def receive(message: str) -> DiscordGatewayOp:
+    def receive(message: str,
+                dispatched_types: Optional[Container[str]] = None) -> Optional[DiscordGatewayOp]:
         """
         Tries and instantiate the right subclass of DiscordGatewayOp according to the op code in the message.
         Raises an Exception if code is missing or does not correspond to a known subclass.
         :param message:
-        :return:
+        :param dispatched_types: if given, dispatched events whose "t" is not in it are skipped
+        :return: None for a skipped event
         """
         if not message:
             raise DiscordEmptyGatewayOperation()
+        # the payload is freshly parsed and only owned by the returned operation, it does not need to be copied
         payload = json.loads(message)
         DiscordGatewayOp.set_last_message_seq(payload.get("s", None))
 
         op_code = payload.get("op", DiscordGatewayOpCode.NO_OP.value)
+        if op_code == DiscordGatewayOpCode.DISPATCH and dispatched_types is not None \
+                and payload.get("t") not in dispatched_types:
+            return None
+
         op_class = DISCORD_OP_TO_CLASS.get(op_code)
         if op_class is None:
             raise DiscordUnknownGatewayOperation(op_code)
 
-        return op_class(DiscordGatewayOpCode(payload.get("op", DiscordGatewayOpCode.NO_OP.value)),
-                        copy.deepcopy(payload))
+        return op_class(DiscordGatewayOpCode(op_code), payload)
 
     # This method has no return type annotation because prior to 3.10,
     # you cannot use given class type as return class type in a class method
@@ -276,29 +328,43 @@ class DiscordGatewayDispatch(DiscordGatewayOp):
         )
 
     def handle_event(self,
-                     discord_client: DiscordClient) -> Optional[Greenlet]:
-        user = self._build_user_from_event_author()
+                     discord_client: BaseDiscordClient) -> Optional[Greenlet]:
+        discord_client.cache_entities(self)
+        if self.operation.get("t") != DiscordGatewayEventName.MessageCreate.value:
+            # only new messages fire commands, an edited message must not
+            return None
 
-        if user is not None:
-            event_data = self.event_data()
-            message_content = event_data.get("content", "")
+        event_data = self.event_data()
+        message_content = event_data.get("content", "")
 
-            callback = discord_client.matching_callback(message_content)
+        callback = discord_client.matching_callback(message_content)
 
-            if callback is not None:
-                logger.info(f"found callback matching message content ({message_content}): {callback}")
+        if callback is not None:
+            user = self._build_user_from_event_author()
 
+            if user is not None:
                 message_id = event_data.get("id", "")
-                message = Message(message_id, user, message_content, self, discord_client)
+                if message_id and discord_client.seen_messages.seen(message_id):
+                    logger.info(f"ignoring message {message_id} that was already dispatched")
+                    return None
+
+                logger.info(f"found callback matching message content ({message_content}): {callback}")
 
-                return callback.fire(message, user_id=user.id)
+                message = Message(message_id,
+                                  event_data.get("channel_id", "0"),
+                                  event_data.get("guild_id"),
+                                  user,
+                                  message_content,
+                                  discord_client)
+
+                return discord_client.fire(callback, message, user_id=user.id)
 
     def _build_user_from_event_author(self) -> Optional[User]:
         user = self.event_data().get("author", {})
         user_id = user.get("id")
         user_name = user.get("username")
         if user_id is not None:
-            return User(user_id, user_name)
+            return users.intern(user_id, user_name)
         else:
             return None
 
@@ -313,7 +379,7 @@ class DiscordGatewayHeartbeatAck(DiscordGatewayOp):
             {}
         )
 
-    def handle_event(self, discord_client: DiscordClient) -> Optional[Greenlet]:
+    def handle_event(self, discord_client: BaseDiscordClient) -> Optional[Greenlet]:
         discord_client.heartbeat_on()
         return None
 
@@ -321,7 +387,7 @@ class DiscordGatewayHeartbeatAck(DiscordGatewayOp):
 class DiscordGatewayCommand(DiscordGatewayOp):
 
     def check_type(self):
-        if self.event_name() != DiscordGatewayEventName.Unknown or self.sequence_number():
+        if self.operation.get("t") is not None or self.sequence_number():
             raise DiscordInvalidGatewayOperation(self.operation, self.op_code)
         super().check_type()
 
@@ -407,43 +473,152 @@ DISCORD_OP_TO_CLASS = {
 
 
 class Message:
+    """
+    A received message, holding only what handlers and replies need
+    (the original gateway event is not kept alive for the handler's lifetime)
+    """
+
+    __slots__ = ("id", "channel_id", "guild_id", "author", "content", "discord_client")
 
     def __init__(self,
                  id: str,
+                 channel_id: str,
+                 guild_id: Optional[str],
                  author: User,
                  content: str,
-                 original_event: DiscordGatewayOp,
-                 discord_client: DiscordClient):
+                 discord_client: BaseDiscordClient):
         self.id = id
+        self.channel_id = channel_id
+        self.guild_id = guild_id
         self.author = author
         self.content = content
-        self.original_event = original_event
         self.discord_client = discord_client
         logger.info(self)
 
     def respond(self, response: str) -> Greenlet:
         logger.debug(f"responding {response}")
-        return self.discord_client.respond_with(response, request=self.original_event)
+        return self.discord_client.respond_with(response, message=self)
+
+    def respond_later(self, response: str, delay_in_s: float) -> ScheduledTask:
+        logger.debug(f"responding {response} in {delay_in_s}s")
+        return self.discord_client.scheduler.schedule(delay_in_s, self.respond, response)
+
+    # Entities are resolved from the client's cache: None when it has none or they are not (or no longer) cached
+
+    @property
+    def guild(self) -> Optional[Guild]:
+        entities = self.discord_client.entities
+        return entities.guild(self.guild_id) if entities is not None and self.guild_id is not None else None
+
+    @property
+    def channel(self) -> Optional[Channel]:
+        entities = self.discord_client.entities
+        return entities.channel(self.guild_id, self.channel_id) \
+            if entities is not None and self.guild_id is not None else None
+
+    @property
+    def member(self) -> Optional[Member]:
+        entities = self.discord_client.entities
+        return entities.member(self.guild_id, self.author.id) \
+            if entities is not None and self.guild_id is not None else None
+
+    @property
+    def author_name(self) -> str:
+        """
+        Nickname of the author in the guild when it is cached, otherwise their user name
+        """
+        member = self.member
+        return member.display_name if member is not None else self.author.name
 
 
-class DiscordClient(CallbackHolder):
+class GatewayUrlCache:
+    """
+    Gateway URL returned by the REST API, kept on local disk for ttl_in_s.
+    A restarting client can then open the gateway without waiting for a REST call first.
+    """
+
+    def __init__(self,
+                 file_name: str,
+                 ttl_in_s: float = GATEWAY_URL_CACHE_TTL_IN_S):
+        self.file_name = file_name
+        self.ttl_in_s = ttl_in_s
+
+    def get(self, base_url: str) -> Optional[str]:
+        try:
+            with open(self.file_name) as cache_file:
+                cached = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+        if cached.get("base_url") != base_url or time.time() - cached.get("fetched_at", 0) > self.ttl_in_s:
+            return None
+        return cached.get("url")
+
+    def put(self, base_url: str, url: str) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.file_name) or ".", exist_ok=True)
+            with open(self.file_name, "w") as cache_file:
+                json.dump({"base_url": base_url, "url": url, "fetched_at": time.time()}, cache_file)
+        except OSError:
+            logger.warning(f"could not cache gateway URL in {self.file_name}", exc_info=True)
+
+    def invalidate(self) -> None:
+        try:
+            os.remove(self.file_name)
+        except FileNotFoundError:
+            pass
+
+
+class BaseDiscordClient(CallbackHolder):
+    """
+    What Discord clients share whatever the runtime they run on (gevent or asyncio):
+    configuration, REST resources, gateway intents and reply payloads.
+    Gateway operations and the callback registry are shared as well.
+    """
 
     def __init__(self,
                  token: str,
                  api_version=DISCORD_API_VERSION,
-                 gateway_api_version=DISCORD_GATEWAY_API_VERSION):
+                 gateway_api_version=DISCORD_GATEWAY_API_VERSION,
+                 scheduler=None,
+                 base_url: str = DISCORD_API_BASE_URL,
+                 gateway_url: Optional[str] = None,
+                 connections_limit: int = DISCORD_REST_CONNECTIONS_LIMIT,
+                 gateway_url_cache: Optional[GatewayUrlCache] = None,
+                 ordering: Optional[str] = None,
+                 entity_cache: Optional[EntityCache] = None):
+        """
+        :param ordering: USER_LANES or CHANNEL_LANES to run the commands of a user (or of a channel) in order,
+        None to run every command as soon as it is dispatched
+        :param entity_cache: filled with the guilds, channels and members of gateway events when given
+        """
 
         self.token = token
+        self.base_url = base_url
+        self.gateway_url = gateway_url
+        self.gateway_url_cache = gateway_url_cache
+        self.ordering = ordering
+        self.seen_messages = SeenSet()
+        self.subscribed_events = set()
+        self.dispatched_types = frozenset()
+        # a traffic.TrafficRecorder writing every frame received after READY, when set
+        self.recorder = None
+        self.heartbeat_interval_in_ms: Optional[int] = None
+        self.last_heartbeat_ack_at: Optional[float] = None
         self.api_version = api_version
         self.gateway_api_version = gateway_api_version
-
-        self.connected_to_gateway_event = Event()
-        self.heartbeat_event = Event()
-        self.event_queue = Queue()
-        self.websocket = None
+        self.scheduler = scheduler
+        self.connections_limit = connections_limit
+        self.ready_callbacks = []
+        self.entities = entity_cache
 
         super().__init__()
 
+        if entity_cache is not None:
+            for event_type in EntityCache.ENTITY_EVENT_TYPES:
+                event_name = DiscordGatewayEventName.of(event_type)
+                if event_name in DISCORD_EVENT_INTENTS:
+                    self.subscribe(event_name)
+
     @property
     def bot_authorization_header(self) -> str:
         return DISCORD_AUTHORIZATION_HEADER.format(token=self.token)
@@ -462,23 +637,208 @@ class DiscordClient(CallbackHolder):
 
     @property
     def api_base_url(self) -> str:
-        return f"{DISCORD_API_BASE_URL}/v{self.api_version}"
+        return f"{self.base_url}/v{self.api_version}"
 
     def api_url(self,
                 ressource_path: str) -> str:
         return f"{self.api_base_url}{ressource_path}"
 
+    @property
+    def gateway_query(self) -> str:
+        return f"?v={self.gateway_api_version}&encoding=json"
+
+    def known_gateway_url(self) -> Optional[str]:
+        """
+        :return: the configured or cached gateway URL, None if it must be asked to the REST API
+        """
+        if self.gateway_url is None and self.gateway_url_cache is not None:
+            return self.gateway_url_cache.get(self.base_url)
+        return self.gateway_url
+
+    def gateway_url_fetched(self, gateway_url: str) -> None:
+        if self.gateway_url_cache is not None:
+            self.gateway_url_cache.put(self.base_url, gateway_url)
+
+    def gateway_connection_failed(self) -> None:
+        """
+        The cached gateway URL may be the reason why, the next connection asks the REST API again
+        """
+        if self.gateway_url_cache is not None:
+            self.gateway_url_cache.invalidate()
+
+    def subscribe(self, event_name: DiscordGatewayEventName) -> None:
+        """
+        Receives event_name from the gateway: it is added to the intents of the next IDENTIFY.
+        Registering a command callback subscribes to MESSAGE_CREATE.
+        """
+        self.subscribed_events.add(event_name)
+        self.dispatched_types = frozenset(event.value for event in self.subscribed_events)
+
+    def register_callback(self,
+                          key: str,
+                          caller: object,
+                          callback_method,
+                          rearm_timeout_in_s: int = 0) -> None:
+        super().register_callback(key, caller, callback_method, rearm_timeout_in_s)
+        self.subscribe(DiscordGatewayEventName.MessageCreate)
+
+    def cache_entities(self, dispatch: DiscordGatewayDispatch) -> None:
+        if self.entities is not None:
+            self.entities.update(dispatch.operation.get("t"), dispatch.event_data())
+
+    @property
+    def intents(self) -> int:
+        """
+        Only the intents of subscribed events, so that Discord does not send events that would be dropped anyway
+        """
+        intents = 0
+        for event_name in self.subscribed_events:
+            intents |= DISCORD_EVENT_INTENTS.get(event_name, 0)
+        return intents
+
+    @staticmethod
+    def reply(response: str,
+              message: Message) -> dict:
+        """
+        Builds the payload of a message replying to the given one
+        """
+        message_reference = {
+            "message_id": message.id,
+            "channel_id": message.channel_id
+        }
+        if message.guild_id is not None:
+            message_reference["guild_id"] = message.guild_id
+
+        return {
+            "content": response,
+            "message_reference": message_reference
+        }
+
+    def lane_of(self, message: Message) -> str:
+        if self.ordering == USER_LANES:
+            return message.author.id
+        elif self.ordering == CHANNEL_LANES:
+            return message.channel_id
+        raise ValueError(f"Unknown ordering {self.ordering}")
+
+    def on_ready(self, function: Callable) -> None:
+        """
+        Calls function() on the client's runtime each time the gateway connection is ready
+        """
+        self.ready_callbacks.append(function)
+
+    def ready(self) -> None:
+        for function in self.ready_callbacks:
+            try:
+                function()
+            except Exception:
+                logger.exception(f"ready callback {function} failed")
+
+    def fire(self,
+             callback: Callback,
+             message: Message,
+             user_id: str):
+        """
+        Abstract method: calls the callback on the client's runtime, unless it is cooling down for user_id
+        """
+        pass
+
+    def heartbeat_on(self) -> None:
+        """
+        Abstract method: called when the gateway acknowledges a heartbeat
+        """
+        pass
+
+    def respond_with(self,
+                     response: str,
+                     message: Message):
+        """
+        Abstract method: posts a reply to the given message
+        """
+        pass
+
+    def call_blocking(self,
+                      function: Callable,
+                      args: tuple,
+                      callback: Callable):
+        """
+        Abstract method: calls function(*args) without blocking the client's runtime, then callback(result)
+        """
+        pass
+
+    def call_in_thread(self,
+                       function: Callable,
+                       args: tuple,
+                       callback: Callable):
+        """
+        Same as call_blocking, for functions that block without yielding to the client's runtime (such as gdbm's
+        file operations): they run in a thread
+        """
+        return self.call_blocking(function, args, callback)
+
+
+class DiscordClient(BaseDiscordClient):
+
+    def __init__(self,
+                 token: str,
+                 api_version=DISCORD_API_VERSION,
+                 gateway_api_version=DISCORD_GATEWAY_API_VERSION,
+                 scheduler: Scheduler = scheduler,
+                 base_url: str = DISCORD_API_BASE_URL,
+                 gateway_url: Optional[str] = None,
+                 connections_limit: int = DISCORD_REST_CONNECTIONS_LIMIT,
+                 gateway_url_cache: Optional[GatewayUrlCache] = None,
+                 ordering: Optional[str] = None,
+                 entity_cache: Optional[EntityCache] = None):
+
+        self.connected_to_gateway_event = Event()
+        self.heartbeat_event = Event()
+        self.event_queue = Queue()
+        self.websocket = None
+        self.gateway_sender: Optional[GatewaySender] = None
+        self._session = None
+        self.lanes = Lanes() if ordering else None
+
+        super().__init__(token,
+                         api_version=api_version,
+                         gateway_api_version=gateway_api_version,
+                         scheduler=scheduler,
+                         base_url=base_url,
+                         gateway_url=gateway_url,
+                         connections_limit=connections_limit,
+                         gateway_url_cache=gateway_url_cache,
+                         ordering=ordering,
+                         entity_cache=entity_cache)
+
+    @property
+    def session(self):
+        """
+        REST connections are kept alive and shared by every greenlet.
+        requests is only imported by the first REST call, it is not needed to open the gateway.
+        """
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            self._session = requests.Session()
+            self._session.mount("http://", HTTPAdapter(pool_maxsize=self.connections_limit))
+            self._session.mount("https://", HTTPAdapter(pool_maxsize=self.connections_limit))
+        return self._session
+
     @property
     def gateway_base_url(self) -> str:
-        result = requests.get(
-            url=self.api_url(ressource_path=DISCORD_GATEWAY_PATH),
-            headers=self.header
-        )
-        return result.json()["url"] + f"?v={self.gateway_api_version}&encoding=json"
+        gateway_url = self.known_gateway_url()
+        if gateway_url is None:
+            result = self.session.get(
+                url=self.api_url(ressource_path=DISCORD_GATEWAY_PATH),
+                headers=self.header
+            )
+            gateway_url = result.json()["url"]
+            self.gateway_url_fetched(gateway_url)
+        return gateway_url + self.gateway_query
 
     @property
     def me(self) -> dict:
-        result = requests.get(
+        result = self.session.get(
             url=self.api_url(ressource_path=DISCORD_CURRENT_USER_PATH),
             headers=self.header
         )
@@ -487,27 +847,37 @@ class DiscordClient(CallbackHolder):
     def connect_to_gateway(self) -> None:
 
         uri = self.gateway_base_url
-        self.websocket = Ws4pyClient(uri)
+        try:
+            self.websocket = Ws4pyClient(uri)
+        except Exception:
+            self.gateway_connection_failed()
+            raise
+        self.gateway_sender = GatewaySender(self.websocket)
+        writer = spawn("gateway:writer", self.gateway_sender.run)
 
         hello = DiscordGatewayHello.expect(self.websocket.receive())
 
         # starting heartbeat loop
         heartbeat_interval = hello.heartbeat_interval
-        heartbeat = gevent.spawn(self.heartbeat, interval=heartbeat_interval)
+        self.heartbeat_interval_in_ms = heartbeat_interval
+        heartbeat = spawn("heartbeat", self.heartbeat, interval=heartbeat_interval)
         self.heartbeat_on()
 
-        identify = DiscordGatewayIdentify.build(self.token,
-                                                 DiscordGatewayIntent.GuildMessages | DiscordGatewayIntent.GuildMessageReactions | DiscordGatewayIntent.DirectMessages | DiscordGatewayIntent.DirectMessageReactions)
-        self.websocket.send(identify)
+        identify = DiscordGatewayIdentify.build(self.token, self.intents)
+        self.gateway_sender.send(identify, IDENTIFY_PRIORITY)
 
         ready = DiscordGatewayDispatch.expect(self.websocket.receive())
+        self.cache_entities(ready)
 
         # Signals that connection is OK
         self.connected_to_gateway_event.set()
+        self.ready()
 
         heartbeat.join()
+        writer.kill()
 
     def heartbeat_on(self) -> None:
+        self.last_heartbeat_ack_at = time.monotonic()
         self.heartbeat_event.set()
 
     def heartbeat_off(self) -> None:
@@ -520,15 +890,19 @@ class DiscordClient(CallbackHolder):
             gevent.sleep((interval * random()) / 1000)
             logger.info("heartbeat!")
             heartbeat = DiscordGatewayHeartbeat.build()
-            self.websocket.send(heartbeat)
+            self.gateway_sender.send(heartbeat, HEARTBEAT_PRIORITY)
             self.heartbeat_off()
 
     def queue_events(self) -> None:
         self.connected_to_gateway_event.wait()
         logger.info("queuing events...")
         while True:
-            event = DiscordGatewayOp.receive(self.websocket.receive())
-            self.event_queue.put(event)
+            frame = self.websocket.receive()
+            if self.recorder is not None:
+                self.recorder.record(frame)
+            event = DiscordGatewayOp.receive(frame, self.dispatched_types)
+            if event is not None:
+                self.event_queue.put(event)
             gevent.sleep(0)
 
     def handle_events(self) -> None:
@@ -536,60 +910,75 @@ class DiscordClient(CallbackHolder):
         logger.info("...unqueuing events")
         while True:
             event = self.event_queue.get()
-            gevent.spawn(event.handle_event, self)
+            spawn(f"dispatch:{event.__class__.__name__}", event.handle_event, self)
             gevent.sleep(0)
 
     def respond_with(self,
                      response: str,
-                     request: DiscordGatewayOp) -> Greenlet:
-
-        def respond(message: dict):
-            channel_id = message.get("channel_id", "0")
-            user = self.me
-            message["author"] = user
+                     message: Message) -> Greenlet:
 
-            logger.debug(f"respond message=${message}")
-            result = requests.post(
+        def respond(channel_id: str, response_message: dict):
+            logger.debug(f"respond message=${response_message}")
+            result = self.session.post(
                 url=self.api_url(ressource_path=DISCORD_CREATE_MESSAGE_PATH.format(channel_id=channel_id)),
                 headers=self.header,
-                json=message
+                json=response_message
             )
             logger.debug(f"respond result={result}, reason={result.reason}, content={result.text}")
 
-        request_message = request.event_data()
-        response_message = copy.deepcopy(request_message)
-        response_message["id"] = None
-        response_message["timestamp"] = self.timestamp()
-        response_message["content"] = response
-        response_message["referenced_message"] = request_message
-        response_message["message_reference"] = {
-            "message_id": request_message["id"]
-        }
-        response_message["type"] = DiscordMessageType.REPLY.value
-
-        return gevent.spawn(respond, response_message)
+        return spawn("rest:post", respond, message.channel_id, self.reply(response, message))
+
+    def fire(self,
+             callback: Callback,
+             message: Message,
+             user_id: str) -> Optional[Greenlet]:
+        if self.lanes is None:
+            return callback.fire(message, user_id=user_id)
+        if callback.accept(user_id):
+            return self.lanes.submit(self.lane_of(message), callback.callback_function, callback.caller, message)
+
+    def call_blocking(self,
+                      function: Callable,
+                      args: tuple,
+                      callback: Callable):
+        # handlers already run in their own greenlet, function is expected to wait on the hub
+        return callback(function(*args))
+
+    def call_in_thread(self,
+                       function: Callable,
+                       args: tuple,
+                       callback: Callable) -> Greenlet:
+        # the hub keeps running other greenlets while the thread pool runs function
+        return spawn("threadpool", lambda: callback(gevent.get_hub().threadpool.apply(function, args)))
+
+    def run(self) -> None:
+        gevent.joinall(self.start())
 
     def start(self) -> Sequence[Greenlet]:
         return [
-            gevent.spawn(self.connect_to_gateway),
-            gevent.spawn(self.queue_events),
-            gevent.spawn(self.handle_events)
+            spawn("gateway", self.connect_to_gateway),
+            spawn("reader", self.queue_events),
+            spawn("dispatcher", self.handle_events)
         ]
 
     @staticmethod
     def timestamp() -> str:
-        return datetime.now().astimezone(utc).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00)")
+        return datetime.now().astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00)")
 
 
 class Ws4pyClient:
 
     def __init__(self, uri: str):
+        from ws4py.client.geventclient import WebSocketClient
         self.ws = WebSocketClient(uri)
         self.ws.connect()
 
     def send(self, command: DiscordGatewayCommand) -> None:
-        logger.info(f"> sending command {command}")
-        self.ws.send(str(command))
+        self.send_frame(str(command))
+
+    def send_frame(self, frame: str) -> None:
+        logger.info(f"> sending command {frame}")
+        self.ws.send(frame)
 
     def receive(self) -> str:
         received = str(self.ws.receive())
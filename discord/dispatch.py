@@ -0,0 +1,112 @@
+"""
+Dispatch stage between gateway events and command handlers:
+ - SeenSet drops events that were already handled (a replayed MESSAGE_CREATE must not fire a command twice)
+ - Lanes run the handlers of a lane (a user or a channel) in order, while different lanes run concurrently
+"""
+import logging
+from collections import deque
+from time import monotonic
+from typing import Callable, Hashable, Optional
+
+from gevent import Greenlet
+
+from .profiling import spawn
+
+logger = logging.getLogger(__name__)
+
+DEDUP_WINDOW_IN_S = 10 * 60
+DEDUP_MAX_SIZE = 100_000
+
+USER_LANES = "user"
+CHANNEL_LANES = "channel"
+
+
+class SeenSet:
+    """
+    Bounded, time windowed set of recently seen ids.
+    Ids are added to the current generation, that replaces the previous one once it is half a window old
+    or holds half of max_size ids: an id is remembered at least window_in_s / 2 seconds
+    (unless max_size ids arrive in the meantime), and at most window_in_s seconds.
+    """
+
+    def __init__(self,
+                 window_in_s: float = DEDUP_WINDOW_IN_S,
+                 max_size: int = DEDUP_MAX_SIZE,
+                 clock: Callable[[], float] = monotonic):
+        self.window_in_s = window_in_s
+        self.max_size = max_size
+        self._clock = clock
+        self._current = set()
+        self._previous = set()
+        self._rotated_at = clock()
+
+    def _rotate_if_needed(self) -> None:
+        now = self._clock()
+        if now - self._rotated_at >= self.window_in_s:
+            # both generations are too old
+            self._previous = set()
+            self._current = set()
+            self._rotated_at = now
+        elif now - self._rotated_at >= self.window_in_s / 2 or len(self._current) >= self.max_size // 2:
+            self._previous = self._current
+            self._current = set()
+            self._rotated_at = now
+
+    def seen(self, id: Hashable) -> bool:
+        """
+        :return: True if id was already seen, otherwise remembers it and returns False
+        """
+        self._rotate_if_needed()
+        if id in self._current or id in self._previous:
+            return True
+        self._current.add(id)
+        return False
+
+    def __len__(self) -> int:
+        return len(self._current) + len(self._previous)
+
+
+class Lanes:
+    """
+    Ordered execution lanes: functions submitted to the same lane run one after the other in submission order,
+    while different lanes run concurrently. A lane only holds a worker while it has pending functions.
+    Workers are greenlets here, see aio_client.AsyncLanes for asyncio.
+    """
+
+    def __init__(self):
+        self._pending = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def submit(self, lane: Hashable, function: Callable, *args) -> Optional[Greenlet]:
+        """
+        :return: the worker started for the lane, None if the lane already had one
+        """
+        pending = self._pending.get(lane)
+        if pending is not None:
+            pending.append((function, args))
+            return None
+        self._pending[lane] = deque([(function, args)])
+        return self._start_worker(lane)
+
+    def _start_worker(self, lane: Hashable):
+        return spawn("lane", self._drain, lane)
+
+    def _next(self, lane: Hashable) -> Optional[tuple]:
+        pending = self._pending[lane]
+        if not pending:
+            del self._pending[lane]
+            return None
+        return pending.popleft()
+
+    def _drain(self, lane: Hashable) -> None:
+        task = self._next(lane)
+        while task is not None:
+            function, args = task
+            try:
+                function(*args)
+            except Exception:
+                # a failing handler must not stall the handlers queued after it
+                logger.exception(f"{getattr(function, '__name__', function)} failed in lane {lane}")
+            task = self._next(lane)
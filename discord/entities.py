@@ -0,0 +1,278 @@
+"""
+In-memory cache of the guilds, channels and members the gateway tells about, so that handlers can read them
+without a REST call.
+
+Entities are compact (slotted objects, members sharing the interned User of discord.user), and bounded:
+ - guilds are kept in activity order, the least recently active ones being evicted beyond max_guilds
+ - members are kept per guild in activity order, beyond max_members_per_guild the least recently active go first
+ - each entity type has its own retention: an entity not seen for longer is dropped when it is next read
+"""
+import logging
+from collections import OrderedDict
+from time import monotonic
+from typing import Callable, Iterable, Optional
+
+from .user import User, users
+
+logger = logging.getLogger(__name__)
+
+GUILD_ENTITY = "guild"
+CHANNEL_ENTITY = "channel"
+MEMBER_ENTITY = "member"
+
+ENTITY_CACHE_MAX_GUILDS = 10_000
+ENTITY_CACHE_MAX_MEMBERS_PER_GUILD = 1000
+# None keeps entities for as long as their guild is cached
+ENTITY_CACHE_RETENTION_IN_S = {
+    GUILD_ENTITY: 24 * 60 * 60,
+    CHANNEL_ENTITY: None,
+    MEMBER_ENTITY: 60 * 60,
+}
+
+
+class Channel:
+
+    __slots__ = ("id", "guild_id", "name", "type", "seen_at")
+
+    def __init__(self,
+                 id: str,
+                 guild_id: Optional[str],
+                 name: Optional[str],
+                 type: int,
+                 seen_at: float):
+        self.id = id
+        self.guild_id = guild_id
+        self.name = name
+        self.type = type
+        self.seen_at = seen_at
+
+    def __repr__(self) -> str:
+        return f"Channel({self.id}, {self.name})"
+
+
+class Member:
+
+    __slots__ = ("user", "nick", "roles", "seen_at")
+
+    def __init__(self,
+                 user: User,
+                 nick: Optional[str],
+                 roles: tuple,
+                 seen_at: float):
+        self.user = user
+        self.nick = nick
+        self.roles = roles
+        self.seen_at = seen_at
+
+    @property
+    def display_name(self) -> str:
+        return self.nick or self.user.name
+
+    def __repr__(self) -> str:
+        return f"Member({self.user.id}, {self.display_name})"
+
+
+class Guild:
+
+    __slots__ = ("id", "name", "member_count", "channels", "members", "seen_at")
+
+    def __init__(self,
+                 id: str,
+                 seen_at: float):
+        self.id = id
+        self.name: Optional[str] = None
+        self.member_count: Optional[int] = None
+        self.channels = {}
+        self.members = OrderedDict()
+        self.seen_at = seen_at
+
+    def __repr__(self) -> str:
+        return f"Guild({self.id}, {self.name})"
+
+
+class EntityCache:
+    """
+    Filled by update() with the gateway dispatches of ENTITY_EVENT_TYPES and MESSAGE_CREATE.
+    It is only used from the client's runtime, it needs no lock.
+    """
+
+    ENTITY_EVENT_TYPES = ("READY", "GUILD_CREATE", "GUILD_UPDATE", "GUILD_DELETE",
+                          "CHANNEL_CREATE", "CHANNEL_UPDATE", "CHANNEL_DELETE")
+
+    def __init__(self,
+                 max_guilds: int = ENTITY_CACHE_MAX_GUILDS,
+                 max_members_per_guild: int = ENTITY_CACHE_MAX_MEMBERS_PER_GUILD,
+                 retention_in_s: Optional[dict] = None,
+                 clock: Callable[[], float] = monotonic):
+        """
+        :param retention_in_s: overrides ENTITY_CACHE_RETENTION_IN_S for some entity types
+        """
+        self.max_guilds = max_guilds
+        self.max_members_per_guild = max_members_per_guild
+        self.retention_in_s = dict(ENTITY_CACHE_RETENTION_IN_S, **(retention_in_s or {}))
+        self._clock = clock
+        self._guilds = OrderedDict()
+        self.evicted_guilds_count = 0
+        self._handlers = {
+            "READY": self._ready,
+            "GUILD_CREATE": self._guild_updated,
+            "GUILD_UPDATE": self._guild_updated,
+            "GUILD_DELETE": self._guild_deleted,
+            "CHANNEL_CREATE": self._channel_updated,
+            "CHANNEL_UPDATE": self._channel_updated,
+            "CHANNEL_DELETE": self._channel_deleted,
+            "MESSAGE_CREATE": self._message_created,
+        }
+
+    def __len__(self) -> int:
+        return len(self._guilds)
+
+    def _expired(self, entity, entity_type: str, now: float) -> bool:
+        retention = self.retention_in_s.get(entity_type)
+        return retention is not None and now - entity.seen_at > retention
+
+    def update(self, event_type: Optional[str], data: dict) -> None:
+        handler = self._handlers.get(event_type)
+        if handler is not None:
+            handler(data)
+
+    # Reads
+
+    def guild(self, guild_id: str) -> Optional[Guild]:
+        guild = self._guilds.get(guild_id)
+        if guild is not None and self._expired(guild, GUILD_ENTITY, self._clock()):
+            del self._guilds[guild_id]
+            return None
+        return guild
+
+    def channel(self, guild_id: str, channel_id: str) -> Optional[Channel]:
+        guild = self.guild(guild_id)
+        if guild is None:
+            return None
+        channel = guild.channels.get(channel_id)
+        if channel is not None and self._expired(channel, CHANNEL_ENTITY, self._clock()):
+            del guild.channels[channel_id]
+            return None
+        return channel
+
+    def member(self, guild_id: str, user_id: str) -> Optional[Member]:
+        guild = self.guild(guild_id)
+        if guild is None:
+            return None
+        member = guild.members.get(user_id)
+        if member is not None and self._expired(member, MEMBER_ENTITY, self._clock()):
+            del guild.members[user_id]
+            return None
+        return member
+
+    def guilds(self) -> Iterable[Guild]:
+        """
+        :return: cached guilds, from the least to the most recently active
+        """
+        return self._guilds.values()
+
+    def stats(self) -> dict:
+        return {
+            "guilds": len(self._guilds),
+            "channels": sum(len(guild.channels) for guild in self._guilds.values()),
+            "members": sum(len(guild.members) for guild in self._guilds.values()),
+            "evicted_guilds": self.evicted_guilds_count
+        }
+
+    # Writes
+
+    def _touch_guild(self, guild_id: str, now: float) -> Guild:
+        guild = self._guilds.get(guild_id)
+        if guild is None:
+            guild = Guild(guild_id, now)
+            self._guilds[guild_id] = guild
+            self._evict_guilds(now)
+        else:
+            guild.seen_at = now
+            self._guilds.move_to_end(guild_id)
+        return guild
+
+    def _evict_guilds(self, now: float) -> None:
+        # guilds are in activity order: the expired ones are at the head
+        while self._guilds:
+            guild_id, oldest = next(iter(self._guilds.items()))
+            if len(self._guilds) <= self.max_guilds and not self._expired(oldest, GUILD_ENTITY, now):
+                return
+            del self._guilds[guild_id]
+            self.evicted_guilds_count += 1
+
+    def _touch_member(self, guild: Guild, user_data: dict, member_data: dict, now: float) -> None:
+        user_id = user_data.get("id")
+        if user_id is None:
+            return
+        roles = member_data.get("roles")
+        member = guild.members.get(user_id)
+        if member is None:
+            member = Member(users.intern(user_id, user_data.get("username")), member_data.get("nick"),
+                            tuple(roles) if roles else (), now)
+            guild.members[user_id] = member
+            members_retention = self.retention_in_s.get(MEMBER_ENTITY)
+            while len(guild.members) > self.max_members_per_guild or (
+                    members_retention is not None and now - next(iter(guild.members.values())).seen_at
+                    > members_retention):
+                guild.members.popitem(last=False)
+        else:
+            member.nick = member_data.get("nick")
+            if roles is not None and tuple(roles) != member.roles:
+                member.roles = tuple(roles)
+            member.seen_at = now
+            guild.members.move_to_end(user_id)
+
+    def _update_channel(self, guild: Guild, channel_data: dict, now: float) -> None:
+        channel_id = channel_data["id"]
+        channel = guild.channels.get(channel_id)
+        if channel is None:
+            guild.channels[channel_id] = Channel(channel_id, guild.id, channel_data.get("name"),
+                                                 channel_data.get("type", 0), now)
+        else:
+            channel.name = channel_data.get("name", channel.name)
+            channel.type = channel_data.get("type", channel.type)
+            channel.seen_at = now
+
+    def _ready(self, data: dict) -> None:
+        # READY only lists the guilds ids, GUILD_CREATE follows for each of them
+        now = self._clock()
+        for guild_data in data.get("guilds", ()):
+            self._touch_guild(guild_data["id"], now)
+
+    def _guild_updated(self, data: dict) -> None:
+        now = self._clock()
+        guild = self._touch_guild(data["id"], now)
+        guild.name = data.get("name", guild.name)
+        guild.member_count = data.get("member_count", guild.member_count)
+        for channel_data in data.get("channels", ()):
+            self._update_channel(guild, channel_data, now)
+        for member_data in data.get("members", ()):
+            self._touch_member(guild, member_data.get("user", {}), member_data, now)
+
+    def _guild_deleted(self, data: dict) -> None:
+        self._guilds.pop(data.get("id"), None)
+
+    def _channel_updated(self, data: dict) -> None:
+        guild_id = data.get("guild_id")
+        if guild_id is not None:
+            now = self._clock()
+            self._update_channel(self._touch_guild(guild_id, now), data, now)
+
+    def _channel_deleted(self, data: dict) -> None:
+        guild = self._guilds.get(data.get("guild_id"))
+        if guild is not None:
+            guild.channels.pop(data.get("id"), None)
+
+    def _message_created(self, data: dict) -> None:
+        guild_id = data.get("guild_id")
+        if guild_id is None:
+            return
+        now = self._clock()
+        guild = self._touch_guild(guild_id, now)
+        channel = guild.channels.get(data.get("channel_id"))
+        if channel is not None:
+            channel.seen_at = now
+        member_data = data.get("member")
+        if member_data is not None:
+            self._touch_member(guild, data.get("author", {}), member_data, now)
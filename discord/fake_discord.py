@@ -0,0 +1,416 @@
+"""
+A local stand-in for Discord, to load-test and benchmark bots without touching discord.com.
+
+It serves on a single port:
+ - a websocket gateway speaking HELLO / IDENTIFY / READY / HEARTBEAT / RESUME / DISPATCH on /gateway
+ - a REST stub for /gateway/bot, /users/@me, /channels/{channel_id}/messages and interaction follow-ups
+   (/webhooks/{application_id}/{interaction_token}) under /api/v{version}
+
+REST latency and rate limits are configurable, and synthetic MESSAGE_CREATE traffic can be generated
+at a given rate. Point a DiscordClient (or a Bot) at it with base_url=fake_discord.api_base_url.
+
+    PYTHONPATH=. python -m discord.fake_discord --port 8080 --events-per-s 200 --duration 60
+    DISCORD_ROULETTE_API_BASE_URL=http://127.0.0.1:8080/api DISCORD_ROULETTE_BOT_TOKEN=fake python bot.py
+"""
+import argparse
+import itertools
+import json
+import logging
+import re
+import uuid
+from collections import deque
+from random import choice, randrange
+from time import monotonic
+from typing import Optional
+
+import gevent
+from gevent.event import Event
+from gevent.lock import Semaphore
+from gevent.pywsgi import WSGIServer as _WSGIServer
+from ws4py.server.geventserver import WSGIServer
+from ws4py.server.wsgiutils import WebSocketWSGIApplication
+from ws4py.websocket import WebSocket
+
+from .discord_client import DiscordGatewayEventName, DiscordGatewayOpCode, DISCORD_API_VERSION, \
+    DISCORD_CURRENT_USER_PATH, DISCORD_EVENT_INTENTS, DISCORD_GATEWAY_PATH
+
+logger = logging.getLogger(__name__)
+
+FAKE_DISCORD_GATEWAY_PATH = "/gateway"
+FAKE_DISCORD_HEARTBEAT_INTERVAL_IN_MS = 41250
+FAKE_DISCORD_SESSION_HISTORY_SIZE = 1000
+FAKE_DISCORD_BOT_USER = {
+    "id": "860196433365565500",
+    "username": "fake-roulette-bot",
+    "discriminator": "0000",
+    "bot": True
+}
+
+CREATE_MESSAGE_PATH_PATTERN = re.compile(r"^/channels/(?P<channel_id>[^/]+)/messages$")
+FOLLOW_UP_PATH_PATTERN = re.compile(r"^/webhooks/(?P<application_id>[^/]+)/(?P<interaction_token>[^/]+)$")
+
+
+class FakeDiscordSession:
+    """
+    Gateway session state, kept after the websocket closes so that a client can RESUME it.
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.sequence = 0
+        self.intents = 0
+        self.history = deque(maxlen=FAKE_DISCORD_SESSION_HISTORY_SIZE)
+        self.websocket: Optional[FakeDiscordGatewaySocket] = None
+
+    def next_dispatch(self, event_name: str, data: dict) -> str:
+        self.sequence += 1
+        frame = json.dumps({"op": DiscordGatewayOpCode.DISPATCH.value, "s": self.sequence, "t": event_name, "d": data})
+        self.history.append((self.sequence, frame))
+        return frame
+
+    def frames_after(self, sequence: int) -> list:
+        return [frame for (frame_sequence, frame) in self.history if frame_sequence > sequence]
+
+
+class FakeDiscordGatewaySocket(WebSocket):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fake_discord: FakeDiscord = self.environ["fake_discord"]
+        self.session: Optional[FakeDiscordSession] = None
+        self.send_lock = Semaphore()
+
+    def send_frame(self, frame: str) -> None:
+        with self.send_lock:
+            self.send(frame)
+
+    def send_op(self, op_code: DiscordGatewayOpCode, data=None) -> None:
+        self.send_frame(json.dumps({"op": op_code.value, "d": data, "s": None, "t": None}))
+
+    def dispatch(self, event_name: str, data: dict) -> None:
+        """
+        Like Discord, events are only sent to sessions that identified with one of their intents
+        """
+        if self.session is None:
+            return
+        required_intents = DISCORD_EVENT_INTENTS.get(DiscordGatewayEventName.of(event_name))
+        if required_intents is not None and not required_intents & self.session.intents:
+            return
+        self.send_frame(self.session.next_dispatch(event_name, data))
+
+    def opened(self) -> None:
+        self.send_op(DiscordGatewayOpCode.HELLO, {"heartbeat_interval": self.fake_discord.heartbeat_interval_in_ms})
+
+    def received_message(self, message) -> None:
+        payload = json.loads(str(message))
+        op_code = payload.get("op")
+        data = payload.get("d")
+
+        if op_code == DiscordGatewayOpCode.HEARTBEAT:
+            self.fake_discord.heartbeats_count += 1
+            self.send_op(DiscordGatewayOpCode.HEARTBEAT_ACK)
+        elif op_code == DiscordGatewayOpCode.IDENTIFY:
+            self.session = self.fake_discord.open_session(self)
+            self.session.intents = data.get("intents", 0)
+            self.dispatch("READY", {
+                "v": int(self.fake_discord.api_version),
+                "user": FAKE_DISCORD_BOT_USER,
+                "guilds": [{"id": guild_id, "unavailable": True} for guild_id in self.fake_discord.guild_ids],
+                "session_id": self.session.session_id
+            })
+            # then, like Discord, the guilds become available one after the other
+            for guild_id in self.fake_discord.guild_ids:
+                self.dispatch("GUILD_CREATE", self.fake_discord.guild(guild_id))
+        elif op_code == DiscordGatewayOpCode.RESUME:
+            self.session = self.fake_discord.resume_session(self, data.get("session_id"))
+            if self.session is None:
+                self.send_op(DiscordGatewayOpCode.INVALIDATE_SESSION, False)
+            else:
+                for frame in self.session.frames_after(data.get("seq") or 0):
+                    self.send_frame(frame)
+                self.dispatch("RESUMED", {})
+        else:
+            logger.info(f"fake gateway ignores operation {op_code}")
+
+    def closed(self, code, reason=None) -> None:
+        self.fake_discord.close_session(self)
+
+
+class FakeDiscord:
+
+    def __init__(self,
+                 host: str = "127.0.0.1",
+                 port: int = 0,
+                 api_version: str = DISCORD_API_VERSION,
+                 rest_latency_in_s: float = 0.0,
+                 rate_limit_per_s: int = 0,
+                 heartbeat_interval_in_ms: int = FAKE_DISCORD_HEARTBEAT_INTERVAL_IN_MS,
+                 guild_ids: tuple = ("1000",),
+                 channel_ids: tuple = ("2000",)):
+        self.host = host
+        self.port = port
+        self.api_version = api_version
+        self.rest_latency_in_s = rest_latency_in_s
+        self.rate_limit_per_s = rate_limit_per_s
+        self.heartbeat_interval_in_ms = heartbeat_interval_in_ms
+        self.guild_ids = guild_ids
+        self.channel_ids = channel_ids
+
+        self.sessions = {}
+        self.connected_event = Event()
+        self.posted_messages = deque(maxlen=10000)
+        self.posted_messages_count = 0
+        self.last_message_posted_at = None
+        self.rest_requests_count = 0
+        self.rate_limited_count = 0
+        self.heartbeats_count = 0
+        self._rate_limit_window = (-1.0, 0)
+        self._message_ids = itertools.count(1)
+
+        self._gateway = WebSocketWSGIApplication(handler_cls=FakeDiscordGatewaySocket)
+        self._server: Optional[_WSGIServer] = None
+
+    # Server lifecycle
+    def start(self) -> None:
+        self._server = WSGIServer((self.host, self.port), self, log=None, error_log=logger)
+        self._server.start()
+        self.port = self._server.server_port
+        logger.info(f"fake discord listening on {self.api_base_url}")
+
+    def stop(self) -> None:
+        for session in list(self.sessions.values()):
+            if session.websocket is not None:
+                session.websocket.close()
+        self._server.stop(timeout=1)
+
+    @property
+    def api_base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/api"
+
+    @property
+    def gateway_url(self) -> str:
+        return f"ws://{self.host}:{self.port}{FAKE_DISCORD_GATEWAY_PATH}"
+
+    # Gateway sessions
+    def open_session(self, websocket: FakeDiscordGatewaySocket) -> FakeDiscordSession:
+        session = FakeDiscordSession(uuid.uuid4().hex)
+        session.websocket = websocket
+        self.sessions[session.session_id] = session
+        self.connected_event.set()
+        return session
+
+    def resume_session(self,
+                       websocket: FakeDiscordGatewaySocket,
+                       session_id: str) -> Optional[FakeDiscordSession]:
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.websocket = websocket
+        return session
+
+    def close_session(self, websocket: FakeDiscordGatewaySocket) -> None:
+        if websocket.session is not None and websocket.session.websocket is websocket:
+            websocket.session.websocket = None
+
+    def connected_websockets(self) -> list:
+        return [session.websocket for session in self.sessions.values() if session.websocket is not None]
+
+    def guild(self, guild_id: str) -> dict:
+        """
+        A guild as sent by GUILD_CREATE: every fake channel belongs to every fake guild
+        """
+        return {
+            "id": guild_id,
+            "name": f"guild {guild_id}",
+            "member_count": 1,
+            "channels": [{"id": channel_id, "type": 0, "name": f"channel {channel_id}", "guild_id": guild_id}
+                         for channel_id in self.channel_ids],
+            "members": [{"user": FAKE_DISCORD_BOT_USER, "nick": None, "roles": []}]
+        }
+
+    # Traffic
+    def dispatch(self, event_name: str, data: dict) -> int:
+        """
+        Sends a DISPATCH event to every connected session
+        :return: the number of sessions the event was sent to
+        """
+        websockets = self.connected_websockets()
+        for websocket in websockets:
+            websocket.dispatch(event_name, data)
+        return len(websockets)
+
+    def dispatch_message_create(self,
+                                content: str,
+                                user_id: str = "3000",
+                                username: str = "player",
+                                channel_id: Optional[str] = None,
+                                guild_id: Optional[str] = None,
+                                nick: Optional[str] = None) -> str:
+        """
+        Sends a MESSAGE_CREATE event to every connected session
+        :return: the id of the dispatched message
+        """
+        message_id = str(next(self._message_ids))
+        self.dispatch("MESSAGE_CREATE", {
+            "id": message_id,
+            "type": 0,
+            "content": content,
+            "channel_id": channel_id or self.channel_ids[0],
+            "guild_id": guild_id or self.guild_ids[0],
+            "author": {"id": user_id, "username": username, "discriminator": "0000"},
+            "member": {"nick": nick, "roles": [], "joined_at": "2021-07-01T00:00:00.000000+00:00"},
+            "timestamp": "2021-07-01T00:00:00.000000+00:00",
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": [],
+            "embeds": [],
+            "pinned": False
+        })
+        return message_id
+
+    def generate_traffic(self,
+                         events_per_s: float,
+                         duration_in_s: float,
+                         contents: tuple = ("!points",),
+                         users_count: int = 1000) -> int:
+        """
+        Dispatches MESSAGE_CREATE events at a steady rate, drawing content and author at random.
+        :return: the number of events dispatched
+        """
+        self.connected_event.wait()
+        interval = 1.0 / events_per_s
+        started_at = monotonic()
+        dispatched = 0
+        while monotonic() - started_at < duration_in_s:
+            user_id = str(10_000 + randrange(users_count))
+            self.dispatch_message_create(choice(contents), user_id=user_id, username=f"player-{user_id}")
+            dispatched += 1
+            delay = started_at + dispatched * interval - monotonic()
+            gevent.sleep(max(delay, 0))
+        return dispatched
+
+    # REST
+    def __call__(self, environ, start_response):
+        environ["fake_discord"] = self
+        path = environ.get("PATH_INFO", "")
+        if path == FAKE_DISCORD_GATEWAY_PATH:
+            return self._gateway(environ, start_response)
+
+        self.rest_requests_count += 1
+        if self.rest_latency_in_s > 0:
+            gevent.sleep(self.rest_latency_in_s)
+
+        if not environ.get("HTTP_AUTHORIZATION", "").startswith("Bot "):
+            return self._json_response(start_response, "401 Unauthorized", {"message": "401: Unauthorized", "code": 0})
+
+        if self._is_rate_limited():
+            self.rate_limited_count += 1
+            return self._json_response(start_response, "429 Too Many Requests",
+                                       {"message": "You are being rate limited.", "retry_after": 1.0, "global": False},
+                                       [("Retry-After", "1"), ("X-RateLimit-Remaining", "0")])
+
+        route = path[len(f"/api/v{self.api_version}"):] if path.startswith(f"/api/v{self.api_version}/") else None
+        method = environ.get("REQUEST_METHOD")
+
+        if method == "GET" and route == DISCORD_GATEWAY_PATH:
+            return self._json_response(start_response, "200 OK", {
+                "url": self.gateway_url,
+                "shards": 1,
+                "session_start_limit": {"total": 1000, "remaining": 1000, "reset_after": 0, "max_concurrency": 1}
+            })
+
+        if method == "GET" and route == DISCORD_CURRENT_USER_PATH:
+            return self._json_response(start_response, "200 OK", FAKE_DISCORD_BOT_USER)
+
+        create_message = CREATE_MESSAGE_PATH_PATTERN.match(route or "")
+        if method == "POST" and create_message:
+            body = environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0))
+            message = dict(json.loads(body or b"{}"),
+                           id=str(next(self._message_ids)),
+                           channel_id=create_message.group("channel_id"),
+                           author=FAKE_DISCORD_BOT_USER)
+            self.message_posted(message)
+            return self._json_response(start_response, "200 OK", message)
+
+        follow_up = FOLLOW_UP_PATH_PATTERN.match(route or "")
+        if method == "POST" and follow_up:
+            body = environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0))
+            message = dict(json.loads(body or b"{}"),
+                           id=str(next(self._message_ids)),
+                           interaction_token=follow_up.group("interaction_token"),
+                           author=FAKE_DISCORD_BOT_USER)
+            self.message_posted(message)
+            return self._json_response(start_response, "200 OK", message)
+
+        return self._json_response(start_response, "404 Not Found", {"message": "404: Not Found", "code": 0})
+
+    def message_posted(self, message: dict) -> None:
+        self.posted_messages.append(message)
+        self.posted_messages_count += 1
+        self.last_message_posted_at = monotonic()
+
+    def _is_rate_limited(self) -> bool:
+        if self.rate_limit_per_s <= 0:
+            return False
+        window_start, count = self._rate_limit_window
+        now = monotonic()
+        if now - window_start >= 1:
+            window_start, count = now, 0
+        self._rate_limit_window = (window_start, count + 1)
+        return count >= self.rate_limit_per_s
+
+    @staticmethod
+    def _json_response(start_response, status: str, body: dict, headers: Optional[list] = None):
+        content = json.dumps(body).encode("utf-8")
+        start_response(status, [("Content-Type", "application/json"),
+                                ("Content-Length", str(len(content)))] + (headers or []))
+        return [content]
+
+
+def main():
+    from gevent import monkey
+    monkey.patch_all()
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--rest-latency", type=float, default=0.0, help="REST latency in seconds")
+    parser.add_argument("--rate-limit", type=int, default=0, help="REST requests allowed per second (0: unlimited)")
+    parser.add_argument("--events-per-s", type=float, default=0, help="synthetic MESSAGE_CREATE rate (0: none)")
+    parser.add_argument("--duration", type=float, default=60, help="synthetic traffic duration in seconds")
+    parser.add_argument("--users", type=int, default=1000, help="number of distinct synthetic authors")
+    parser.add_argument("--content", action="append", help="message content to send (repeatable)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+    fake_discord = FakeDiscord(host=args.host,
+                               port=args.port,
+                               rest_latency_in_s=args.rest_latency,
+                               rate_limit_per_s=args.rate_limit)
+    fake_discord.start()
+
+    if args.events_per_s > 0:
+        fake_discord.connected_event.wait()
+        started_at = monotonic()
+        dispatched = fake_discord.generate_traffic(events_per_s=args.events_per_s,
+                                                   duration_in_s=args.duration,
+                                                   contents=tuple(args.content or ("!points", "!roulette")),
+                                                   users_count=args.users)
+        gevent.sleep(1)
+        logger.info(f"dispatched {dispatched} events, received {fake_discord.posted_messages_count} messages, "
+                    f"rate limited {fake_discord.rate_limited_count} requests")
+        print(json.dumps({
+            "dispatched": dispatched,
+            "posted": fake_discord.posted_messages_count,
+            "rate_limited": fake_discord.rate_limited_count,
+            "elapsed_s": (fake_discord.last_message_posted_at or started_at) - started_at
+        }), flush=True)
+        fake_discord.stop()
+    else:
+        gevent.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Outbound side of a gateway connection: commands are serialized by the greenlet sending them, queued by priority,
+then written by a single writer greenlet, so that concurrent senders never interleave on the socket.
+The writer spends tokens from a bucket refilled at Discord's gateway rate limit (120 commands per 60 s),
+a few of them being kept for heartbeats: other commands can not starve the connection of its heartbeats.
+"""
+import itertools
+import logging
+from collections import deque
+from time import monotonic
+from typing import Callable
+
+from gevent.event import Event
+from gevent.queue import PriorityQueue
+
+logger = logging.getLogger(__name__)
+
+GATEWAY_SEND_LIMIT = 120
+GATEWAY_SEND_PERIOD_IN_S = 60
+HEARTBEAT_RESERVED_TOKENS = 3
+SEND_LATENCIES_WINDOW = 1024
+
+HEARTBEAT_PRIORITY = 0
+IDENTIFY_PRIORITY = 1
+DEFAULT_PRIORITY = 2
+
+
+class TokenBucket:
+    """
+    Holds up to capacity tokens, refilled continuously at capacity tokens per period_in_s
+    """
+
+    def __init__(self,
+                 capacity: int = GATEWAY_SEND_LIMIT,
+                 period_in_s: float = GATEWAY_SEND_PERIOD_IN_S,
+                 clock: Callable[[], float] = monotonic):
+        self.capacity = capacity
+        self.rate_per_s = capacity / period_in_s
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._refilled_at = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._refilled_at) * self.rate_per_s)
+        self._refilled_at = now
+
+    def take(self, reserved: int = 0) -> float:
+        """
+        Takes a token if more than reserved tokens are available
+        :return: 0 if a token was taken, otherwise the delay in seconds before one can be
+        """
+        self._refill()
+        if self._tokens >= reserved + 1:
+            self._tokens -= 1
+            return 0.0
+        return (reserved + 1 - self._tokens) / self.rate_per_s
+
+
+class GatewaySender:
+    """
+    Send queue of a gateway connection. websocket must provide send_frame(frame: str).
+    """
+
+    def __init__(self,
+                 websocket,
+                 bucket: TokenBucket = None,
+                 clock: Callable[[], float] = monotonic):
+        self.websocket = websocket
+        self.bucket = TokenBucket(clock=clock) if bucket is None else bucket
+        self._clock = clock
+        self._queue = PriorityQueue()
+        # keeps commands of the same priority in sending order
+        self._sequence = itertools.count()
+        self.sent_count = 0
+        self.rate_limited_count = 0
+        self.max_queue_depth = 0
+        self._latencies = deque(maxlen=SEND_LATENCIES_WINDOW)
+        # set when a command that may go before the rate limited one is queued
+        self._overtaken = Event()
+        self._waiting_priority = None
+
+    def send(self, command, priority: int = DEFAULT_PRIORITY) -> None:
+        """
+        Queues command, that is serialized right away
+        """
+        self._queue.put((priority, next(self._sequence), self._clock(), str(command)))
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        if self._waiting_priority is not None and priority < self._waiting_priority:
+            self._overtaken.set()
+
+    def run(self) -> None:
+        """
+        Writer loop, to be run by a single greenlet per connection
+        """
+        while True:
+            item = self._queue.get()
+            priority = item[0]
+            delay = self.bucket.take(reserved=0 if priority == HEARTBEAT_PRIORITY else HEARTBEAT_RESERVED_TOKENS)
+            if delay > 0:
+                # a heartbeat queued in the meantime goes first, without waiting for the delay to be over
+                self.rate_limited_count += 1
+                self._queue.put(item)
+                logger.warning(f"gateway send rate limit reached, waiting {delay:.2f} s")
+                self._overtaken.clear()
+                self._waiting_priority = priority
+                try:
+                    self._overtaken.wait(timeout=delay)
+                finally:
+                    self._waiting_priority = None
+                continue
+            _, _, queued_at, frame = item
+            self.websocket.send_frame(frame)
+            self._latencies.append(self._clock() - queued_at)
+            self.sent_count += 1
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "sent": self.sent_count,
+            "rate_limited": self.rate_limited_count,
+            "latency_p50_ms": round(latencies[len(latencies) // 2] * 1000, 3) if latencies else None,
+            "latency_p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 3) if latencies else None
+        }
@@ -0,0 +1,141 @@
+"""
+Embedded HTTP endpoint telling an orchestrator whether bots are alive and ready, with live runtime stats.
+
+    GET /live   200 unless a connected bot stopped receiving heartbeat ACKs (it should be restarted)
+    GET /ready  200 once every bot is connected, with recent heartbeat ACKs and a short event queue
+                (or, for a bot receiving its commands as interactions, once its endpoint is listening)
+    GET /stats  JSON runtime stats: running tasks (greenlets spawned by this package), RSS, and per bot state
+                (including the gateway send queue)
+
+Everything is computed when a request comes in, from state the clients keep anyway, except the running tasks:
+once the server is started, each task spawned by this package is also added to a weak set (see profiling.track_tasks).
+Start the server before the bots, so that their first tasks are counted.
+The server runs on the gevent hub, it is meant for the gevent backend.
+"""
+import json
+import logging
+import os
+import resource
+from time import monotonic
+from typing import Optional
+
+from gevent.pywsgi import WSGIServer
+
+from .bot import Bot, bots
+from .profiling import running_tasks_count, track_tasks
+
+logger = logging.getLogger(__name__)
+
+HEALTH_DEFAULT_PORT = 8081
+HEALTH_MAX_QUEUE_DEPTH = 1000
+# heartbeat intervals without ACK after which a bot is no longer ready, then no longer alive
+READY_ACK_INTERVALS = 2
+LIVE_ACK_INTERVALS = 5
+
+
+def rss_in_kb() -> int:
+    """
+    :return: the current resident set size, or the peak one where /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class HealthServer:
+
+    def __init__(self,
+                 host: str = "0.0.0.0",
+                 port: int = HEALTH_DEFAULT_PORT,
+                 max_queue_depth: int = HEALTH_MAX_QUEUE_DEPTH,
+                 bots_by_token: Optional[dict] = None):
+        self.host = host
+        self.port = port
+        self.max_queue_depth = max_queue_depth
+        self.bots_by_token = bots if bots_by_token is None else bots_by_token
+        self._server: Optional[WSGIServer] = None
+
+    def start(self) -> None:
+        track_tasks()
+        self._server = WSGIServer((self.host, self.port), self, log=None)
+        self._server.start()
+        self.port = self._server.server_port
+        logger.info(f"health endpoint listening on {self.host}:{self.port}")
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.stop()
+
+    @staticmethod
+    def bot_state(bot: Bot) -> dict:
+        discord_client = bot.discord_client
+        connected_event = discord_client.connected_to_gateway_event
+        event_queue = discord_client.event_queue
+        pending_count = getattr(discord_client.scheduler, "pending_count", None)
+        last_ack_at = discord_client.last_heartbeat_ack_at
+        gateway_sender = getattr(discord_client, "gateway_sender", None)
+        interactions_server = bot.interactions_server
+        return {
+            "bot": bot.storage_name(bot.token),
+            "interactions": None if interactions_server is None else {
+                "serving": interactions_server.serving,
+                "received": interactions_server.interactions_count,
+                "rejected": interactions_server.rejected_count,
+                "replayed": interactions_server.replayed_count
+            },
+            "connected": connected_event is not None and connected_event.is_set(),
+            "heartbeat_interval_s": (discord_client.heartbeat_interval_in_ms or 0) / 1000,
+            "last_ack_age_s": None if last_ack_at is None else round(monotonic() - last_ack_at, 3),
+            "queue_depth": 0 if event_queue is None else event_queue.qsize(),
+            "cooldowns": sum(len(callback.disarmed_users) for callback in discord_client.callbacks()),
+            "scheduled_tasks": pending_count() if pending_count is not None else None,
+            "lanes": len(discord_client.lanes) if discord_client.lanes is not None else 0,
+            "seen_messages": len(discord_client.seen_messages),
+            "gateway_sender": gateway_sender.stats() if gateway_sender is not None else None,
+            "entities": discord_client.entities.stats() if discord_client.entities is not None else None
+        }
+
+    def is_ready(self, state: dict) -> bool:
+        if state["interactions"] is not None:
+            # there is no gateway connection to wait for
+            return state["interactions"]["serving"]
+        return state["connected"] \
+               and state["last_ack_age_s"] is not None \
+               and state["last_ack_age_s"] <= READY_ACK_INTERVALS * state["heartbeat_interval_s"] \
+               and state["queue_depth"] <= self.max_queue_depth
+
+    @staticmethod
+    def is_alive(state: dict) -> bool:
+        # a bot that is still connecting is alive, a connected one whose heartbeats are not ACKed any more is not
+        return not state["connected"] \
+               or state["last_ack_age_s"] is None \
+               or state["last_ack_age_s"] <= LIVE_ACK_INTERVALS * state["heartbeat_interval_s"]
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        states = [self.bot_state(bot) for bot in list(self.bots_by_token.values())]
+
+        if path == "/live":
+            ok = all(self.is_alive(state) for state in states)
+            return self._json_response(start_response, ok, {"live": ok, "bots": states})
+        if path == "/ready":
+            ok = bool(states) and all(self.is_ready(state) for state in states)
+            return self._json_response(start_response, ok, {"ready": ok, "bots": states})
+        if path == "/stats":
+            return self._json_response(start_response, True, {
+                "pid": os.getpid(),
+                "rss_kb": rss_in_kb(),
+                "tasks": running_tasks_count(),
+                "bots": states
+            })
+        start_response("404 Not Found", [("Content-Type", "text/plain")])
+        return [b"not found"]
+
+    @staticmethod
+    def _json_response(start_response, ok: bool, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        start_response("200 OK" if ok else "503 Service Unavailable",
+                       [("Content-Type", "application/json"), ("Content-Length", str(len(payload)))])
+        return [payload]
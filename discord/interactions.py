@@ -0,0 +1,212 @@
+"""
+HTTP interactions endpoint: Discord POSTs slash commands to it instead of sending MESSAGE_CREATE over the gateway.
+
+Requests are verified with the application's Ed25519 public key, then APPLICATION_COMMAND interactions are routed
+to the handlers of the same registry as gateway commands (the /roulette slash command runs the "!roulette" handler),
+on the gevent hub. What a handler responds while it runs is sent back inline in the HTTP response; what it responds
+later (from a scheduled continuation) is posted as a follow-up message of the interaction.
+No gateway connection is needed, so several instances can serve the same application behind a load balancer.
+Signed requests older than INTERACTION_MAX_AGE_IN_S are rejected, and an interaction is only handled once by an
+instance. The ids of the handled interactions are only kept in the memory of that instance: unless a load balancer
+routes the interactions of a guild to the same instance, a captured request can be replayed to another instance
+(or to a restarted one) until it is INTERACTION_MAX_AGE_IN_S old.
+
+Slash commands must be registered with Discord, under the names of the bot's commands without their "!".
+"""
+import json
+import logging
+from time import time
+from typing import Callable, List, Optional
+
+from gevent import Greenlet
+from gevent.pywsgi import WSGIServer
+
+from .discord_client import DiscordClient, Message, DISCORD_INTERACTION_FOLLOW_UP_PATH
+from .dispatch import SeenSet
+from .profiling import spawn
+from .user import users
+
+logger = logging.getLogger(__name__)
+
+INTERACTIONS_DEFAULT_PORT = 8082
+INTERACTIONS_PATH = "/interactions"
+COMMAND_PREFIX = "!"
+# how far the signature timestamp of a request may be from the local clock, either way
+INTERACTION_MAX_AGE_IN_S = 5 * 60
+
+PING_INTERACTION = 1
+APPLICATION_COMMAND_INTERACTION = 2
+
+PONG_RESPONSE = 1
+CHANNEL_MESSAGE_WITH_SOURCE_RESPONSE = 4
+DEFERRED_CHANNEL_MESSAGE_WITH_SOURCE_RESPONSE = 5
+
+# only the user who ran the command sees the response
+EPHEMERAL_MESSAGE_FLAG = 1 << 6
+
+
+class InteractionMessage(Message):
+    """
+    Message standing for an APPLICATION_COMMAND interaction: responses are collected for the HTTP response
+    while its handler runs, then posted as follow-up messages.
+    """
+
+    __slots__ = ("application_id", "interaction_token", "inline_responses")
+
+    def __init__(self,
+                 interaction: dict,
+                 content: str,
+                 discord_client: DiscordClient):
+        user = (interaction.get("member") or {}).get("user") or interaction.get("user") or {}
+        super().__init__(interaction.get("id", ""),
+                         interaction.get("channel_id", "0"),
+                         interaction.get("guild_id"),
+                         users.intern(user.get("id", ""), user.get("username")),
+                         content,
+                         discord_client)
+        self.application_id = interaction.get("application_id")
+        self.interaction_token = interaction.get("token")
+        self.inline_responses: Optional[List[str]] = []
+
+    def respond(self, response: str) -> Optional[Greenlet]:
+        if self.inline_responses is not None:
+            self.inline_responses.append(response)
+            return None
+        return spawn("rest:follow-up", self._follow_up, response)
+
+    def _follow_up(self, response: str) -> None:
+        result = self.discord_client.session.post(
+            url=self.discord_client.api_url(ressource_path=DISCORD_INTERACTION_FOLLOW_UP_PATH.format(
+                application_id=self.application_id, interaction_token=self.interaction_token)),
+            headers=self.discord_client.header,
+            json={"content": response}
+        )
+        logger.debug(f"follow-up result={result}, reason={result.reason}")
+
+
+class InteractionsServer:
+    """
+    WSGI endpoint of the interactions of a bot's application
+    :param public_key: hex encoded Ed25519 public key of the application, from the developer portal
+    """
+
+    def __init__(self,
+                 discord_client: DiscordClient,
+                 public_key: str,
+                 host: str = "0.0.0.0",
+                 port: int = INTERACTIONS_DEFAULT_PORT,
+                 path: str = INTERACTIONS_PATH,
+                 max_age_in_s: float = INTERACTION_MAX_AGE_IN_S,
+                 clock: Callable[[], float] = time):
+        from nacl.signing import VerifyKey
+        self.discord_client = discord_client
+        self.verify_key = VerifyKey(bytes.fromhex(public_key))
+        self.host = host
+        self.port = port
+        self.path = path
+        self.max_age_in_s = max_age_in_s
+        self._clock = clock
+        # remembers ids for at least max_age_in_s: older requests are rejected by their timestamp anyway.
+        # They are not shared with other instances, nor kept across restarts.
+        self.seen_interactions = SeenSet(window_in_s=2 * max_age_in_s)
+        self.interactions_count = 0
+        self.rejected_count = 0
+        self.replayed_count = 0
+        self._server: Optional[WSGIServer] = None
+
+    @property
+    def serving(self) -> bool:
+        return self._server is not None and self._server.started
+
+    def start(self) -> None:
+        self._server = WSGIServer((self.host, self.port), self, log=None)
+        self._server.start()
+        self.port = self._server.server_port
+        logger.info(f"interactions endpoint listening on {self.host}:{self.port}{self.path}")
+
+    def serve_forever(self) -> None:
+        if self._server is None:
+            self.start()
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.stop()
+
+    def verified(self, signature: str, timestamp: str, body: bytes) -> bool:
+        """
+        :return: True if body and timestamp are signed by the application's key, and timestamp is recent
+        """
+        from nacl.exceptions import BadSignatureError
+        try:
+            self.verify_key.verify(timestamp.encode("utf-8") + body, bytes.fromhex(signature))
+            return abs(self._clock() - int(timestamp)) <= self.max_age_in_s
+        except (BadSignatureError, ValueError):
+            return False
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO") != self.path or environ.get("REQUEST_METHOD") != "POST":
+            return self._json_response(start_response, "404 Not Found", {"message": "not found"})
+
+        body = environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0))
+        # Discord checks that requests with an invalid signature are rejected before using an endpoint
+        if not self.verified(environ.get("HTTP_X_SIGNATURE_ED25519", ""),
+                             environ.get("HTTP_X_SIGNATURE_TIMESTAMP", ""),
+                             body):
+            self.rejected_count += 1
+            return self._json_response(start_response, "401 Unauthorized", {"message": "invalid request signature"})
+
+        try:
+            interaction = json.loads(body)
+        except ValueError:
+            return self._json_response(start_response, "400 Bad Request", {"message": "invalid JSON"})
+
+        interaction_id = interaction.get("id")
+        if interaction_id is not None and self.seen_interactions.seen(interaction_id):
+            self.replayed_count += 1
+            return self._json_response(start_response, "409 Conflict", {"message": "interaction already received"})
+
+        self.interactions_count += 1
+        if interaction.get("type") == PING_INTERACTION:
+            return self._json_response(start_response, "200 OK", {"type": PONG_RESPONSE})
+        if interaction.get("type") == APPLICATION_COMMAND_INTERACTION:
+            return self._json_response(start_response, "200 OK", self.handle_command(interaction))
+        return self._json_response(start_response, "400 Bad Request", {"message": "unsupported interaction type"})
+
+    def handle_command(self, interaction: dict) -> dict:
+        """
+        Runs the handler of the command
+        :return: the interaction response
+        """
+        content = COMMAND_PREFIX + interaction.get("data", {}).get("name", "")
+        callback = self.discord_client.matching_callback(content)
+        if callback is None:
+            return self._ephemeral(f"Unknown command {content}")
+
+        message = InteractionMessage(interaction, content, self.discord_client)
+        if not callback.accept(message.author.id):
+            return self._ephemeral("This command is cooling down, try again later!")
+
+        try:
+            callback.callback_function(callback.caller, message)
+        except Exception:
+            logger.exception(f"{callback} failed on interaction {message.id}")
+            return self._ephemeral("Something went wrong")
+        finally:
+            responses, message.inline_responses = message.inline_responses, None
+
+        if not responses:
+            # the handler will respond later: Discord shows that the bot is thinking meanwhile
+            return {"type": DEFERRED_CHANNEL_MESSAGE_WITH_SOURCE_RESPONSE}
+        return {"type": CHANNEL_MESSAGE_WITH_SOURCE_RESPONSE, "data": {"content": "\n".join(responses)}}
+
+    @staticmethod
+    def _ephemeral(content: str) -> dict:
+        return {"type": CHANNEL_MESSAGE_WITH_SOURCE_RESPONSE,
+                "data": {"content": content, "flags": EPHEMERAL_MESSAGE_FLAG}}
+
+    @staticmethod
+    def _json_response(start_response, status: str, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        start_response(status, [("Content-Type", "application/json"), ("Content-Length", str(len(payload)))])
+        return [payload]
@@ -1,4 +1,24 @@
-from dbm import gnu
+import logging
+import os
+import shutil
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from fnmatch import fnmatch
+from time import perf_counter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PARTITIONS_COUNT = 8
+MAX_OPEN_PARTITIONS = PARTITIONS_COUNT
+PARTITION_FILE_NAME_FORMAT = "partition-{index:03d}.db"
+PARTITION_FILE_NAME_PATTERN = "partition-*.db"
+# keys are named <scope kind>.<scope id>.<key> (guild.<id>.<key> for bots): all the keys of a scope share a partition
+SCOPE_DEPTH = 2
+# keys held in memory at once by bulk deletions
+DELETE_CHUNK_SIZE = 100_000
 
 
 class KeyStringValue:
@@ -12,6 +32,14 @@ class KeyStringValue:
     def get(self, key: str, default: str = "") -> str:
         return default
 
+    def iter_keys(self, prefix: str = "") -> Iterator[str]:
+        """
+        Abstract method: streams the keys starting with prefix, in no particular order
+        :param prefix:
+        :return:
+        """
+        return iter(())
+
 
 class KeyIntValue:
     """
@@ -36,12 +64,53 @@ class KeyIntValue:
         """
         return default
 
+    def iter_int_items(self, prefix: str = "") -> Iterator[Tuple[str, int]]:
+        """
+        Streams the (key, int value) pairs whose key starts with prefix, in no particular order
+        :param prefix:
+        :return:
+        """
+        return ((key, self.get_int(key)) for key in self.iter_keys(prefix))
+
+    def iter_keys(self, prefix: str = "") -> Iterator[str]:
+        """
+        Abstract method
+        :param prefix:
+        :return:
+        """
+        return iter(())
+
     def increment_int(self, key: str, int_value: int) -> None:
         self.put_int(key, self.get_int(key, 0) + int_value)
 
     def decrement_int(self, key: str, int_value: int) -> None:
         self.put_int(key, self.get_int(key, 0) - int_value)
 
+    def put_many(self, items: Iterable[Tuple[str, int]]) -> int:
+        """
+        Stores (key, int value) pairs
+        :return: the number of stored pairs
+        """
+        count = 0
+        for (key, int_value) in items:
+            self.put_int(key, int_value)
+            count += 1
+        return count
+
+    def get_many(self, keys: Iterable[str], default: int = 0) -> Dict[str, int]:
+        """
+        Same as get_int for each key
+        """
+        return {key: self.get_int(key, default) for key in keys}
+
+    def reset(self, prefix: str) -> int:
+        """
+        Resets every key starting with prefix to 0, for instance to start a new season.
+        Keys are streamed: implementations that can not be written to while their keys are iterated override it.
+        :return: the number of reset keys
+        """
+        return self.put_many((key, 0) for key in self.iter_keys(prefix))
+
 
 class InMemoryKeyStringValue(KeyStringValue):
     """
@@ -55,12 +124,10 @@ class InMemoryKeyStringValue(KeyStringValue):
         self.dict[key] = value
 
     def get(self, key: str, default: str = "") -> str:
-        existing = self.dict.get(key)
-        if existing is None:
-            self.put(key, default)
-            return default
-        else:
-            return existing
+        return self.dict.get(key, default)
+
+    def iter_keys(self, prefix: str = "") -> Iterator[str]:
+        return (key for key in list(self.dict) if key.startswith(prefix))
 
 
 class InMemoryKeyIntValue(KeyIntValue):
@@ -75,32 +142,160 @@ class InMemoryKeyIntValue(KeyIntValue):
         self.dict[key] = int_value
 
     def get_int(self, key: str, default: int = 0) -> int:
-        existing = self.dict.get(key)
-        if existing is None:
-            self.put_int(key, default)
-            return default
-        else:
-            return existing
+        return self.dict.get(key, default)
+
+    def iter_keys(self, prefix: str = "") -> Iterator[str]:
+        return (key for key in list(self.dict) if key.startswith(prefix))
+
+    def reset(self, prefix: str) -> int:
+        keys = [key for key in self.dict if key.startswith(prefix)]
+        for key in keys:
+            del self.dict[key]
+        return len(keys)
+
+
+class CompactionReport:
+
+    def __init__(self,
+                 file_name: str,
+                 size_before: int,
+                 size_after: int,
+                 keys_before: int,
+                 keys_after: int,
+                 elapsed_in_s: float):
+        self.file_name = file_name
+        self.size_before = size_before
+        self.size_after = size_after
+        self.keys_before = keys_before
+        self.keys_after = keys_after
+        self.elapsed_in_s = elapsed_in_s
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+    def __str__(self) -> str:
+        return f"{self.file_name}: {self.size_before} -> {self.size_after} bytes, " \
+               f"{self.keys_before} -> {self.keys_after} keys in {self.elapsed_in_s * 1000:.1f} ms"
 
 
 class FileStorageKeyStringValue(KeyStringValue):
 
     def __init__(self, storage_file_name: str = "key-value.db"):
+        from dbm import gnu
+        self.gnu = gnu
+        self.storage_file_name = storage_file_name
         self.storage = gnu.open(storage_file_name, 'cs')
 
+    @contextmanager
+    def unsynchronized(self):
+        """
+        The storage is opened in synchronized mode: every write waits for the disk.
+        Bulk writes reopen it without, and only sync once they are over.
+        """
+        self.storage.close()
+        self.storage = self.gnu.open(self.storage_file_name, 'w')
+        try:
+            yield
+        finally:
+            self.storage.sync()
+            self.storage.close()
+            self.storage = self.gnu.open(self.storage_file_name, 'cs')
+
     def put(self, key: str, value: str) -> None:
         self.storage[key] = value
 
     def get(self, key: str, default: str = "") -> str:
+        """
+        A missing key is not written: reads never wait for the disk
+        """
         existing = self.storage.get(key)
-        if existing is None:
-            self.put(key, default)
-            return default
+        return default if existing is None else existing.decode("utf-8")
+
+    def iter_keys(self, prefix: str = "") -> Iterator[str]:
+        """
+        Walks the gdbm file key by key: memory does not grow with the number of keys.
+        The storage must not be written to until the iteration is over.
+        """
+        encoded_prefix = prefix.encode("utf-8")
+        key = self.storage.firstkey()
+        while key is not None:
+            if key.startswith(encoded_prefix):
+                yield key.decode("utf-8")
+            key = self.storage.nextkey(key)
+
+    def _delete_where(self, matches: Callable[[bytes], bool], chunk_size: int = DELETE_CHUNK_SIZE) -> int:
+        """
+        Deletes the keys that matches accepts, chunk_size at a time: deleting while walking gdbm may skip keys,
+        so the keys of a chunk are deleted once it is full, then the walk starts over.
+        :return: the number of deleted keys
+        """
+        deleted_count = 0
+        while True:
+            chunk = []
+            key = self.storage.firstkey()
+            while key is not None and len(chunk) < chunk_size:
+                if matches(key):
+                    chunk.append(key)
+                key = self.storage.nextkey(key)
+            for key in chunk:
+                del self.storage[key]
+            deleted_count += len(chunk)
+            if len(chunk) < chunk_size:
+                return deleted_count
+
+    def delete_keys(self, prefix: str, chunk_size: int = DELETE_CHUNK_SIZE) -> int:
+        """
+        :return: the number of deleted keys starting with prefix
+        """
+        encoded_prefix = prefix.encode("utf-8")
+        with self.unsynchronized():
+            return self._delete_where(lambda key: key.startswith(encoded_prefix), chunk_size)
+
+    def snapshot(self, snapshot_file_name: str) -> None:
+        """
+        Copies the storage file while it is open. Nothing must write to the storage until the copy is over,
+        and the snapshot only replaces snapshot_file_name once complete.
+        """
+        self.storage.sync()
+        shutil.copyfile(self.storage_file_name, snapshot_file_name + ".tmp")
+        os.replace(snapshot_file_name + ".tmp", snapshot_file_name)
+
+    def compact(self,
+                purged_value: Optional[str] = None,
+                purgeable: Optional[Callable[[str], bool]] = None) -> CompactionReport:
+        """
+        Deletes the keys holding purged_value (if given), then reorganizes the gdbm file to give back
+        the space of deleted and rewritten records.
+        :param purgeable: only the keys it accepts are deleted, all of them when not given
+        """
+        started_at = perf_counter()
+        size_before = os.path.getsize(self.storage_file_name)
+        keys_before = sum(1 for _ in self.iter_keys())
+
+        if purged_value is not None:
+            encoded_purged_value = purged_value.encode("utf-8")
+            keys_after = keys_before - self._delete_where(
+                lambda key: self.storage[key] == encoded_purged_value
+                and (purgeable is None or purgeable(key.decode("utf-8"))))
         else:
-            return existing
+            keys_after = keys_before
+
+        self.storage.reorganize()
+        self.storage.sync()
+        return CompactionReport(self.storage_file_name,
+                                size_before=size_before,
+                                size_after=os.path.getsize(self.storage_file_name),
+                                keys_before=keys_before,
+                                keys_after=keys_after,
+                                elapsed_in_s=perf_counter() - started_at)
+
+    def close(self) -> None:
+        if self.storage is not None:
+            self.storage.close()
+            self.storage = None
 
     def __del__(self) -> None:
-        self.storage.close()
+        self.close()
 
 
 class FileStorageKeyIntValue(FileStorageKeyStringValue, KeyIntValue):
@@ -114,3 +309,283 @@ class FileStorageKeyIntValue(FileStorageKeyStringValue, KeyIntValue):
     def get_int(self, key, default: int = 0):
         return int(self.get(key, str(default)))
 
+    def iter_int_items(self, prefix: str = "") -> Iterator[Tuple[str, int]]:
+        for key in self.iter_keys(prefix):
+            yield key, int(self.storage[key])
+
+    def get_many(self, keys: Iterable[str], default: int = 0) -> Dict[str, int]:
+        """
+        Reads the gdbm file only: missing keys are not written
+        """
+        values = {}
+        for key in keys:
+            existing = self.storage.get(key)
+            values[key] = default if existing is None else int(existing)
+        return values
+
+    def put_many(self, items: Iterable[Tuple[str, int]]) -> int:
+        count = 0
+        with self.unsynchronized():
+            for (key, int_value) in items:
+                self.storage[key] = str(int_value)
+                count += 1
+        return count
+
+    def reset(self, prefix: str) -> int:
+        """
+        Deletes the keys rather than storing 0: reading a missing key gives 0 back anyway
+        """
+        return self.delete_keys(prefix)
+
+    def compact(self,
+                purged_value: Optional[str] = "0",
+                purgeable: Optional[Callable[[str], bool]] = None) -> CompactionReport:
+        """
+        Also deletes the keys holding 0 by default: previous versions stored the default value of every key
+        get_int missed, and reading a missing key gives 0 back anyway.
+        """
+        return super().compact(purged_value, purgeable)
+
+
+class ScopedKeyIntValue(KeyIntValue):
+    """
+    KeyIntValue view storing its keys under a namespace of a shared KeyIntValue
+    """
+
+    def __init__(self, kv: KeyIntValue, namespace: str):
+        self.kv = kv
+        self.namespace = namespace
+
+    def put_int(self, key: str, int_value: int) -> None:
+        self.kv.put_int(self.namespace + key, int_value)
+
+    def get_int(self, key, default: int = 0):
+        return self.kv.get_int(self.namespace + key, default)
+
+    def iter_keys(self, prefix: str = "") -> Iterator[str]:
+        return (key[len(self.namespace):] for key in self.kv.iter_keys(self.namespace + prefix))
+
+    def iter_int_items(self, prefix: str = "") -> Iterator[Tuple[str, int]]:
+        return ((key[len(self.namespace):], int_value)
+                for (key, int_value) in self.kv.iter_int_items(self.namespace + prefix))
+
+    def put_many(self, items: Iterable[Tuple[str, int]]) -> int:
+        return self.kv.put_many((self.namespace + key, int_value) for (key, int_value) in items)
+
+    def get_many(self, keys: Iterable[str], default: int = 0) -> Dict[str, int]:
+        return {key[len(self.namespace):]: int_value
+                for (key, int_value) in self.kv.get_many((self.namespace + key for key in keys), default).items()}
+
+    def reset(self, prefix: str) -> int:
+        return self.kv.reset(self.namespace + prefix)
+
+
+class PartitionedFileStorageKeyIntValue(KeyIntValue):
+    """
+    KeyIntValue spread over partitions_count gdbm files of a directory, each key being stored in the partition
+    selected by a stable hash of its scope (its first scope_depth dot separated parts), or of the whole key when
+    it has no scope. Listing the keys of a scope only walks its partition.
+    Partitions are opened on first use and the least recently used ones that are not in use are closed once more than
+    max_open_partitions are open. Each partition has its own lock, so that writers of different partitions
+    never wait for each other.
+    """
+
+    def __init__(self,
+                 storage_directory: str,
+                 partitions_count: int = PARTITIONS_COUNT,
+                 max_open_partitions: int = MAX_OPEN_PARTITIONS,
+                 scope_depth: int = SCOPE_DEPTH):
+        """
+        :param scope_depth: 0 spreads the keys of a scope over every partition
+        """
+        os.makedirs(storage_directory, exist_ok=True)
+        self.storage_directory = storage_directory
+        self.partitions_count = partitions_count
+        self.scope_depth = scope_depth
+        self.max_open_partitions = max_open_partitions
+        # open partitions by index, least recently used first
+        self._partitions = OrderedDict()
+        self._partitions_lock = threading.Lock()
+        self._locks = [threading.RLock() for _ in range(partitions_count)]
+        # number of blocks using each partition: locks are reentrant, they do not tell whether a partition is in use
+        self._users_counts = [0] * partitions_count
+
+    def scope(self, key: str) -> Optional[str]:
+        """
+        :return: the scope of a key, or of every key starting with a prefix, None when it is not complete
+        """
+        if not self.scope_depth:
+            return None
+        parts = key.split(".", self.scope_depth)
+        if len(parts) <= self.scope_depth:
+            return None
+        return ".".join(parts[:self.scope_depth]) + "."
+
+    def partition_index(self, key: str) -> int:
+        scope = self.scope(key)
+        return zlib.crc32((key if scope is None else scope).encode("utf-8")) % self.partitions_count
+
+    def partition_file_name(self, index: int) -> str:
+        return os.path.join(self.storage_directory, PARTITION_FILE_NAME_FORMAT.format(index=index))
+
+    @staticmethod
+    def holds_partitions(storage_directory: str) -> bool:
+        """
+        :return: whether storage_directory exists and holds partition files, without creating it
+        """
+        return os.path.isdir(storage_directory) and any(
+            fnmatch(file_name, PARTITION_FILE_NAME_PATTERN) for file_name in os.listdir(storage_directory))
+
+    def open_partitions_count(self) -> int:
+        return len(self._partitions)
+
+    def existing_partitions_count(self) -> int:
+        """
+        :return: the number of partition files of the directory, 0 for a storage that was never written to
+        """
+        return sum(1 for _ in self._existing_partitions())
+
+    @contextmanager
+    def _partition(self, index: int) -> Iterator[FileStorageKeyIntValue]:
+        """
+        Locks the partition and opens it: it is not closed until the block is over
+        """
+        with self._locks[index]:
+            with self._partitions_lock:
+                partition = self._partitions.get(index)
+                if partition is None:
+                    partition = FileStorageKeyIntValue(self.partition_file_name(index))
+                    self._partitions[index] = partition
+                else:
+                    self._partitions.move_to_end(index)
+                self._users_counts[index] += 1
+                self._close_idle_partitions()
+            try:
+                yield partition
+            finally:
+                with self._partitions_lock:
+                    self._users_counts[index] -= 1
+
+    def _close_idle_partitions(self) -> None:
+        """
+        Closes least recently used partitions that are not in use, until at most max_open_partitions are open.
+        Partitions in use (the one being opened included) are skipped rather than waited for,
+        since their users may be waiting for us.
+        Must be called holding the partitions lock.
+        """
+        for index in list(self._partitions):
+            if len(self._partitions) <= self.max_open_partitions:
+                return
+            if not self._users_counts[index]:
+                self._partitions.pop(index).close()
+
+    def put_int(self, key: str, int_value: int) -> None:
+        index = self.partition_index(key)
+        with self._partition(index) as partition:
+            partition.put_int(key, int_value)
+
+    def get_int(self, key, default: int = 0):
+        index = self.partition_index(key)
+        with self._partition(index) as partition:
+            return partition.get_int(key, default)
+
+    def increment_int(self, key: str, int_value: int) -> None:
+        index = self.partition_index(key)
+        with self._partition(index) as partition:
+            partition.increment_int(key, int_value)
+
+    def decrement_int(self, key: str, int_value: int) -> None:
+        index = self.partition_index(key)
+        with self._partition(index) as partition:
+            partition.decrement_int(key, int_value)
+
+    def _existing_partitions(self, prefix: str = "") -> Iterator[int]:
+        """
+        :return: the partitions that may hold keys starting with prefix
+        """
+        indexes = range(self.partitions_count) if self.scope(prefix) is None else [self.partition_index(prefix)]
+        return (index for index in indexes if os.path.exists(self.partition_file_name(index)))
+
+    def iter_keys(self, prefix: str = "") -> Iterator[str]:
+        """
+        Streams partitions one after the other, each one being locked while it is walked
+        """
+        for index in self._existing_partitions(prefix):
+            with self._partition(index) as partition:
+                yield from partition.iter_keys(prefix)
+
+    def iter_int_items(self, prefix: str = "") -> Iterator[Tuple[str, int]]:
+        for index in self._existing_partitions(prefix):
+            with self._partition(index) as partition:
+                yield from partition.iter_int_items(prefix)
+
+    def _by_partition(self, pairs: Iterable[tuple]) -> Dict[int, list]:
+        by_partition = {}
+        for pair in pairs:
+            by_partition.setdefault(self.partition_index(pair[0]), []).append(pair)
+        return by_partition
+
+    def put_many(self, items: Iterable[Tuple[str, int]], chunk_size: int = 10_000) -> int:
+        """
+        Writes items by chunks of chunk_size, each chunk taking the lock of a partition once for all its keys
+        """
+        count = 0
+        items = iter(items)
+        while True:
+            chunk = [item for (_, item) in zip(range(chunk_size), items)]
+            if not chunk:
+                return count
+            for (index, partition_items) in self._by_partition(chunk).items():
+                with self._partition(index) as partition:
+                    partition.put_many(partition_items)
+            count += len(chunk)
+
+    def get_many(self, keys: Iterable[str], default: int = 0) -> Dict[str, int]:
+        values = {}
+        for (index, partition_keys) in self._by_partition((key,) for key in keys).items():
+            with self._partition(index) as partition:
+                values.update(partition.get_many((key for (key,) in partition_keys), default))
+        return values
+
+    def reset(self, prefix: str) -> int:
+        """
+        Locks every partition that may hold keys starting with prefix before deleting keys from any of them:
+        no reader sees some of the keys reset and others not.
+        It is not crash atomic though, take a snapshot first to be able to roll back.
+        """
+        with ExitStack() as stack:
+            # locks are always taken in index order, so that two resets can not deadlock
+            partitions = [stack.enter_context(self._partition(index)) for index in self._existing_partitions(prefix)]
+            count = sum(partition.reset(prefix) for partition in partitions)
+        logger.info(f"reset {count} keys starting with {prefix!r}")
+        return count
+
+    def snapshot(self, snapshot_directory: str) -> None:
+        """
+        Copies partitions one after the other while the storage stays online: each partition is consistent,
+        and only its own writers wait for its copy.
+        """
+        os.makedirs(snapshot_directory, exist_ok=True)
+        for index in self._existing_partitions():
+            with self._partition(index) as partition:
+                partition.snapshot(os.path.join(snapshot_directory, os.path.basename(
+                    self.partition_file_name(index))))
+
+    def compact(self,
+                purged_value: Optional[str] = "0",
+                purgeable: Optional[Callable[[str], bool]] = None) -> List[CompactionReport]:
+        """
+        Compacts partitions one after the other, so that writers only wait for the compaction of their partition
+        """
+        reports = []
+        for index in self._existing_partitions():
+            with self._partition(index) as partition:
+                report = partition.compact(purged_value, purgeable)
+            logger.info(f"compacted {report}")
+            reports.append(report)
+        return reports
+
+    def close(self) -> None:
+        with self._partitions_lock:
+            while self._partitions:
+                self._partitions.popitem()[1].close()
@@ -0,0 +1,241 @@
+import logging
+from itertools import islice
+from random import Random
+from typing import Iterable, Iterator, Optional, Tuple
+
+from .key_value import KeyIntValue
+
+logger = logging.getLogger(__name__)
+
+SKIP_LIST_MAX_LEVELS = 32
+PUT_MANY_CHUNK_SIZE = 10_000
+
+
+class _SkipListNode:
+
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, levels: int):
+        self.key = key
+        self.next = [None] * levels
+        # number of positions to the next node on each level (the end of the list being one past the last node)
+        self.width = [1] * levels
+
+
+class IndexableSkipList:
+    """
+    Sorted collection of unique keys with O(log n) insertion, removal, rank and positional access
+    """
+
+    def __init__(self, seed: Optional[int] = None):
+        self._head = _SkipListNode(None, SKIP_LIST_MAX_LEVELS)
+        self._size = 0
+        self._random = Random(seed)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _random_levels(self) -> int:
+        levels = 1
+        while levels < SKIP_LIST_MAX_LEVELS and self._random.random() < 0.5:
+            levels += 1
+        return levels
+
+    def _chain(self, key) -> tuple:
+        """
+        :return: the last node before key on each level, and the position of each of those nodes
+        """
+        chain = [None] * SKIP_LIST_MAX_LEVELS
+        positions = [0] * SKIP_LIST_MAX_LEVELS
+        node = self._head
+        position = 0
+        for level in reversed(range(SKIP_LIST_MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+            positions[level] = position
+        return chain, positions
+
+    def insert(self, key) -> None:
+        chain, positions = self._chain(key)
+        position = positions[0] + 1
+        node = _SkipListNode(key, self._random_levels())
+        for level in range(len(node.next)):
+            previous = chain[level]
+            node.next[level] = previous.next[level]
+            previous.next[level] = node
+            node.width[level] = positions[level] + previous.width[level] - position + 1
+            previous.width[level] = position - positions[level]
+        for level in range(len(node.next), SKIP_LIST_MAX_LEVELS):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key) -> None:
+        chain, _ = self._chain(key)
+        node = chain[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        for level in range(len(node.next)):
+            previous = chain[level]
+            previous.width[level] += node.width[level] - 1
+            previous.next[level] = node.next[level]
+        for level in range(len(node.next), SKIP_LIST_MAX_LEVELS):
+            chain[level].width[level] -= 1
+        self._size -= 1
+
+    def index(self, key) -> int:
+        """
+        :return: the 0-based position of key
+        """
+        chain, positions = self._chain(key)
+        node = chain[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        return positions[0]
+
+    def iterate_from(self, index: int) -> Iterator:
+        """
+        Iterates over keys in order, starting at the given 0-based position
+        """
+        node = self._head
+        remaining = index + 1
+        for level in reversed(range(SKIP_LIST_MAX_LEVELS)):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        if remaining:
+            return
+        while node is not None:
+            yield node.key
+            node = node.next[0]
+
+    @classmethod
+    def from_sorted(cls, keys, seed: Optional[int] = None):
+        """
+        Builds a skip list in O(n) from keys that are already sorted and unique
+        """
+        skip_list = cls(seed)
+        tails = [skip_list._head] * SKIP_LIST_MAX_LEVELS
+        tail_positions = [0] * SKIP_LIST_MAX_LEVELS
+        position = 0
+        for key in keys:
+            position += 1
+            node = _SkipListNode(key, skip_list._random_levels())
+            for level in range(len(node.next)):
+                tails[level].next[level] = node
+                tails[level].width[level] = position - tail_positions[level]
+                tails[level] = node
+                tail_positions[level] = position
+        for level in range(SKIP_LIST_MAX_LEVELS):
+            tails[level].width[level] = position + 1 - tail_positions[level]
+        skip_list._size = position
+        return skip_list
+
+
+class Leaderboard(KeyIntValue):
+    """
+    KeyIntValue decorator keeping an order statistic index of the int values stored under a key prefix.
+    Scores stay persisted by the decorated storage; the index is rebuilt from it by a streaming scan
+    when the leaderboard is created, then updated on every put_int (and so every increment_int/decrement_int)
+    and put_many. Reads do not rank anyone.
+    Ranking is by descending score, ties being broken by ascending id.
+    """
+
+    def __init__(self,
+                 kv: KeyIntValue,
+                 prefix: str,
+                 scores: Optional[dict] = None):
+        """
+        :param scores: scores by id already read from kv under prefix, so that it is not scanned again
+        """
+        self.kv = kv
+        self.prefix = prefix
+        if scores is None:
+            self._rebuild()
+        else:
+            self._index(scores)
+
+    def _rebuild(self) -> None:
+        self._index({key[len(self.prefix):]: score for (key, score) in self.kv.iter_int_items(self.prefix)})
+        logger.info(f"leaderboard {self.prefix} rebuilt with {len(self.scores)} entries")
+
+    def _index(self, scores: dict) -> None:
+        self.scores = scores
+        self.index = IndexableSkipList.from_sorted(sorted((-score, id) for (id, score) in scores.items()))
+
+    def put_int(self, key: str, int_value: int) -> None:
+        self.kv.put_int(key, int_value)
+        if key.startswith(self.prefix):
+            self._update(key[len(self.prefix):], int_value)
+
+    def get_int(self, key, default: int = 0):
+        if key.startswith(self.prefix):
+            # scores under the prefix are all in memory: reading one neither hits nor writes the decorated storage,
+            # so a player who only reads their score does not get ranked
+            return self.scores.get(key[len(self.prefix):], default)
+        return self.kv.get_int(key, default)
+
+    def iter_int_items(self, prefix: str = ""):
+        return self.kv.iter_int_items(prefix)
+
+    def iter_keys(self, prefix: str = "") -> Iterator[str]:
+        return self.kv.iter_keys(prefix)
+
+    def put_many(self, items: Iterable[Tuple[str, int]]) -> int:
+        """
+        Stores items by chunks of PUT_MANY_CHUNK_SIZE, the index being updated once each chunk is stored
+        """
+        count = 0
+        items = iter(items)
+        while True:
+            chunk = list(islice(items, PUT_MANY_CHUNK_SIZE))
+            if not chunk:
+                return count
+            count += self.kv.put_many(chunk)
+            for (key, int_value) in chunk:
+                if key.startswith(self.prefix):
+                    self._update(key[len(self.prefix):], int_value)
+
+    def reset(self, prefix: str) -> int:
+        count = self.kv.reset(prefix)
+        # the scores under the prefix are all in memory: the reset ones are dropped without scanning the storage
+        if self.prefix.startswith(prefix):
+            self._index({})
+        elif prefix.startswith(self.prefix):
+            id_prefix = prefix[len(self.prefix):]
+            for id in [id for id in self.scores if id.startswith(id_prefix)]:
+                self.index.remove((-self.scores.pop(id), id))
+        return count
+
+    def _update(self, id: str, score: int) -> None:
+        previous_score = self.scores.get(id)
+        if previous_score == score:
+            return
+        if previous_score is not None:
+            self.index.remove((-previous_score, id))
+        self.index.insert((-score, id))
+        self.scores[id] = score
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def rank(self, id: str) -> Optional[int]:
+        """
+        :return: the 1-based rank of id, or None if it has no score
+        """
+        score = self.scores.get(id)
+        if score is None:
+            return None
+        return self.index.index((-score, id)) + 1
+
+    def top(self, count: int, start_rank: int = 1) -> list:
+        """
+        :return: up to count (rank, id, score) tuples, starting at start_rank
+        """
+        top = []
+        for (rank, (negated_score, id)) in enumerate(self.index.iterate_from(start_rank - 1), start=start_rank):
+            if len(top) >= count:
+                break
+            top.append((rank, id, -negated_score))
+        return top
@@ -0,0 +1,177 @@
+"""
+Runs CPU-bound command handlers in worker processes, so that they do not stall the gateway.
+
+Handlers registered with Bot.register_command(..., executor="process") are called in a worker with
+a bare instance of the bot class (no storage, no client) and a picklable MessageContext.
+The replies they make are sent back to the calling process, which posts them on the original message.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import traceback
+from inspect import unwrap
+from typing import Optional
+
+from gevent import monkey, socket
+
+from .discord_client import DiscordError, Message
+from .user import User
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessCommandError(DiscordError):
+    def __init__(self, handler_name: str, remote_traceback: str):
+        self.handler_name = handler_name
+        self.remote_traceback = remote_traceback
+        super().__init__(f"Handler {handler_name} failed in worker process:\n{remote_traceback}")
+
+
+class MessageContext:
+    """
+    Picklable stand-in for a Message, recording replies instead of posting them
+    """
+
+    __slots__ = ("id", "channel_id", "guild_id", "author", "content", "responses")
+
+    def __init__(self,
+                 id: str,
+                 channel_id: str,
+                 guild_id: Optional[str],
+                 author: User,
+                 content: str):
+        self.id = id
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.author = author
+        self.content = content
+        self.responses = []
+
+    @classmethod
+    def of(cls, message: Message):
+        return cls(message.id, message.channel_id, message.guild_id, message.author, message.content)
+
+    def __getstate__(self):
+        return self.id, self.channel_id, self.guild_id, self.author, self.content, self.responses
+
+    def __setstate__(self, state):
+        self.id, self.channel_id, self.guild_id, self.author, self.content, self.responses = state
+
+    def respond(self, response: str) -> None:
+        self.responses.append((response, 0))
+
+    def respond_later(self, response: str, delay_in_s: float) -> None:
+        self.responses.append((response, delay_in_s))
+
+    def replay_on(self, message: Message) -> None:
+        """
+        Posts the recorded replies on the original message
+        """
+        for (response, delay_in_s) in self.responses:
+            if delay_in_s > 0:
+                message.respond_later(response, delay_in_s)
+            else:
+                message.respond(response)
+
+
+def _worker_main(requests, results) -> None:
+    while True:
+        try:
+            bot_class, handler_name, context = requests.recv()
+        except EOFError:
+            return
+        try:
+            handler = unwrap(getattr(bot_class, handler_name))
+            handler(bot_class.__new__(bot_class), context)
+            results.send((True, context.responses))
+        except Exception:
+            results.send((False, traceback.format_exc()))
+
+
+class ProcessWorker:
+
+    def __init__(self, context: multiprocessing.context.BaseContext):
+        # one-way OS pipes: a duplex Pipe is a socket pair, that gevent would hand over non blocking to the worker
+        worker_requests, self.requests = context.Pipe(duplex=False)
+        self.results, worker_results = context.Pipe(duplex=False)
+        self.process = context.Process(target=_worker_main, args=(worker_requests, worker_results), daemon=True)
+        self.process.start()
+        worker_requests.close()
+        worker_results.close()
+
+    def call(self, bot_class: type, handler_name: str, context: MessageContext) -> tuple:
+        self.requests.send((bot_class, handler_name, context))
+        if monkey.is_module_patched("socket"):
+            # waits on the hub instead of blocking every greenlet
+            socket.wait_read(self.results.fileno())
+        return self.results.recv()
+
+    def stop(self) -> None:
+        self.requests.close()
+        self.results.close()
+        self.process.join(timeout=1)
+
+
+class ProcessCommandPool:
+    """
+    Pool of worker processes started on first use.
+    Calls block their greenlet (or thread, out of gevent) until a worker is available and has replied.
+    """
+
+    def __init__(self, processes: Optional[int] = None):
+        self.processes = processes or os.cpu_count() or 1
+        self._context = multiprocessing.get_context("spawn")
+        self._idle_workers = queue.Queue()
+        self._started_workers = 0
+
+    def _start_worker(self) -> None:
+        """
+        Starts a worker, that is only counted once it is idle:
+        a worker that failed to start does not leave a slot that no worker will ever fill
+        """
+        self._started_workers += 1
+        try:
+            worker = ProcessWorker(self._context)
+        except BaseException:
+            self._started_workers -= 1
+            raise
+        self._idle_workers.put(worker)
+
+    def run(self, bot_class: type, handler_name: str, context: MessageContext) -> MessageContext:
+        if self._idle_workers.empty() and self._started_workers < self.processes:
+            self._start_worker()
+
+        worker = self._idle_workers.get()
+        worker_died = False
+        try:
+            succeeded, result = worker.call(bot_class, handler_name, context)
+        except (EOFError, OSError):
+            logger.exception(f"worker process {worker.process.pid} died running {handler_name}")
+            worker_died = True
+            raise
+        finally:
+            if not worker_died:
+                self._idle_workers.put(worker)
+            else:
+                worker.stop()
+                self._started_workers -= 1
+                try:
+                    self._start_worker()
+                except Exception:
+                    # the next call starts a worker in its place
+                    logger.exception(f"could not replace worker process {worker.process.pid}")
+
+        if not succeeded:
+            raise ProcessCommandError(f"{bot_class.__name__}.{handler_name}", result)
+        context.responses = result
+        return context
+
+    def stop(self) -> None:
+        while self._started_workers:
+            self._idle_workers.get().stop()
+            self._started_workers -= 1
+
+
+# Worker processes shared by every bot running in this process
+process_pool = ProcessCommandPool()
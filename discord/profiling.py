@@ -0,0 +1,166 @@
+"""
+Opt-in profiling of the gevent runtime.
+
+Every greenlet spawned by this package is named after the task it runs (reader, dispatcher, heartbeat,
+handler:<command>, rest:post...). GreenletProfiler traces greenlet switches to attribute CPU time to those
+names, and watches the hub from a native thread to report greenlets that block it for longer than a threshold,
+with their stack. Reports are logged on demand, e.g. when the process receives SIGUSR1.
+"""
+import json
+import logging
+import signal
+import sys
+import traceback
+from collections import defaultdict, deque
+from time import perf_counter, thread_time
+from typing import Callable, Optional
+from weakref import WeakSet
+
+import gevent
+import greenlet
+from gevent import Greenlet
+from gevent.hub import Hub
+from gevent.monkey import get_original
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOCKING_THRESHOLD_IN_S = 0.1
+BLOCKING_REPORTS_SIZE = 100
+
+
+# tasks started by spawn() once tracking is on (see track_tasks), until they are garbage collected
+spawned_tasks: Optional[WeakSet] = None
+
+
+def track_tasks() -> None:
+    """
+    Keeps track of the tasks spawned from now on, for running_tasks_count: spawn() does not pay for it otherwise
+    """
+    global spawned_tasks
+    if spawned_tasks is None:
+        spawned_tasks = WeakSet()
+
+
+def spawn(name: str, function: Callable, *args, **kwargs) -> Greenlet:
+    """
+    Same as gevent.spawn, with a task name the profiler attributes CPU time to.
+    """
+    task = Greenlet(function, *args, **kwargs)
+    task.name = name
+    task.start()
+    if spawned_tasks is not None:
+        spawned_tasks.add(task)
+    return task
+
+
+def running_tasks_count() -> Optional[int]:
+    """
+    :return: the number of tasks started by spawn() since tracking is on that are not over, without walking the heap,
+    None when tasks are not tracked
+    """
+    if spawned_tasks is None:
+        return None
+    return sum(1 for task in list(spawned_tasks) if not task.dead)
+
+
+def task_name(task) -> str:
+    if isinstance(task, Greenlet):
+        return task.name
+    elif isinstance(task, Hub):
+        return "hub"
+    elif task is not None and task.parent is None:
+        return "main"
+    else:
+        return task.__class__.__name__
+
+
+class GreenletProfiler:
+
+    def __init__(self,
+                 blocking_threshold_in_s: float = DEFAULT_BLOCKING_THRESHOLD_IN_S):
+        self.blocking_threshold_in_s = blocking_threshold_in_s
+
+        self.cpu_time_by_task = defaultdict(float)
+        self.switches_by_task = defaultdict(int)
+        self.blocking_reports = deque(maxlen=BLOCKING_REPORTS_SIZE)
+
+        self._switch_count = 0
+        self._last_switch_cpu_time = thread_time()
+        self._last_switch_wall_time = perf_counter()
+        self._current_task = greenlet.getcurrent()
+        self._previous_tracer = None
+        self._monitored_thread_id = None
+        self._running = False
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self._current_task = greenlet.getcurrent()
+        self._last_switch_cpu_time = thread_time()
+        self._last_switch_wall_time = perf_counter()
+        self._previous_tracer = greenlet.settrace(self._trace)
+        self._monitored_thread_id = get_original("_thread", "get_ident")()
+        get_original("_thread", "start_new_thread")(self._monitor_hub, ())
+        logger.info(f"greenlet profiling started, reporting hub blocking over {self.blocking_threshold_in_s}s")
+
+    def stop(self) -> None:
+        if self._running:
+            self._running = False
+            greenlet.settrace(self._previous_tracer)
+
+    def install_signal_handler(self, signal_number: int = signal.SIGUSR1) -> None:
+        gevent.signal_handler(signal_number, self.dump)
+
+    def _trace(self, event: str, args: tuple) -> None:
+        if event in ("switch", "throw"):
+            origin, target = args
+            cpu_time = thread_time()
+            origin_name = task_name(origin)
+            self.cpu_time_by_task[origin_name] += cpu_time - self._last_switch_cpu_time
+            self.switches_by_task[origin_name] += 1
+            self._last_switch_cpu_time = cpu_time
+            self._last_switch_wall_time = perf_counter()
+            self._current_task = target
+            self._switch_count += 1
+        if self._previous_tracer is not None:
+            self._previous_tracer(event, args)
+
+    def _monitor_hub(self) -> None:
+        sleep = get_original("time", "sleep")
+        reported_switch = None
+        while self._running:
+            sleep(self.blocking_threshold_in_s / 2)
+            switch_count = self._switch_count
+            current_task = self._current_task
+            blocked_for = perf_counter() - self._last_switch_wall_time
+            if switch_count == reported_switch or blocked_for < self.blocking_threshold_in_s \
+                    or isinstance(current_task, Hub):
+                continue
+            frame = sys._current_frames().get(self._monitored_thread_id)
+            if frame is None or switch_count != self._switch_count:
+                continue
+            reported_switch = switch_count
+            report = {
+                "task": task_name(current_task),
+                "blocked_for_s": round(blocked_for, 3),
+                "stack": traceback.format_stack(frame)
+            }
+            self.blocking_reports.append(report)
+            logger.warning(f"hub blocked for {report['blocked_for_s']}s by {report['task']}:\n"
+                           f"{''.join(report['stack'])}")
+
+    def report(self) -> dict:
+        tasks = sorted(self.cpu_time_by_task.items(), key=lambda item: item[1], reverse=True)
+        return {
+            "cpu_time_s_by_task": {name: round(cpu_time, 6) for (name, cpu_time) in tasks},
+            "switches_by_task": dict(self.switches_by_task),
+            "blocking_reports": list(self.blocking_reports)
+        }
+
+    def dump(self, file_name: Optional[str] = None) -> None:
+        report = json.dumps(self.report(), indent=2)
+        if file_name:
+            with open(file_name, "w") as report_file:
+                report_file.write(report)
+        logger.warning(f"greenlet profile:\n{report}")
@@ -0,0 +1,94 @@
+import heapq
+import itertools
+import logging
+from time import monotonic
+from typing import Callable, Optional
+
+from gevent import Greenlet
+from gevent.event import Event
+
+from .profiling import spawn
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledTask:
+
+    __slots__ = ("deadline", "function", "args", "cancelled")
+
+    def __init__(self,
+                 deadline: float,
+                 function: Callable,
+                 args: tuple):
+        self.deadline = deadline
+        self.function = function
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        self.function = None
+        self.args = ()
+
+    def __str__(self) -> str:
+        return f"ScheduledTask({getattr(self.function, '__name__', self.function)}, deadline={self.deadline})"
+
+
+class Scheduler:
+    """
+    A single timer queue shared by every delayed task.
+    Pending tasks are kept in a heap and a single greenlet sleeps until the earliest deadline,
+    so a delayed task costs a heap entry instead of a sleeping greenlet.
+    """
+
+    def __init__(self):
+        self._tasks = []
+        self._sequence = itertools.count()
+        self._wakeup_event = Event()
+        self._runner: Optional[Greenlet] = None
+
+    def schedule(self,
+                 delay_in_s: float,
+                 function: Callable,
+                 *args) -> ScheduledTask:
+        """
+        Calls function(*args) in a new greenlet once delay_in_s seconds have elapsed.
+        :param delay_in_s:
+        :param function:
+        :param args:
+        :return: the scheduled task, that can be cancelled
+        """
+        task = ScheduledTask(monotonic() + max(delay_in_s, 0), function, args)
+        heapq.heappush(self._tasks, (task.deadline, next(self._sequence), task))
+        if self._tasks[0][2] is task:
+            self._wakeup_event.set()
+        self._ensure_running()
+        return task
+
+    def pending_count(self) -> int:
+        return len(self._tasks)
+
+    def _ensure_running(self) -> None:
+        if self._runner is None or self._runner.dead:
+            self._runner = spawn("scheduler", self._run)
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup_event.clear()
+            if not self._tasks:
+                self._wakeup_event.wait()
+                continue
+
+            timeout = self._tasks[0][0] - monotonic()
+            if timeout > 0:
+                self._wakeup_event.wait(timeout)
+                continue
+
+            _, _, task = heapq.heappop(self._tasks)
+            if not task.cancelled:
+                logger.debug(f"firing {task}")
+                spawn(f"scheduled:{getattr(task.function, '__name__', 'task')}", task.function, *task.args)
+
+
+# Timer queue shared by every bot running in this process
+scheduler = Scheduler()
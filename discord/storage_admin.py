@@ -0,0 +1,134 @@
+"""
+Bulk operations on the storage of a bot (season resets, backups, moving points between bots),
+streamed in chunks so that millions of keys are handled in constant memory.
+Points are exported and imported as newline delimited JSON, one {"key": ..., "value": ...} object per line.
+
+The bot must be stopped first: a gdbm file is opened by a single writer at a time.
+
+    PYTHONPATH=. python -m discord.storage_admin export storage/<bot> --prefix guild. > points.ndjson
+    PYTHONPATH=. python -m discord.storage_admin import storage/<other bot> < points.ndjson
+    PYTHONPATH=. python -m discord.storage_admin reset storage/<bot> --prefix guild.
+    PYTHONPATH=. python -m discord.storage_admin migrate-legacy key-value.db storage/<bot> --prefix guild.<guild id>.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from time import perf_counter
+from typing import Iterator, TextIO, Tuple
+
+from .key_value import FileStorageKeyIntValue, KeyIntValue, PartitionedFileStorageKeyIntValue, ScopedKeyIntValue
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = 10_000
+MIGRATED_LEGACY_STORAGE_SUFFIX = ".migrated"
+
+
+def export_ndjson(kv: KeyIntValue,
+                  output: TextIO,
+                  prefix: str = "",
+                  chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """
+    Writes the keys starting with prefix to output, chunk_size lines at a time
+    :return: the number of exported keys
+    """
+    count = 0
+    lines = []
+    for (key, int_value) in kv.iter_int_items(prefix):
+        lines.append(f'{{"key": {json.dumps(key)}, "value": {int_value}}}\n')
+        if len(lines) >= chunk_size:
+            output.writelines(lines)
+            count += len(lines)
+            lines.clear()
+    output.writelines(lines)
+    return count + len(lines)
+
+
+def iter_ndjson(lines: TextIO) -> Iterator[Tuple[str, int]]:
+    """
+    Streams the (key, int value) pairs of an export, blank lines being skipped
+    """
+    for (line_number, line) in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            yield record["key"], int(record["value"])
+        except (ValueError, KeyError, TypeError) as error:
+            raise ValueError(f"line {line_number} is not a points record: {error}") from error
+
+
+def import_ndjson(kv: KeyIntValue, lines: TextIO) -> int:
+    """
+    :return: the number of imported keys, existing keys being overwritten
+    """
+    return kv.put_many(iter_ndjson(lines))
+
+
+def migrate_legacy_storage(legacy_storage_file_name: str, kv: KeyIntValue) -> int:
+    """
+    Streams every key of the single gdbm file of previous versions into kv (a scoped view, since those keys have
+    no guild), then renames the file with MIGRATED_LEGACY_STORAGE_SUFFIX so that it is only migrated once
+    :return: the number of migrated keys
+    """
+    if not os.path.exists(legacy_storage_file_name):
+        # opening it would create an empty one
+        raise FileNotFoundError(legacy_storage_file_name)
+    legacy_kv = FileStorageKeyIntValue(legacy_storage_file_name)
+    try:
+        count = kv.put_many(legacy_kv.iter_int_items())
+    finally:
+        legacy_kv.close()
+    os.rename(legacy_storage_file_name, legacy_storage_file_name + MIGRATED_LEGACY_STORAGE_SUFFIX)
+    logger.info(f"migrated {count} keys of {legacy_storage_file_name}")
+    return count
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="writes keys as newline delimited JSON")
+    export_parser.add_argument("storage_directory")
+    export_parser.add_argument("--prefix", default="", help="only the keys starting with it")
+    export_parser.add_argument("--output", type=argparse.FileType("w"), default=sys.stdout)
+    import_parser = subparsers.add_parser("import", help="stores keys read as newline delimited JSON")
+    import_parser.add_argument("storage_directory")
+    import_parser.add_argument("--input", type=argparse.FileType("r"), default=sys.stdin)
+    reset_parser = subparsers.add_parser("reset", help="resets keys to 0, all at once")
+    reset_parser.add_argument("storage_directory")
+    reset_parser.add_argument("--prefix", required=True, help="the keys starting with it")
+    migrate_parser = subparsers.add_parser("migrate-legacy", help="imports the key-value.db of previous versions")
+    migrate_parser.add_argument("legacy_storage_file_name")
+    migrate_parser.add_argument("storage_directory")
+    migrate_parser.add_argument("--prefix", required=True, help="stored under it, guild.<guild id>. for instance")
+    args = parser.parse_args()
+
+    if args.command in ("export", "reset") and not PartitionedFileStorageKeyIntValue.holds_partitions(
+            args.storage_directory):
+        # opening the storage would create an empty one, and succeed with 0 keys
+        logger.error(f"{args.storage_directory} is not a storage directory: it holds no partition")
+        sys.exit(1)
+    kv = PartitionedFileStorageKeyIntValue(args.storage_directory)
+    started_at = perf_counter()
+    try:
+        if args.command == "export":
+            count = export_ndjson(kv, args.output, args.prefix)
+            args.output.flush()
+        elif args.command == "import":
+            count = import_ndjson(kv, args.input)
+        elif args.command == "migrate-legacy":
+            count = migrate_legacy_storage(args.legacy_storage_file_name, ScopedKeyIntValue(kv, args.prefix))
+        else:
+            count = kv.reset(args.prefix)
+    finally:
+        kv.close()
+    elapsed = perf_counter() - started_at
+    logger.info(f"{args.command}: {count} keys in {elapsed:.3f} s "
+                f"({count / elapsed if elapsed > 0 else 0:.0f} keys/s)")
+
+
+if __name__ == "__main__":
+    main()
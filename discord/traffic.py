@@ -0,0 +1,297 @@
+"""
+Records raw gateway traffic to a compact binary log, and replays it into a DiscordClient's reader.
+
+A log starts with TRAFFIC_LOG_MAGIC and is followed by records:
+a little endian header (timestamp as a double, payload length as an unsigned int, flags as a byte), then the payload.
+With compression, the payloads of a recording session are chunks of a single zlib stream, flushed at each frame:
+frames share the compression context, which matters for small JSON frames that repeat the same keys.
+Recording appends to an existing log, a new session restarting the zlib stream (FLAG_STREAM_START).
+A record cut short by a killed recorder is dropped when the log is next opened for recording, and readers skip
+the rest of a session they can not decode, resuming at the next one.
+
+    DISCORD_ROULETTE_RECORD_TRAFFIC=traffic.log python bot.py                    # record what the bot receives
+    PYTHONPATH=. python -m discord.traffic stats traffic.log
+    PYTHONPATH=. python -m discord.traffic replay traffic.log --speed 10          # 10x the recorded pace
+    PYTHONPATH=. python -m discord.traffic replay traffic.log --speed 0           # as fast as possible
+"""
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+from collections import Counter
+from time import monotonic, time
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+import gevent
+
+from .discord_client import DiscordClient, DiscordGatewayCommand, DiscordGatewayConnectionError
+from .profiling import spawn
+
+logger = logging.getLogger(__name__)
+
+TRAFFIC_LOG_MAGIC = b"DGWL\x01"
+RECORD_HEADER = struct.Struct("<dIB")
+RECORDER_FLUSH_INTERVAL_IN_S = 1.0
+
+FLAG_COMPRESSED = 1
+FLAG_STREAM_START = 2
+
+
+class TrafficLogError(DiscordGatewayConnectionError):
+    pass
+
+
+class TrafficRecorder:
+    """
+    Appends gateway frames to a traffic log. Writes are buffered, call flush() or close() to persist them.
+    """
+
+    def __init__(self,
+                 file_name: str,
+                 compress: bool = True):
+        self.file_name = file_name
+        self.compress = compress
+        self.frames_count = 0
+        self._file: BinaryIO = open(file_name, "ab")
+        complete_length = TrafficLog(file_name).complete_length()
+        if complete_length < self._file.tell():
+            logger.warning(f"dropping the {self._file.tell() - complete_length} bytes of a truncated record "
+                           f"at the end of {file_name}")
+            self._file.truncate(complete_length)
+        if complete_length == 0:
+            self._file.write(TRAFFIC_LOG_MAGIC)
+        self._compressor = zlib.compressobj() if compress else None
+        self._stream_started = False
+        self._flushed_at = monotonic()
+
+    def record(self, frame: str, timestamp: Optional[float] = None) -> None:
+        payload = frame.encode("utf-8")
+        flags = 0
+        if self._compressor is not None:
+            payload = self._compressor.compress(payload) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            flags = FLAG_COMPRESSED
+            if not self._stream_started:
+                flags |= FLAG_STREAM_START
+                self._stream_started = True
+        self._file.write(RECORD_HEADER.pack(time() if timestamp is None else timestamp, len(payload), flags))
+        self._file.write(payload)
+        self.frames_count += 1
+        if monotonic() - self._flushed_at > RECORDER_FLUSH_INTERVAL_IN_S:
+            self.flush()
+
+    def flush(self) -> None:
+        self._file.flush()
+        self._flushed_at = monotonic()
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+
+class TrafficLog:
+    """
+    Reads a traffic log through a memory map: large logs are paged in by the OS as they are read,
+    instead of being loaded in memory.
+    """
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+
+    def __iter__(self) -> Iterator[Tuple[float, str]]:
+        """
+        :return: (timestamp, frame) pairs in recording order
+        """
+        with open(self.file_name, "rb") as log_file:
+            if os.fstat(log_file.fileno()).st_size <= len(TRAFFIC_LOG_MAGIC):
+                return
+            with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+                if log[:len(TRAFFIC_LOG_MAGIC)] != TRAFFIC_LOG_MAGIC:
+                    raise TrafficLogError(f"{self.file_name} is not a traffic log")
+                yield from self._records(log)
+
+    def complete_length(self) -> int:
+        """
+        :return: the length of the log up to the end of its last complete record, 0 for an empty log
+        """
+        if not os.path.exists(self.file_name):
+            return 0
+        with open(self.file_name, "rb") as log_file:
+            if os.fstat(log_file.fileno()).st_size <= len(TRAFFIC_LOG_MAGIC):
+                return 0
+            with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+                if log[:len(TRAFFIC_LOG_MAGIC)] != TRAFFIC_LOG_MAGIC:
+                    raise TrafficLogError(f"{self.file_name} is not a traffic log")
+                end = len(TRAFFIC_LOG_MAGIC)
+                for (_, _, _, end) in self._raw_records(log):
+                    pass
+                return end
+
+    @staticmethod
+    def _raw_records(log: mmap.mmap) -> Iterator[Tuple[float, int, int, int]]:
+        """
+        :return: the timestamp, flags, payload offset and end offset of each complete record
+        """
+        offset = len(TRAFFIC_LOG_MAGIC)
+        size = len(log)
+        while offset + RECORD_HEADER.size <= size:
+            timestamp, length, flags = RECORD_HEADER.unpack_from(log, offset)
+            offset += RECORD_HEADER.size
+            if offset + length > size:
+                logger.warning("traffic log ends with a truncated record")
+                return
+            yield timestamp, flags, offset, offset + length
+            offset += length
+
+    @classmethod
+    def _records(cls, log: mmap.mmap) -> Iterator[Tuple[float, str]]:
+        decompressor = None
+        for (timestamp, flags, start, end) in cls._raw_records(log):
+            payload = log[start:end]
+            try:
+                if flags & FLAG_COMPRESSED:
+                    if flags & FLAG_STREAM_START:
+                        decompressor = zlib.decompressobj()
+                    elif decompressor is None:
+                        # the session could not be decoded: resuming at the next one
+                        continue
+                    payload = decompressor.decompress(payload)
+                frame = payload.decode("utf-8")
+            except (zlib.error, UnicodeDecodeError) as error:
+                logger.warning(f"skipping the rest of a corrupted recording session at offset {start}: {error}")
+                decompressor = None
+                continue
+            yield timestamp, frame
+
+
+class ReplayWebSocket:
+    """
+    Stands for the gateway websocket of a DiscordClient, receiving the frames of a traffic log.
+    :param speed: 1 replays at the recorded pace, 10 ten times faster, 0 as fast as possible
+    """
+
+    def __init__(self,
+                 log: TrafficLog,
+                 speed: float = 1.0):
+        self.speed = speed
+        self.frames_count = 0
+        self._records = iter(log)
+        self._first_timestamp: Optional[float] = None
+        self._started_at = 0.0
+
+    def receive(self) -> str:
+        record = next(self._records, None)
+        if record is None:
+            raise TrafficLogError("end of traffic log")
+        timestamp, frame = record
+        if self._first_timestamp is None:
+            self._first_timestamp = timestamp
+            self._started_at = monotonic()
+        elif self.speed > 0:
+            delay = self._started_at + (timestamp - self._first_timestamp) / self.speed - monotonic()
+            if delay > 0:
+                gevent.sleep(delay)
+        self.frames_count += 1
+        return frame
+
+    def send(self, command: DiscordGatewayCommand) -> None:
+        pass
+
+    def send_frame(self, frame: str) -> None:
+        pass
+
+
+def replay(discord_client: DiscordClient,
+           log_file_name: str,
+           speed: float = 1.0) -> int:
+    """
+    Feeds a traffic log into the reader of a client that is not connected to a gateway,
+    then waits for the dispatcher to have handled every event.
+    :return: the number of frames replayed
+    """
+    websocket = ReplayWebSocket(TrafficLog(log_file_name), speed)
+    discord_client.websocket = websocket
+    discord_client.connected_to_gateway_event.set()
+    dispatcher = spawn("dispatcher", discord_client.handle_events)
+    try:
+        discord_client.queue_events()
+    except TrafficLogError:
+        pass
+    while not discord_client.event_queue.empty():
+        gevent.sleep(0.01)
+    # lets the handlers spawned for the last events run
+    gevent.idle()
+    dispatcher.kill()
+    return websocket.frames_count
+
+
+def stats(log_file_name: str) -> dict:
+    event_types = Counter()
+    frames_count = 0
+    first_timestamp = last_timestamp = None
+    for (timestamp, frame) in TrafficLog(log_file_name):
+        frames_count += 1
+        first_timestamp = timestamp if first_timestamp is None else first_timestamp
+        last_timestamp = timestamp
+        payload = json.loads(frame)
+        event_types[payload.get("t") or f"op:{payload.get('op')}"] += 1
+    duration = (last_timestamp - first_timestamp) if frames_count else 0.0
+    return {
+        "frames": frames_count,
+        "duration_s": round(duration, 3),
+        "frames_per_s": round(frames_count / duration, 1) if duration > 0 else None,
+        "file_size": os.path.getsize(log_file_name),
+        "event_types": dict(event_types)
+    }
+
+
+def main():
+    from gevent import monkey
+    monkey.patch_all()
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    stats_parser = subparsers.add_parser("stats", help="frames, duration and event types of a traffic log")
+    stats_parser.add_argument("log")
+    replay_parser = subparsers.add_parser("replay", help="replays a traffic log through the dispatch path")
+    replay_parser.add_argument("log")
+    replay_parser.add_argument("--speed", type=float, default=1.0,
+                               help="pace relative to the recording, 0 for as fast as possible (default: 1)")
+    replay_parser.add_argument("--reply-to", action="append",
+                               help="command answered by the replaying client (repeatable, default: !roulette, !points)")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        print(json.dumps(stats(args.log), indent=2))
+        return
+
+    # replies are posted to a local fake Discord, so that replaying never reaches discord.com
+    from .fake_discord import FakeDiscord
+    fake_discord = FakeDiscord()
+    fake_discord.start()
+
+    class Replier:
+        def reply(self, message) -> None:
+            message.respond("replayed")
+
+    discord_client = DiscordClient(token="replay", base_url=fake_discord.api_base_url)
+    for command in args.reply_to or ("!roulette", "!points"):
+        discord_client.register_callback(command, Replier(), Replier.reply)
+
+    started_at = monotonic()
+    frames_count = replay(discord_client, args.log, speed=args.speed)
+    elapsed = monotonic() - started_at
+    gevent.sleep(1)
+    fake_discord.stop()
+    print(json.dumps({
+        "frames": frames_count,
+        "elapsed_s": round(elapsed, 3),
+        "frames_per_s": round(frames_count / elapsed, 1) if elapsed > 0 else None,
+        "posted": fake_discord.posted_messages_count
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
 import logging
+from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
+USER_CACHE_SIZE = 10_000
+
 
 class User:
 
+    __slots__ = ("id", "name")
+
     def __init__(self,
                  id: str,
                  name: str):
@@ -13,3 +18,38 @@ class User:
 
     def mention(self):
         return str(self.name)
+
+    def __repr__(self) -> str:
+        return f"User({self.id}, {self.name})"
+
+
+class UserCache:
+    """
+    Bounded intern cache of User by id: recently active users are shared by every message they send,
+    least recently seen ones are evicted once max_size is reached.
+    """
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE):
+        self.max_size = max_size
+        self._users = OrderedDict()
+
+    def intern(self,
+               id: str,
+               name: str) -> User:
+        user = self._users.get(id)
+        if user is None:
+            user = User(id, name)
+            self._users[id] = user
+            if len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(id)
+            if user.name != name:
+                user.name = name
+        return user
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+
+users = UserCache()
@@ -0,0 +1,200 @@
+"""
+Russian roulette game engine: rules, trigger pulls drawn from seeded streams, and a Monte-Carlo simulation
+to check the odds and the points economics.
+
+    python roulette.py --plays 10000000 --players 10000 --seed 42
+"""
+import argparse
+import hashlib
+import json
+import logging
+import secrets
+from math import sqrt
+from random import Random
+from time import perf_counter
+from typing import Optional
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+BULLETS_COUNT = 6
+WIN_POINTS_REWARD = 1
+DEATH_POINTS_PENALTY = 3
+
+OUTCOMES_BATCH_SIZE = 4096
+SIMULATION_CHUNK_SIZE = 1_000_000
+# a death rate further than this many standard errors from 1 / BULLETS_COUNT fails the simulation
+ODDS_TOLERANCE_IN_STANDARD_ERRORS = 4
+
+
+def derive_seed(seed: Optional[int], name: str) -> int:
+    """
+    Seed of the stream called name: streams derived from the same seed are independent but reproducible.
+    Without a seed, a random one is drawn.
+    """
+    if seed is None:
+        return secrets.randbits(64)
+    return int.from_bytes(hashlib.sha256(f"{seed}:{name}".encode("utf-8")).digest()[:8], "little")
+
+
+class OutcomeStream:
+    """
+    Trigger pulls of a seeded stream: the chamber facing the barrel, 0 being the one holding the bullet.
+    Chambers are drawn in batches (with NumPy when it is installed) into a buffer that pulls are served from,
+    each batch from a seed of its own derived from the stream's seed and the batch index.
+    A stream replays the same pulls for the same seed, batch size and backend: logging the seed and
+    the pulls count is enough to audit an outcome. A restarted stream resumes where it stopped with skip(),
+    or at the batch following the last one it drew with resume(), without drawing the previous batches.
+    """
+
+    def __init__(self,
+                 seed: Optional[int] = None,
+                 bullets_count: int = BULLETS_COUNT,
+                 batch_size: int = OUTCOMES_BATCH_SIZE,
+                 use_numpy: bool = numpy is not None):
+        self.seed = derive_seed(None, "") if seed is None else seed
+        self.bullets_count = bullets_count
+        self.batch_size = batch_size
+        self.pulls_count = 0
+        # batches drawn so far, that is the index of the next batch
+        self.batches_count = 0
+        if use_numpy:
+            self._draw = self._draw_with_numpy
+        else:
+            self._chambers = range(bullets_count)
+            self._draw = self._draw_with_random
+        self._buffer = b""
+        self._position = 0
+
+    def _draw_with_numpy(self, seed: int, count: int):
+        return numpy.random.default_rng(seed).integers(0, self.bullets_count, size=count, dtype=numpy.uint8)
+
+    def _draw_with_random(self, seed: int, count: int) -> bytes:
+        return bytes(Random(seed).choices(self._chambers, k=count))
+
+    def _draw_batch(self, count: int):
+        batch_seed = derive_seed(self.seed, f"batch-{self.batches_count}")
+        self.batches_count += 1
+        return self._draw(batch_seed, count)
+
+    def pull(self) -> int:
+        """
+        :return: the chamber fired, 0 meaning the player dies
+        """
+        if self._position == len(self._buffer):
+            self._buffer = bytes(self._draw_batch(self.batch_size))
+            self._position = 0
+        chamber = self._buffer[self._position]
+        self._position += 1
+        self.pulls_count += 1
+        return chamber
+
+    def skip(self, count: int) -> None:
+        """
+        Skips count pulls so that the next pull is the same as without skipping: only its batch is drawn
+        """
+        available = len(self._buffer) - self._position
+        if count <= available:
+            self._position += count
+        else:
+            full_batches, rest = divmod(count - available, self.batch_size)
+            self.batches_count += full_batches
+            # after whole batches, the buffer is left exhausted as pull() leaves it
+            self._buffer = bytes(self._draw_batch(self.batch_size)) if rest else b""
+            self._position = rest
+        self.pulls_count += count
+
+    def resume(self, batches_count: int) -> None:
+        """
+        Restarts the stream after batches_count batches were drawn: the next pull is the first of the next batch.
+        The pulls left in the last batch drawn are never served, none of the previous pulls is replayed.
+        """
+        self.batches_count = batches_count
+        self.pulls_count = batches_count * self.batch_size
+        self._buffer = b""
+        self._position = 0
+
+    def draw(self, count: int):
+        """
+        Draws count chambers at once as a batch of their own, bypassing the buffer
+        (a NumPy array, or bytes without NumPy)
+        """
+        return self._draw_batch(count)
+
+
+def points_of(chamber: int) -> int:
+    return -DEATH_POINTS_PENALTY if chamber == 0 else WIN_POINTS_REWARD
+
+
+def simulate(plays: int,
+             players: int = 1,
+             seed: Optional[int] = None,
+             use_numpy: bool = numpy is not None) -> dict:
+    """
+    Plays plays trigger pulls, spread evenly over players, and checks the death rate against 1 / BULLETS_COUNT
+    :return: the observed odds, the points per play, and the distribution of the players' final points
+    """
+    stream = OutcomeStream(seed=seed, use_numpy=use_numpy)
+    plays_per_player = plays // players
+    started_at = perf_counter()
+    deaths_count = 0
+    scores = numpy.zeros(players, dtype=numpy.int64) if use_numpy else [0] * players
+    for chunk_start in range(0, plays_per_player * players, SIMULATION_CHUNK_SIZE):
+        chunk_size = min(SIMULATION_CHUNK_SIZE, plays_per_player * players - chunk_start)
+        chambers = stream.draw(chunk_size)
+        # plays are dealt to players round robin, so that chunks need not be aligned on players
+        first_player = chunk_start % players
+        if use_numpy:
+            deaths = chambers == 0
+            deaths_count += int(deaths.sum())
+            points = numpy.where(deaths, -DEATH_POINTS_PENALTY, WIN_POINTS_REWARD)
+            numpy.add.at(scores, (numpy.arange(chunk_size) + first_player) % players, points)
+        else:
+            for (i, chamber) in enumerate(chambers):
+                if chamber == 0:
+                    deaths_count += 1
+                scores[(first_player + i) % players] += points_of(chamber)
+    elapsed = perf_counter() - started_at
+
+    plays = plays_per_player * players
+    expected_death_rate = 1 / BULLETS_COUNT
+    death_rate = deaths_count / plays if plays else 0.0
+    standard_error = sqrt(expected_death_rate * (1 - expected_death_rate) / plays) if plays else 0.0
+    sorted_scores = sorted(int(score) for score in scores)
+    return {
+        "seed": stream.seed,
+        "backend": "numpy" if use_numpy else "random",
+        "plays": plays,
+        "players": players,
+        "elapsed_s": round(elapsed, 3),
+        "plays_per_s": round(plays / elapsed) if elapsed > 0 else None,
+        "death_rate": death_rate,
+        "expected_death_rate": expected_death_rate,
+        "odds_ok": abs(death_rate - expected_death_rate) <= ODDS_TOLERANCE_IN_STANDARD_ERRORS * standard_error,
+        "points_per_play": sum(sorted_scores) / plays if plays else 0.0,
+        "expected_points_per_play": (1 - expected_death_rate) * WIN_POINTS_REWARD
+                                    - expected_death_rate * DEATH_POINTS_PENALTY,
+        "player_points_p1": sorted_scores[len(sorted_scores) // 100],
+        "player_points_p50": sorted_scores[len(sorted_scores) // 2],
+        "player_points_p99": sorted_scores[len(sorted_scores) * 99 // 100],
+        "players_in_debt_ratio": sum(1 for score in sorted_scores if score < 0) / players
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plays", type=int, default=10_000_000)
+    parser.add_argument("--players", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--no-numpy", action="store_true", help="draw with the random module")
+    args = parser.parse_args()
+    print(json.dumps(simulate(args.plays, args.players, args.seed,
+                              use_numpy=numpy is not None and not args.no_numpy), indent=2))
+
+
+if __name__ == "__main__":
+    main()
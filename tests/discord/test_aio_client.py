@@ -0,0 +1,89 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import unittest
+
+# the round trip runs in a process of its own: test runners monkey patch theirs with gevent,
+# while the asyncio backend is meant for processes that are not patched
+ROUND_TRIP_ARGUMENT = "--round-trip"
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def round_trip() -> dict:
+    from gevent import monkey
+
+    from discord.aio_client import AsyncDiscordClient
+    from discord.discord_client import DiscordGatewayConnectionError
+
+    # Given a fake Discord sending 20 "!ping" messages once a client is connected
+    port = free_port()
+    fake_discord = subprocess.Popen([sys.executable, "-m", "discord.fake_discord", "--port", str(port),
+                                     "--events-per-s", "20", "--duration", "1", "--content", "!ping"],
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    # Given a Caller
+    class C:
+        def __init__(self):
+            self.pings = 0
+
+        def pong(self, message):
+            self.pings += 1
+            message.respond("pong")
+
+    caller = C()
+
+    # Given an asyncio client pointing at the fake Discord
+    discord_client = AsyncDiscordClient(token="fake", base_url=f"http://127.0.0.1:{port}/api")
+    discord_client.register_callback("!ping", caller, C.pong)
+
+    async def run():
+        for attempt in range(50):
+            try:
+                await discord_client.start()
+            except OSError:
+                await asyncio.sleep(0.1)
+            except DiscordGatewayConnectionError:
+                return
+
+    # When the client runs until the fake Discord stops
+    asyncio.run(asyncio.wait_for(run(), timeout=20))
+    stats = json.loads(fake_discord.communicate(timeout=10)[0].decode("utf-8").splitlines()[-1])
+    return dict(stats, pings=caller.pings, pending_tasks=len(discord_client.tasks),
+                patched=monkey.is_anything_patched())
+
+
+class TestAsyncDiscordClient(unittest.TestCase):
+
+    def test_command_round_trip(self):
+
+        # When the round trip runs in a process that gevent did not patch
+        environment = dict(os.environ, PYTHONPATH=os.pathsep.join(
+            [REPOSITORY_DIRECTORY] + [path for path in [os.environ.get("PYTHONPATH")] if path]))
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), ROUND_TRIP_ARGUMENT],
+                                   stdout=subprocess.PIPE, env=environment, cwd=REPOSITORY_DIRECTORY, timeout=60)
+        self.assertEqual(completed.returncode, 0)
+        result = json.loads(completed.stdout.decode("utf-8").splitlines()[-1])
+
+        # Then every message was handled and replied to, without gevent
+        self.assertFalse(result["patched"])
+        self.assertGreater(result["dispatched"], 0)
+        self.assertEqual(result["pings"], result["dispatched"])
+        self.assertEqual(result["posted"], result["dispatched"])
+        # And no task was left behind
+        self.assertEqual(result["pending_tasks"], 0)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == [ROUND_TRIP_ARGUMENT]:
+        print(json.dumps(round_trip()))
+    else:
+        unittest.main()
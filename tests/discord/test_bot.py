@@ -0,0 +1,118 @@
+from gevent import monkey
+monkey.patch_all()
+import gevent
+import os
+import tempfile
+import unittest
+
+from gevent.monkey import get_original
+
+from discord.bot import Bot
+from discord.key_value import FileStorageKeyIntValue
+from discord.fake_discord import FakeDiscord
+from discord.process_pool import process_pool
+
+blocking_sleep = get_original("time", "sleep")
+
+
+class ScoringBot(Bot):
+
+    def purgeable(self, key: str) -> bool:
+        # stands for a slow gdbm file: blocks without yielding to the hub
+        blocking_sleep(0.01)
+        return not self.split_guild_key(key)[1].startswith("score.")
+
+
+class CrunchingBot(Bot):
+
+    @Bot.register_command("!crunch", executor="process")
+    def crunch(self, message):
+        message.respond(f"{message.author.name}: {sum(i * i for i in range(100_000))}")
+        message.respond_later(str(os.getpid()), 0.1)
+
+
+class TestBot(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.storage_directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.storage_directory.cleanup()
+
+    def test_compaction(self):
+
+        # Given a bot whose storage holds meaningful and default 0 values
+        bot = ScoringBot(token="compaction", storage_directory=self.storage_directory.name,
+                         compaction_interval_in_s=None, gateway_url_ttl_in_s=None)
+        for user in range(10):
+            bot.guild_kv("1").put_int(f"score.{user}", user % 2)
+            bot.guild_kv("1").put_int(f"missing.{user}", 0)
+
+        # When the storage is compacted while the hub has other work to do
+        ticks = []
+        ticker = gevent.spawn(lambda: [ticks.append(gevent.sleep(0.01)) for _ in range(100)])
+        bot.compact_storage().join(timeout=5)
+        ticker.kill()
+
+        # Then the hub kept running
+        self.assertGreater(len(ticks), 3)
+
+        # And only the purgeable keys holding 0 were deleted
+        self.assertEqual(sum(report.keys_before for report in bot.last_compaction_reports), 20)
+        self.assertEqual(sorted(key for (key, _) in bot.guild_kv("1").iter_int_items()),
+                         [f"score.{user}" for user in range(10)])
+        bot.kv.close()
+
+    def test_legacy_storage_migration(self):
+
+        # Given the single storage file of a previous version
+        legacy_storage_file_name = os.path.join(self.storage_directory.name, "key-value.db")
+        legacy_kv = FileStorageKeyIntValue(legacy_storage_file_name)
+        legacy_kv.put_many((f"roulette.{user}", user) for user in range(10))
+        legacy_kv.close()
+
+        # When a bot whose storage is empty starts
+        bot = Bot(token="legacy", storage_directory=self.storage_directory.name,
+                  compaction_interval_in_s=None, gateway_url_ttl_in_s=None,
+                  legacy_storage_file_name=legacy_storage_file_name, legacy_guild_id="1")
+
+        # Then the legacy keys are migrated to the guild
+        self.assertEqual(sorted(bot.guild_kv("1").iter_int_items("roulette.")),
+                         sorted((f"roulette.{user}", user) for user in range(10)))
+        bot.kv.close()
+
+        # And the legacy file is only migrated once
+        self.assertFalse(os.path.exists(legacy_storage_file_name))
+        self.assertTrue(os.path.exists(legacy_storage_file_name + ".migrated"))
+
+    def test_process_executor(self):
+
+        # Given a bot running a command in a worker process, connected to a fake Discord
+        fake_discord = FakeDiscord(heartbeat_interval_in_ms=100)
+        fake_discord.start()
+        bot = CrunchingBot(token="process", base_url=fake_discord.api_base_url,
+                           storage_directory=self.storage_directory.name,
+                           compaction_interval_in_s=None, gateway_url_ttl_in_s=None)
+        greenlets = bot.discord_client.start()
+        self.assertTrue(bot.discord_client.connected_to_gateway_event.wait(timeout=5))
+
+        # When the command is dispatched
+        fake_discord.dispatch_message_create("!crunch", channel_id="42")
+
+        # Then the replies made in the worker process are posted on the message, including the delayed one
+        with gevent.Timeout(30):
+            while fake_discord.posted_messages_count < 2:
+                gevent.sleep(0.01)
+        contents = [message["content"] for message in fake_discord.posted_messages]
+        self.assertTrue(all(message["channel_id"] == "42" for message in fake_discord.posted_messages))
+        self.assertEqual(contents[0].split(": ")[1], str(sum(i * i for i in range(100_000))))
+        self.assertNotEqual(int(contents[1]), os.getpid())
+
+        gevent.killall(greenlets)
+        fake_discord.stop()
+        process_pool.stop()
+        bot.kv.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
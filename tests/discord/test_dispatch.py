@@ -0,0 +1,121 @@
+from gevent import monkey
+monkey.patch_all()
+import gevent
+import json
+import unittest
+
+from discord.discord_client import DiscordClient, DiscordGatewayEventName, DiscordGatewayIntent, DiscordGatewayOp
+from discord.dispatch import Lanes, SeenSet, USER_LANES
+
+
+def message_create_frame(message_id: str, user_id: str) -> str:
+    return json.dumps({"op": 0, "s": 1, "t": "MESSAGE_CREATE", "d": {
+        "id": message_id, "channel_id": "42", "content": "!play", "author": {"id": user_id, "username": user_id}}})
+
+
+class TestDispatch(unittest.TestCase):
+
+    def test_seen_set(self):
+
+        # Given a Seen Set with a 10s window and a controlled clock
+        now = [0.0]
+        seen_set = SeenSet(window_in_s=10, max_size=100, clock=lambda: now[0])
+
+        # When an id is seen twice
+        # Then it is only new the first time
+        self.assertFalse(seen_set.seen("1"))
+        self.assertTrue(seen_set.seen("1"))
+
+        # When half a window has elapsed
+        now[0] = 6
+        # Then it is still remembered
+        self.assertTrue(seen_set.seen("1"))
+
+        # When the window has elapsed
+        now[0] = 12
+        # Then it is forgotten
+        self.assertFalse(seen_set.seen("1"))
+
+        # When more than max_size ids are seen
+        for id in range(1000):
+            seen_set.seen(id)
+        # Then memory stays bounded
+        self.assertLessEqual(len(seen_set), 100)
+
+    def test_lanes(self):
+
+        # Given Lanes running handlers that wait on the hub
+        lanes = Lanes()
+        handled = []
+
+        def handle(lane: str, i: int):
+            gevent.sleep(0.01 * (3 - i))
+            handled.append((lane, i))
+
+        # When handlers are submitted to two lanes
+        workers = [lanes.submit(lane, handle, lane, i) for i in range(3) for lane in ("a", "b")]
+
+        # Then a single worker is started per lane
+        self.assertEqual(len([worker for worker in workers if worker is not None]), 2)
+        gevent.joinall([worker for worker in workers if worker is not None], timeout=5)
+
+        # And each lane runs its handlers in order, lanes running concurrently
+        self.assertEqual([i for (lane, i) in handled if lane == "a"], [0, 1, 2])
+        self.assertEqual([i for (lane, i) in handled if lane == "b"], [0, 1, 2])
+        self.assertEqual(handled[:2], [("a", 0), ("b", 0)])
+
+        # And idle lanes are released
+        self.assertEqual(len(lanes), 0)
+
+    def test_replayed_message_is_dispatched_once(self):
+
+        # Given a DiscordClient running the commands of a user in order
+        class C:
+            def __init__(self):
+                self.played = []
+
+            def play(self, message):
+                gevent.sleep(0.01)
+                self.played.append(message.id)
+
+        caller = C()
+        discord_client = DiscordClient(token="fake", ordering=USER_LANES)
+        discord_client.register_callback("!play", caller, C.play)
+
+        # When a message is dispatched twice, followed by another message of the same user
+        greenlets = [DiscordGatewayOp.receive(message_create_frame(message_id, "7")).handle_event(discord_client)
+                     for message_id in ("1", "1", "2")]
+        gevent.joinall([greenlet for greenlet in greenlets if greenlet is not None], timeout=5)
+
+        # Then the command is only played once per message, in order
+        self.assertEqual(caller.played, ["1", "2"])
+
+    def test_intents_and_unsubscribed_events(self):
+
+        # Given a DiscordClient with a command callback
+        discord_client = DiscordClient(token="fake")
+        discord_client.register_callback("!play", object(), lambda caller, message: None)
+
+        # Then it only asks for message intents
+        self.assertEqual(discord_client.intents, DiscordGatewayIntent.GuildMessages | DiscordGatewayIntent.DirectMessages)
+
+        # When events it did not subscribe to are received
+        reaction = json.dumps({"op": 0, "s": 2, "t": "MESSAGE_REACTION_ADD", "d": {}})
+        unknown = json.dumps({"op": 0, "s": 3, "t": "SOMETHING_NEW", "d": {}})
+
+        # Then they are skipped, while their sequence number is kept
+        self.assertIsNone(DiscordGatewayOp.receive(reaction, discord_client.dispatched_types))
+        self.assertIsNone(DiscordGatewayOp.receive(unknown, discord_client.dispatched_types))
+        self.assertEqual(DiscordGatewayOp.last_message_seq(), 3)
+
+        # And an unknown event type has an Unknown name instead of raising
+        self.assertEqual(DiscordGatewayOp.receive(unknown).event_name(), DiscordGatewayEventName.Unknown)
+
+        # And an edited message does not fire the command again
+        edited = json.loads(message_create_frame("1", "7"))
+        edited["t"] = "MESSAGE_UPDATE"
+        self.assertIsNone(DiscordGatewayOp.receive(json.dumps(edited)).handle_event(discord_client))
+
+
+if __name__ == '__main__':
+    unittest.main()
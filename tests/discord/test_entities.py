@@ -0,0 +1,93 @@
+import unittest
+
+from discord.entities import EntityCache, MEMBER_ENTITY
+
+
+def guild_create(guild_id: str, members_count: int = 0) -> dict:
+    return {
+        "id": guild_id,
+        "name": f"guild {guild_id}",
+        "member_count": members_count,
+        "channels": [{"id": f"{guild_id}-{channel}", "type": 0, "name": f"channel {channel}"} for channel in range(3)],
+        "members": [{"user": {"id": f"user-{member}", "username": f"player {member}"}, "nick": None, "roles": []}
+                    for member in range(members_count)]
+    }
+
+
+def message_create(guild_id: str, user_id: str, nick: str = None) -> dict:
+    return {
+        "id": "1",
+        "content": "!points",
+        "guild_id": guild_id,
+        "channel_id": f"{guild_id}-0",
+        "author": {"id": user_id, "username": f"player {user_id}"},
+        "member": {"nick": nick, "roles": ["role"]}
+    }
+
+
+class TestEntityCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.cache = EntityCache(max_guilds=2, max_members_per_guild=3,
+                                 retention_in_s={MEMBER_ENTITY: 60}, clock=lambda: self.now)
+
+    def test_fill_from_dispatches(self):
+
+        # When guilds, channels and messages are dispatched
+        self.cache.update("READY", {"guilds": [{"id": "g1", "unavailable": True}]})
+        self.cache.update("GUILD_CREATE", guild_create("g1", members_count=2))
+        self.cache.update("CHANNEL_CREATE", {"id": "g1-new", "guild_id": "g1", "type": 0, "name": "new"})
+        self.cache.update("CHANNEL_DELETE", {"id": "g1-2", "guild_id": "g1"})
+        self.cache.update("MESSAGE_CREATE", message_create("g1", "user-1", nick="nick"))
+        self.cache.update("TYPING_START", {"guild_id": "g1"})
+
+        # Then they can be read without a REST call
+        self.assertEqual(self.cache.guild("g1").name, "guild g1")
+        self.assertEqual(self.cache.channel("g1", "g1-new").name, "new")
+        self.assertIsNone(self.cache.channel("g1", "g1-2"))
+        self.assertEqual(self.cache.member("g1", "user-0").display_name, "player 0")
+        self.assertEqual(self.cache.member("g1", "user-1").display_name, "nick")
+        self.assertEqual(self.cache.member("g1", "user-1").roles, ("role",))
+        self.assertEqual(self.cache.stats(), {"guilds": 1, "channels": 3, "members": 2, "evicted_guilds": 0})
+
+        # When the guild is deleted
+        self.cache.update("GUILD_DELETE", {"id": "g1"})
+
+        # Then its entities are forgotten
+        self.assertIsNone(self.cache.member("g1", "user-1"))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_bounds(self):
+
+        # Given two guilds, the first one being the most recently active
+        self.cache.update("GUILD_CREATE", guild_create("g1"))
+        self.cache.update("GUILD_CREATE", guild_create("g2"))
+        self.cache.update("MESSAGE_CREATE", message_create("g1", "user-1"))
+
+        # When a third guild becomes available
+        self.cache.update("GUILD_CREATE", guild_create("g3"))
+
+        # Then the least recently active guild is evicted
+        self.assertIsNone(self.cache.guild("g2"))
+        self.assertEqual([guild.id for guild in self.cache.guilds()], ["g1", "g3"])
+
+        # When more members than allowed are active in a guild
+        for user in range(2, 5):
+            self.now += 1
+            self.cache.update("MESSAGE_CREATE", message_create("g1", f"user-{user}"))
+
+        # Then the least recently active member is evicted
+        self.assertIsNone(self.cache.member("g1", "user-1"))
+        self.assertIsNotNone(self.cache.member("g1", "user-2"))
+
+        # When members are not seen for longer than their retention
+        self.now += 61
+
+        # Then they are dropped, while the guild is kept
+        self.assertIsNone(self.cache.member("g1", "user-4"))
+        self.assertIsNotNone(self.cache.guild("g1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
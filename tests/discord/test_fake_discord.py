@@ -0,0 +1,128 @@
+from gevent import monkey
+monkey.patch_all()
+import gevent
+import os
+import tempfile
+import unittest
+
+from discord.discord_client import DiscordClient, GatewayUrlCache
+from discord.entities import EntityCache
+from discord.fake_discord import FakeDiscord
+
+
+class TestFakeDiscord(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.fake_discord = FakeDiscord(heartbeat_interval_in_ms=100)
+        self.fake_discord.start()
+
+    def tearDown(self) -> None:
+        self.fake_discord.stop()
+
+    def test_command_round_trip(self):
+
+        # Given a Caller
+        class C:
+            def pong(self, message):
+                message.respond("pong")
+
+        # Given a DiscordClient pointing at the fake Discord
+        discord_client = DiscordClient(token="fake", base_url=self.fake_discord.api_base_url)
+        discord_client.register_callback("!ping", C(), C.pong)
+        greenlets = discord_client.start()
+
+        # When the client is connected
+        self.assertTrue(discord_client.connected_to_gateway_event.wait(timeout=5))
+
+        # When a matching message is dispatched
+        self.fake_discord.dispatch_message_create("!ping", channel_id="42")
+        # When a non matching message is dispatched
+        self.fake_discord.dispatch_message_create("!unknown")
+
+        # Then a reply is posted to the message channel
+        with gevent.Timeout(5):
+            while self.fake_discord.posted_messages_count < 1:
+                gevent.sleep(0.01)
+        gevent.sleep(0.1)
+        self.assertEqual(self.fake_discord.posted_messages_count, 1)
+        self.assertEqual(self.fake_discord.posted_messages[0]["content"], "pong")
+        self.assertEqual(self.fake_discord.posted_messages[0]["channel_id"], "42")
+
+        # Then heartbeats are acknowledged
+        self.assertGreater(self.fake_discord.heartbeats_count, 0)
+
+        gevent.killall(greenlets)
+
+    def test_rate_limit(self):
+
+        # Given a fake Discord allowing a single REST request per second
+        self.fake_discord.rate_limit_per_s = 1
+        discord_client = DiscordClient(token="fake", base_url=self.fake_discord.api_base_url)
+
+        # When REST resources are requested twice in a row
+        discord_client.me
+        me = discord_client.me
+
+        # Then the second request is rate limited
+        self.assertEqual(me["retry_after"], 1.0)
+        self.assertEqual(self.fake_discord.rate_limited_count, 1)
+
+    def test_gateway_url_cache(self):
+
+        # Given a DiscordClient caching the gateway URL on disk
+        with tempfile.TemporaryDirectory() as directory:
+            cache = GatewayUrlCache(os.path.join(directory, "gateway-url.json"))
+            discord_client = DiscordClient(token="fake", base_url=self.fake_discord.api_base_url,
+                                           gateway_url_cache=cache)
+
+            # When the gateway URL is asked for the first time
+            discord_client.gateway_base_url
+
+            # Then it is fetched from the REST API and cached
+            self.assertEqual(self.fake_discord.rest_requests_count, 1)
+            self.assertEqual(cache.get(self.fake_discord.api_base_url), self.fake_discord.gateway_url)
+
+            # When another client asks for it
+            restarted_client = DiscordClient(token="fake", base_url=self.fake_discord.api_base_url,
+                                             gateway_url_cache=cache)
+            restarted_client.gateway_base_url
+
+            # Then no REST call is made
+            self.assertEqual(self.fake_discord.rest_requests_count, 1)
+
+            # And the cache expires and is only valid for its base URL
+            self.assertIsNone(cache.get("http://elsewhere/api"))
+            self.assertIsNone(GatewayUrlCache(cache.file_name, ttl_in_s=-1).get(self.fake_discord.api_base_url))
+
+    def test_entity_cache(self):
+
+        # Given a Caller answering with what it knows of the message's guild, channel and author
+        class C:
+            def where(self, message):
+                message.respond(f"{message.author_name} in {message.guild.name} #{message.channel.name}")
+
+        # Given a DiscordClient caching entities
+        discord_client = DiscordClient(token="fake", base_url=self.fake_discord.api_base_url,
+                                       entity_cache=EntityCache())
+        discord_client.register_callback("!where", C(), C.where)
+        greenlets = discord_client.start()
+        self.assertTrue(discord_client.connected_to_gateway_event.wait(timeout=5))
+
+        # When the guild becomes available, then a member sends a command
+        with gevent.Timeout(5):
+            while discord_client.entities.guild(self.fake_discord.guild_ids[0]) is None:
+                gevent.sleep(0.01)
+        self.fake_discord.dispatch_message_create("!where", nick="Alice")
+
+        # Then the handler resolves them from the cache
+        with gevent.Timeout(5):
+            while self.fake_discord.posted_messages_count < 1:
+                gevent.sleep(0.01)
+        self.assertEqual(self.fake_discord.posted_messages[0]["content"], "Alice in guild 1000 #channel 2000")
+        self.assertEqual(self.fake_discord.rest_requests_count, 2)
+
+        gevent.killall(greenlets)
+
+
+if __name__ == '__main__':
+    unittest.main()
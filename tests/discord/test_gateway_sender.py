@@ -0,0 +1,96 @@
+import gevent
+import unittest
+
+from discord.gateway_sender import GatewaySender, HEARTBEAT_PRIORITY, HEARTBEAT_RESERVED_TOKENS, TokenBucket
+
+
+class FakeWebSocket:
+
+    def __init__(self):
+        self.frames = []
+
+    def send_frame(self, frame: str) -> None:
+        self.frames.append(frame)
+
+
+class TestGatewaySender(unittest.TestCase):
+
+    def test_token_bucket(self):
+
+        # Given a bucket of 2 tokens refilled at 1 token per second, with a controlled clock
+        now = [0.0]
+        bucket = TokenBucket(capacity=2, period_in_s=2, clock=lambda: now[0])
+
+        # Then its tokens can be taken until it is empty
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 1.0)
+
+        # When time passes, it is refilled
+        now[0] += 0.5
+        self.assertEqual(bucket.take(), 0.5)
+        now[0] += 0.5
+        self.assertEqual(bucket.take(), 0)
+
+        # And reserved tokens can not be taken
+        now[0] += 10
+        self.assertEqual(bucket.take(reserved=1), 0)
+        self.assertEqual(bucket.take(reserved=1), 1.0)
+
+    def test_send_queue(self):
+
+        # Given a sender allowed 10 commands per half second
+        websocket = FakeWebSocket()
+        sender = GatewaySender(websocket, bucket=TokenBucket(capacity=10, period_in_s=0.5))
+
+        # When commands are queued, then a heartbeat
+        commands = [f"command-{i}" for i in range(10)]
+        for command in commands:
+            sender.send(command)
+        sender.send("heartbeat", HEARTBEAT_PRIORITY)
+        writer = gevent.spawn(sender.run)
+        gevent.sleep(0.01)
+
+        # Then the heartbeat is sent first, and commands are rate limited short of the heartbeat tokens
+        allowed_count = 10 - 1 - HEARTBEAT_RESERVED_TOKENS
+        self.assertEqual(websocket.frames, ["heartbeat"] + commands[:allowed_count])
+
+        # And the other commands are sent in order as tokens are refilled
+        with gevent.Timeout(2):
+            while len(websocket.frames) < 11:
+                gevent.sleep(0.01)
+        self.assertEqual(websocket.frames[1:], commands)
+        stats = sender.stats()
+        self.assertEqual(stats["sent"], 11)
+        self.assertEqual(stats["max_queue_depth"], 11)
+        self.assertGreater(stats["rate_limited"], 0)
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertIsNotNone(stats["latency_p99_ms"])
+
+        writer.kill()
+
+    def test_heartbeat_during_rate_limit(self):
+
+        # Given a sender that is rate limited for seconds
+        websocket = FakeWebSocket()
+        sender = GatewaySender(websocket, bucket=TokenBucket(capacity=10, period_in_s=20))
+        for i in range(10 - HEARTBEAT_RESERVED_TOKENS + 1):
+            sender.send(f"command-{i}")
+        writer = gevent.spawn(sender.run)
+        gevent.sleep(0.01)
+        self.assertEqual(sender.stats()["queue_depth"], 1)
+
+        # When a heartbeat is queued
+        sender.send("heartbeat", HEARTBEAT_PRIORITY)
+
+        # Then it is sent right away, before the rate limited command
+        with gevent.Timeout(0.5):
+            while "heartbeat" not in websocket.frames:
+                gevent.sleep(0.01)
+        self.assertEqual(sender.stats()["queue_depth"], 1)
+
+        writer.kill()
+
+
+if __name__ == '__main__':
+    unittest.main()
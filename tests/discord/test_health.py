@@ -0,0 +1,109 @@
+from gevent import monkey
+monkey.patch_all()
+import gevent
+import json
+import tempfile
+import unittest
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from discord.bot import Bot
+from discord.fake_discord import FakeDiscord
+from discord.health import HealthServer
+
+
+class TestHealth(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.fake_discord = FakeDiscord(heartbeat_interval_in_ms=100)
+        self.fake_discord.start()
+        self.storage_directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.fake_discord.stop()
+        self.storage_directory.cleanup()
+
+    def get(self, path: str) -> tuple:
+        try:
+            with urlopen(f"http://127.0.0.1:{self.health_server.port}{path}", timeout=5) as response:
+                return response.status, json.loads(response.read())
+        except HTTPError as error:
+            return error.code, json.loads(error.read())
+
+    def test_readiness(self):
+
+        # Given a bot that is not connected yet, and a health endpoint
+        bot = Bot(token="fake", base_url=self.fake_discord.api_base_url,
+                  storage_directory=self.storage_directory.name, compaction_interval_in_s=None)
+        self.health_server = HealthServer(host="127.0.0.1", port=0, bots_by_token={bot.token: bot})
+        self.health_server.start()
+
+        # Then the bot is alive but not ready
+        self.assertEqual(self.get("/live")[0], 200)
+        status, body = self.get("/ready")
+        self.assertEqual(status, 503)
+        self.assertFalse(body["bots"][0]["connected"])
+
+        # When the bot is connected and its heartbeats acknowledged
+        greenlets = bot.discord_client.start()
+        self.assertTrue(bot.discord_client.connected_to_gateway_event.wait(timeout=5))
+        with gevent.Timeout(5):
+            # GUILD_CREATE follows READY, it must be dispatched before queue depth is checked
+            while bot.discord_client.last_heartbeat_ack_at is None or not bot.discord_client.event_queue.empty():
+                gevent.sleep(0.01)
+
+        # Then it is ready
+        status, body = self.get("/ready")
+        self.assertEqual(status, 200)
+        self.assertEqual(body["bots"][0]["bot"], Bot.storage_name("fake"))
+        self.assertEqual(body["bots"][0]["heartbeat_interval_s"], 0.1)
+
+        # And runtime stats are served
+        status, stats = self.get("/stats")
+        self.assertEqual(status, 200)
+        self.assertGreater(stats["rss_kb"], 0)
+        self.assertGreater(stats["tasks"], 0)
+        self.assertEqual(stats["bots"][0]["queue_depth"], 0)
+        self.assertGreater(stats["bots"][0]["gateway_sender"]["sent"], 0)
+
+        # When heartbeats are no longer acknowledged
+        gevent.killall(greenlets)
+        bot.discord_client.last_heartbeat_ack_at -= 10
+
+        # Then the bot is neither ready nor alive
+        self.assertEqual(self.get("/ready")[0], 503)
+        self.assertEqual(self.get("/live")[0], 503)
+
+        self.health_server.stop()
+        bot.kv.close()
+
+    def test_readiness_of_interactions(self):
+
+        # Given a bot receiving its commands as interactions, that never connects to the gateway
+        from nacl.signing import SigningKey
+        bot = Bot(token="interactions", base_url=self.fake_discord.api_base_url,
+                  storage_directory=self.storage_directory.name, compaction_interval_in_s=None)
+        self.health_server = HealthServer(host="127.0.0.1", port=0, bots_by_token={bot.token: bot})
+        self.health_server.start()
+        serving = gevent.spawn(bot.serve_interactions, SigningKey.generate().verify_key.encode().hex(),
+                               host="127.0.0.1", port=0)
+
+        # When its endpoint listens
+        with gevent.Timeout(5):
+            while bot.interactions_server is None or not bot.interactions_server.serving:
+                gevent.sleep(0.01)
+
+        # Then it is ready and alive
+        status, body = self.get("/ready")
+        self.assertEqual(status, 200)
+        self.assertTrue(body["bots"][0]["interactions"]["serving"])
+        self.assertEqual(self.get("/live")[0], 200)
+
+        bot.interactions_server.stop()
+        serving.join(timeout=5)
+        self.health_server.stop()
+        bot.kv.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
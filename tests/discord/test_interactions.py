@@ -0,0 +1,143 @@
+from gevent import monkey
+monkey.patch_all()
+import gevent
+import itertools
+import json
+import time
+import unittest
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from nacl.signing import SigningKey
+
+from discord.discord_client import DiscordClient
+from discord.fake_discord import FakeDiscord
+from discord.interactions import InteractionsServer
+
+
+interaction_ids = itertools.count(4000)
+
+
+class Roulette:
+
+    def play(self, message):
+        message.respond(f"{message.author.name} pulls the trigger...")
+        message.respond_later("...and lives!", 0.05)
+
+    def later(self, message):
+        message.respond_later("done", 0.01)
+
+
+class TestInteractions(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.fake_discord = FakeDiscord()
+        self.fake_discord.start()
+        # stands for the application's key pair, Discord signing the requests it sends
+        self.signing_key = SigningKey.generate()
+        self.discord_client = DiscordClient(token="fake", base_url=self.fake_discord.api_base_url)
+        self.discord_client.register_callback("!roulette", Roulette(), Roulette.play, 60)
+        self.discord_client.register_callback("!later", Roulette(), Roulette.later)
+        self.server = InteractionsServer(self.discord_client, self.signing_key.verify_key.encode().hex(),
+                                         host="127.0.0.1", port=0)
+        self.server.start()
+
+    def tearDown(self) -> None:
+        self.server.stop()
+        self.fake_discord.stop()
+
+    def post(self, interaction: dict, signing_key: SigningKey = None, timestamp: str = None) -> tuple:
+        body = json.dumps(interaction).encode("utf-8")
+        timestamp = timestamp or str(int(time.time()))
+        signature = (signing_key or self.signing_key).sign(timestamp.encode("utf-8") + body).signature.hex()
+        request = Request(f"http://127.0.0.1:{self.server.port}/interactions", data=body, method="POST",
+                          headers={"X-Signature-Ed25519": signature, "X-Signature-Timestamp": timestamp,
+                                   "Content-Type": "application/json"})
+        try:
+            with urlopen(request, timeout=5) as response:
+                return response.status, json.loads(response.read())
+        except HTTPError as error:
+            return error.code, json.loads(error.read())
+
+    @staticmethod
+    def command(name: str, user_id: str = "3000") -> dict:
+        return {
+            "id": str(next(interaction_ids)),
+            "application_id": "5000",
+            "type": 2,
+            "token": "interaction-token",
+            "guild_id": "1000",
+            "channel_id": "2000",
+            "member": {"user": {"id": user_id, "username": "player"}, "roles": []},
+            "data": {"id": "6000", "name": name, "type": 1}
+        }
+
+    def test_signature_and_ping(self):
+
+        # When a request is not signed by the application's key
+        status, _ = self.post({"type": 1}, signing_key=SigningKey.generate())
+
+        # Then it is rejected
+        self.assertEqual(status, 401)
+        self.assertEqual(self.server.rejected_count, 1)
+
+        # When Discord pings the endpoint
+        status, body = self.post({"type": 1})
+
+        # Then it pongs
+        self.assertEqual(status, 200)
+        self.assertEqual(body, {"type": 1})
+
+    def test_replay(self):
+
+        # When a signed request is older than allowed
+        status, _ = self.post(self.command("roulette"), timestamp=str(int(time.time()) - 3600))
+
+        # Then it is rejected
+        self.assertEqual(status, 401)
+
+        # When a recent request is received twice
+        interaction = self.command("roulette")
+        self.assertEqual(self.post(interaction)[0], 200)
+        status, _ = self.post(interaction)
+
+        # Then it is only handled once
+        self.assertEqual(status, 409)
+        self.assertEqual(self.server.replayed_count, 1)
+        self.assertEqual(self.server.interactions_count, 1)
+
+    def test_application_command(self):
+
+        # When a slash command is received
+        status, body = self.post(self.command("roulette"))
+
+        # Then its handler responds inline, without a REST call
+        self.assertEqual(status, 200)
+        self.assertEqual(body, {"type": 4, "data": {"content": "player pulls the trigger..."}})
+
+        # And what it responds later is posted as a follow-up message
+        with gevent.Timeout(5):
+            while self.fake_discord.posted_messages_count < 1:
+                gevent.sleep(0.01)
+        self.assertEqual(self.fake_discord.posted_messages[0]["content"], "...and lives!")
+        self.assertEqual(self.fake_discord.posted_messages[0]["interaction_token"], "interaction-token")
+
+        # When the same user runs it again during its cooldown
+        status, body = self.post(self.command("roulette"))
+
+        # Then only they are told so
+        self.assertEqual(body["data"]["flags"], 64)
+
+        # When a handler only responds later
+        status, body = self.post(self.command("later"))
+
+        # Then the response is deferred
+        self.assertEqual(body, {"type": 5})
+
+        # And unknown commands are answered
+        status, body = self.post(self.command("unknown"))
+        self.assertEqual(body["data"]["content"], "Unknown command !unknown")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,16 +1,25 @@
+import io
 import os
+import shutil
+import sys
 import unittest
+from unittest import mock
 
-from discord.key_value import FileStorageKeyIntValue, InMemoryKeyIntValue
+from discord.key_value import FileStorageKeyIntValue, InMemoryKeyIntValue, PartitionedFileStorageKeyIntValue, \
+    ScopedKeyIntValue
+from discord import storage_admin
+from discord.storage_admin import export_ndjson, import_ndjson
 
 
 class TestKeyValue(unittest.TestCase):
 
     TEST_DB="test.db"
+    TEST_DIRECTORY="test-partitions"
 
     def _deleteTestDb(self):
         if os.path.exists(self.TEST_DB):
             os.remove(self.TEST_DB)
+        shutil.rmtree(self.TEST_DIRECTORY, ignore_errors=True)
 
     def setUp(self) -> None:
         self._deleteTestDb()
@@ -42,8 +51,8 @@ class TestKeyValue(unittest.TestCase):
         # Then I get the default value : 0
         self.assertEqual(kv.get_int("b"), 0)
 
-        # The read value is stored
-        self.assertEqual(kv.get_int("b", 3), 0)
+        # The read value is not stored
+        self.assertEqual(kv.get_int("b", 3), 3)
 
         # Then I can read a non existing value provided I give a default value
         self.assertEqual(kv.get_int("c", 3), 3)
@@ -55,11 +64,15 @@ class TestKeyValue(unittest.TestCase):
         # When I reopen it
         kv2 = FileStorageKeyIntValue(self.TEST_DB)
 
-        # Then data values are still there
+        # Then data values are still there, while values that were only read are not
         self.assertEqual(kv2.get_int("a"), -4)
-        self.assertEqual(kv2.get_int("b", 5), 0)
-        self.assertEqual(kv2.get_int("c"), 3)
-        self.assertEqual(kv2.get_int("d", 5), 5)
+        self.assertEqual(kv2.get_int("b", 5), 5)
+        self.assertEqual(kv2.get_int("c"), 0)
+
+        # And their keys can be streamed by prefix
+        kv2.put_int("roulette.1", 7)
+        self.assertEqual(sorted(kv2.iter_keys()), ["a", "roulette.1"])
+        self.assertEqual(list(kv2.iter_int_items("roulette.")), [("roulette.1", 7)])
 
 
 
@@ -86,13 +99,215 @@ class TestKeyValue(unittest.TestCase):
         # Then I get the default value : 0
         self.assertEqual(kv.get_int("b"), 0)
 
-        # The read value is stored
-        self.assertEqual(kv.get_int("b", 3), 0)
+        # The read value is not stored
+        self.assertEqual(kv.get_int("b", 3), 3)
 
         # Then I can read a non existing value provided I give a default value
         self.assertEqual(kv.get_int("c", 3), 3)
 
 
+    def test_partitioned_file_storage_key_int_value(self):
+
+        # Given a Partitioned File Storage keeping at most 2 of its 4 partitions open
+        kv = PartitionedFileStorageKeyIntValue(self.TEST_DIRECTORY, partitions_count=4, max_open_partitions=2)
+
+        # When I put ints in it
+        keys = [f"roulette.{user}" for user in range(100)]
+        for (value, key) in enumerate(keys):
+            kv.put_int(key, value)
+        kv.increment_int("roulette.7", 5)
+
+        # Then they are spread over every partition
+        self.assertEqual(len(os.listdir(self.TEST_DIRECTORY)), 4)
+
+        # And idle partitions are closed
+        self.assertEqual(kv.open_partitions_count(), 2)
+
+        # And I can read them back, even from closed partitions
+        self.assertEqual([kv.get_int(key) for key in keys], [value + 5 * (value == 7) for value in range(100)])
+        self.assertEqual(sorted(kv.iter_keys("roulette.1")), sorted(key for key in keys if key.startswith("roulette.1")))
+
+        # When I close it and reopen it
+        kv.close()
+        kv2 = PartitionedFileStorageKeyIntValue(self.TEST_DIRECTORY, partitions_count=4, max_open_partitions=2)
+
+        # Then data values are still there
+        self.assertEqual(kv2.get_int("roulette.7"), 12)
+        kv2.close()
+
+    def test_partitioned_file_storage_scopes(self):
+
+        # Given a Partitioned File Storage holding the keys of 20 guilds
+        kv = PartitionedFileStorageKeyIntValue(self.TEST_DIRECTORY, partitions_count=4)
+        kv.put_many((f"guild.{guild}.roulette.{user}", user) for guild in range(20) for user in range(10))
+        kv.close()
+
+        # Then the keys of a guild are all in the same partition
+        self.assertEqual(len({kv.partition_index(f"guild.7.roulette.{user}") for user in range(10)}), 1)
+
+        # And listing them only opens that partition
+        self.assertEqual(sorted(kv.iter_int_items("guild.7.")), sorted((f"guild.7.roulette.{user}", user)
+                                                                       for user in range(10)))
+        self.assertEqual(kv.open_partitions_count(), 1)
+
+        # And listing keys of several guilds still walks every partition
+        self.assertEqual(len(list(kv.iter_keys("guild."))), 200)
+        self.assertEqual(kv.open_partitions_count(), 4)
+        kv.close()
+
+    def test_partitioned_file_storage_eviction_of_partitions_in_use(self):
+
+        # Given a Partitioned File Storage keeping a single of its 4 partitions open, with a guild in each partition
+        kv = PartitionedFileStorageKeyIntValue(self.TEST_DIRECTORY, partitions_count=4, max_open_partitions=1)
+        scopes = list({kv.partition_index(f"guild.{guild}."): f"guild.{guild}." for guild in range(100)}.values())
+        self.assertEqual(len(scopes), 4)
+        walked_scope, other_scopes = scopes[0], scopes[1:]
+        kv.put_many((f"{scope}{user}", user) for scope in scopes for user in range(100))
+
+        # When the keys of a partition are streamed while the other partitions are read meanwhile
+        walked = [(int_value, kv.get_many([f"{scope}{key[len(walked_scope):]}" for scope in other_scopes]))
+                  for (key, int_value) in kv.iter_int_items(walked_scope)]
+
+        # Then the partition being walked is not closed under the walk
+        self.assertEqual(sorted(int_value for (int_value, _) in walked), list(range(100)))
+        self.assertTrue(all(sorted(values.values()) == [int_value] * 3 for (int_value, values) in walked))
+
+        # And idle partitions are closed once the walk is over
+        kv.get_int(f"{walked_scope}0")
+        self.assertEqual(kv.open_partitions_count(), 1)
+        kv.close()
+
+    def test_partitioned_file_storage_compaction_and_snapshot(self):
+
+        # Given a Partitioned File Storage where previous versions stored 0 for each missing key they read
+        kv = PartitionedFileStorageKeyIntValue(self.TEST_DIRECTORY, partitions_count=2)
+        kv.put_many((f"roulette.{user}", 0) for user in range(50))
+        kv.put_int("roulette.1", 3)
+
+        # When I snapshot it
+        snapshot_directory = os.path.join(self.TEST_DIRECTORY, "snapshot")
+        kv.snapshot(snapshot_directory)
+
+        # And compact it
+        reports = kv.compact()
+
+        # Then keys holding default values are purged
+        self.assertEqual(sum(report.keys_before for report in reports), 50)
+        self.assertEqual(sum(report.keys_after for report in reports), 1)
+        self.assertEqual(list(kv.iter_int_items()), [("roulette.1", 3)])
+        self.assertEqual(kv.get_int("roulette.2"), 0)
+
+        # And the snapshot still holds every key
+        snapshot = PartitionedFileStorageKeyIntValue(snapshot_directory, partitions_count=2)
+        self.assertEqual(len(list(snapshot.iter_keys())), 50)
+        self.assertEqual(snapshot.get_int("roulette.1"), 3)
+        snapshot.close()
+        kv.close()
+
+    def test_scoped_key_int_value(self):
+
+        # Given two scopes of the same storage
+        kv = InMemoryKeyIntValue()
+        guild_1 = ScopedKeyIntValue(kv, "guild.1.")
+        guild_2 = ScopedKeyIntValue(kv, "guild.2.")
+
+        # When the same key is written in both
+        guild_1.put_int("roulette.a", 1)
+        guild_2.increment_int("roulette.a", 2)
+
+        # Then each scope has its own value
+        self.assertEqual(guild_1.get_int("roulette.a"), 1)
+        self.assertEqual(guild_2.get_int("roulette.a"), 2)
+        self.assertEqual(kv.dict, {"guild.1.roulette.a": 1, "guild.2.roulette.a": 2})
+
+        # And lists its own keys
+        self.assertEqual(list(guild_2.iter_int_items("roulette.")), [("roulette.a", 2)])
+
+    def test_bulk_operations(self):
+        for kv in (InMemoryKeyIntValue(),
+                   FileStorageKeyIntValue(self.TEST_DB),
+                   PartitionedFileStorageKeyIntValue(self.TEST_DIRECTORY, partitions_count=4, max_open_partitions=2),
+                   ScopedKeyIntValue(InMemoryKeyIntValue(), "guild.1.")):
+
+            # When many keys are put at once
+            count = kv.put_many((f"roulette.{user}", user) for user in range(100))
+            kv.put_many([("other.1", 42)])
+
+            # Then they can be read at once, and streamed by prefix
+            self.assertEqual(count, 100)
+            self.assertEqual(kv.get_many(["roulette.3", "roulette.99"]), {"roulette.3": 3, "roulette.99": 99})
+            self.assertEqual(sorted(kv.iter_int_items("roulette.")),
+                             sorted((f"roulette.{user}", user) for user in range(100)))
+
+            # And missing keys read at once are not stored
+            self.assertEqual(kv.get_many(["missing.1", "missing.2"], default=7), {"missing.1": 7, "missing.2": 7})
+            self.assertEqual(list(kv.iter_keys("missing.")), [])
+
+            # When keys are reset by prefix
+            self.assertEqual(kv.reset("roulette."), 100)
+
+            # Then they read as 0, while other keys are kept
+            self.assertEqual(list(kv.iter_int_items("roulette.")), [])
+            self.assertEqual(kv.get_int("roulette.3"), 0)
+            self.assertEqual(kv.get_int("other.1"), 42)
+
+            if hasattr(kv, "close"):
+                kv.close()
+
+    def test_chunked_deletion(self):
+
+        # Given a File Storage holding keys of two prefixes
+        kv = FileStorageKeyIntValue(self.TEST_DB)
+        kv.put_many((f"{prefix}.{user}", user) for prefix in ("roulette", "other") for user in range(250))
+
+        # When the keys of a prefix are deleted a few at a time
+        count = kv.delete_keys("roulette.", chunk_size=16)
+
+        # Then they are all deleted, and only them
+        self.assertEqual(count, 250)
+        self.assertEqual(list(kv.iter_keys("roulette.")), [])
+        self.assertEqual(len(list(kv.iter_keys("other."))), 250)
+        kv.close()
+
+    def test_export_and_import(self):
+
+        # Given a storage holding points of two guilds
+        kv = PartitionedFileStorageKeyIntValue(self.TEST_DIRECTORY, partitions_count=4)
+        kv.put_many((f"guild.{user % 2}.roulette.{user}", user - 50) for user in range(1000))
+
+        # When the points of a guild are exported in small chunks
+        export = io.StringIO()
+        count = export_ndjson(kv, export, prefix="guild.1.", chunk_size=64)
+        kv.close()
+
+        # Then each key is a JSON line
+        self.assertEqual(count, 500)
+        self.assertEqual(len(export.getvalue().splitlines()), 500)
+
+        # When they are imported into another storage
+        other_kv = InMemoryKeyIntValue()
+        self.assertEqual(import_ndjson(other_kv, io.StringIO(export.getvalue() + "\n")), 500)
+
+        # Then it holds the same points
+        self.assertEqual(other_kv.dict, {f"guild.1.roulette.{user}": user - 50 for user in range(1, 1000, 2)})
+
+        # And malformed lines are reported
+        self.assertRaises(ValueError, import_ndjson, other_kv, io.StringIO('{"key": "a"}\n'))
+
+    def test_storage_admin_without_storage_directory(self):
+
+        # When points are exported from, or reset in, a directory that holds no partition
+        for arguments in (["export", self.TEST_DIRECTORY], ["reset", self.TEST_DIRECTORY, "--prefix", "guild."]):
+            with mock.patch.object(sys, "argv", ["storage_admin"] + arguments):
+
+                # Then the command fails
+                with self.assertRaises(SystemExit) as exited:
+                    storage_admin.main()
+                self.assertEqual(exited.exception.code, 1)
+
+            # And no storage is created
+            self.assertFalse(os.path.exists(self.TEST_DIRECTORY))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,119 @@
+import bisect
+import unittest
+from random import Random
+
+from discord.key_value import InMemoryKeyIntValue
+from discord.leaderboard import IndexableSkipList, Leaderboard, PUT_MANY_CHUNK_SIZE
+
+
+class TestLeaderboard(unittest.TestCase):
+
+    def test_indexable_skip_list(self):
+
+        # Given a Skip List built from sorted keys and a sorted reference list
+        random = Random(42)
+        reference = sorted(random.sample(range(10_000), 500))
+        skip_list = IndexableSkipList.from_sorted(reference, seed=1)
+
+        # When keys are randomly inserted and removed
+        for _ in range(2_000):
+            key = random.randrange(10_000)
+            position = bisect.bisect_left(reference, key)
+            if position < len(reference) and reference[position] == key:
+                skip_list.remove(key)
+                del reference[position]
+            else:
+                skip_list.insert(key)
+                reference.insert(position, key)
+
+        # Then it stays sorted and indexed like the reference
+        self.assertEqual(len(skip_list), len(reference))
+        self.assertEqual(list(skip_list.iterate_from(0)), reference)
+        for position in random.sample(range(len(reference)), 50):
+            self.assertEqual(skip_list.index(reference[position]), position)
+            self.assertEqual(next(skip_list.iterate_from(position)), reference[position])
+        self.assertEqual(list(skip_list.iterate_from(len(reference))), [])
+        self.assertRaises(KeyError, skip_list.remove, -1)
+
+    def test_leaderboard(self):
+
+        # Given a storage with existing scores
+        kv = InMemoryKeyIntValue()
+        kv.put_int("roulette.alice", 5)
+        kv.put_int("roulette.bob", 2)
+        kv.put_int("other.carol", 100)
+
+        # When a Leaderboard is created over it
+        leaderboard = Leaderboard(kv, "roulette.")
+
+        # Then it is rebuilt from the scores under its prefix
+        self.assertEqual(leaderboard.top(10), [(1, "alice", 5), (2, "bob", 2)])
+        self.assertIsNone(leaderboard.rank("carol"))
+
+        # When the score of a player who never played is read
+        self.assertEqual(leaderboard.get_int("roulette.erin", default=0), 0)
+
+        # Then they are not ranked
+        self.assertIsNone(leaderboard.rank("erin"))
+        self.assertEqual(len(leaderboard), 2)
+
+        # When scores change through the leaderboard
+        leaderboard.increment_int("roulette.bob", 4)
+        leaderboard.put_int("roulette.dave", 6)
+        leaderboard.decrement_int("roulette.alice", 3)
+
+        # Then ranks follow, ties being broken by id
+        self.assertEqual(leaderboard.rank("bob"), 1)
+        self.assertEqual(leaderboard.rank("dave"), 2)
+        self.assertEqual(leaderboard.rank("alice"), 3)
+        self.assertEqual(leaderboard.top(2, start_rank=2), [(2, "dave", 6), (3, "alice", 2)])
+
+        # And scores are persisted by the decorated storage
+        self.assertEqual(kv.get_int("roulette.bob"), 6)
+        self.assertEqual(len(Leaderboard(kv, "roulette.")), 3)
+
+        # When the scores of some players are reset
+        leaderboard.reset("roulette.b")
+
+        # Then they are no longer ranked
+        self.assertIsNone(leaderboard.rank("bob"))
+        self.assertEqual(leaderboard.rank("alice"), 2)
+
+        # When a new season starts
+        leaderboard.reset("roulette.")
+
+        # Then nobody is ranked any more
+        self.assertEqual(leaderboard.top(10), [])
+        self.assertIsNone(leaderboard.rank("bob"))
+        self.assertEqual(kv.get_int("other.carol"), 100)
+
+    def test_leaderboard_put_many(self):
+
+        # Given a Leaderboard
+        kv = InMemoryKeyIntValue()
+        leaderboard = Leaderboard(kv, "roulette.")
+
+        # When more scores than fit in a chunk are streamed into it
+        count = leaderboard.put_many((f"roulette.{user:05d}", user) for user in range(PUT_MANY_CHUNK_SIZE + 10))
+
+        # Then they are all stored and ranked
+        self.assertEqual(count, PUT_MANY_CHUNK_SIZE + 10)
+        self.assertEqual(len(kv.dict), PUT_MANY_CHUNK_SIZE + 10)
+        self.assertEqual(leaderboard.top(1), [(1, f"{PUT_MANY_CHUNK_SIZE + 9:05d}", PUT_MANY_CHUNK_SIZE + 9)])
+        self.assertEqual(len(leaderboard), PUT_MANY_CHUNK_SIZE + 10)
+
+    def test_leaderboard_from_scores(self):
+
+        # Given scores already read from a storage
+        kv = InMemoryKeyIntValue()
+        kv.put_int("roulette.alice", 5)
+
+        # When a Leaderboard is created from them
+        leaderboard = Leaderboard(kv, "roulette.", scores={"alice": 5, "bob": 7})
+
+        # Then the storage is not scanned again
+        self.assertEqual(leaderboard.top(10), [(1, "bob", 7), (2, "alice", 5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
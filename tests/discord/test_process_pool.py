@@ -0,0 +1,78 @@
+from gevent import monkey
+monkey.patch_all()
+import gevent
+import os
+import unittest
+from unittest import mock
+
+from discord import process_pool
+from discord.process_pool import MessageContext, ProcessCommandError, ProcessCommandPool
+from discord.user import User
+
+
+class Crunching:
+
+    def crunch(self, message: MessageContext):
+        message.respond(f"{message.author.name}: {sum(i * i for i in range(100_000))}")
+        message.respond_later(str(os.getpid()), 3)
+
+    def fail(self, message: MessageContext):
+        raise ValueError("no way")
+
+    def die(self, message: MessageContext):
+        os._exit(1)
+
+
+class TestProcessPool(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.pool = ProcessCommandPool(processes=2)
+
+    def tearDown(self) -> None:
+        self.pool.stop()
+
+    def test_run(self):
+
+        # Given message contexts
+        contexts = [MessageContext(str(i), "2", "3", User("4", "alice"), "!crunch") for i in range(3)]
+
+        # When handlers run concurrently in the pool
+        greenlets = [gevent.spawn(self.pool.run, Crunching, "crunch", context) for context in contexts]
+        gevent.joinall(greenlets, raise_error=True)
+        responses = [greenlet.value.responses for greenlet in greenlets]
+
+        # Then their replies are brought back from worker processes
+        self.assertEqual(responses[0][0], (f"alice: {sum(i * i for i in range(100_000))}", 0))
+        worker_pid = int(responses[0][1][0])
+        self.assertNotEqual(worker_pid, os.getpid())
+        self.assertEqual(responses[0][1][1], 3)
+
+        # Then no more workers than configured were started
+        self.assertLessEqual(len({int(response[1][0]) for response in responses}), 2)
+
+    def test_failure(self):
+
+        # When a handler raises in a worker process
+        # Then the error is raised in the calling greenlet with the remote traceback
+        with self.assertRaises(ProcessCommandError) as raised:
+            self.pool.run(Crunching, "fail", MessageContext("1", "2", None, User("4", "alice"), "!fail"))
+        self.assertIn("ValueError: no way", raised.exception.remote_traceback)
+
+    def test_worker_that_can_not_be_replaced(self):
+
+        # Given a worker that dies running a handler, and a worker that can not be started in its place
+        context = MessageContext("1", "2", None, User("4", "alice"), "!die")
+        self.pool.run(Crunching, "crunch", context)
+        with mock.patch.object(process_pool, "ProcessWorker", side_effect=OSError("no more processes")):
+            with self.assertRaises((EOFError, OSError)):
+                self.pool.run(Crunching, "die", context)
+
+        # Then the dead worker is not handed over to the next call, that starts a worker of its own
+        self.assertEqual(self.pool._started_workers, 0)
+        context.responses = []
+        self.assertEqual(self.pool.run(Crunching, "crunch", context).responses[0][0],
+                         f"alice: {sum(i * i for i in range(100_000))}")
+
+
+if __name__ == '__main__':
+    unittest.main()
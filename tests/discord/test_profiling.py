@@ -0,0 +1,68 @@
+from gevent import monkey
+monkey.patch_all()
+import gevent
+import time
+import unittest
+from unittest import mock
+
+from discord import profiling
+from discord.profiling import GreenletProfiler, running_tasks_count, spawn, track_tasks
+
+
+def busy(duration_in_s: float) -> None:
+    started_at = time.perf_counter()
+    while time.perf_counter() - started_at < duration_in_s:
+        pass
+
+
+class TestProfiling(unittest.TestCase):
+
+    def test_greenlet_profiler(self):
+
+        # Given a started profiler
+        profiler = GreenletProfiler(blocking_threshold_in_s=0.05)
+        profiler.start()
+
+        # When named tasks run, one of them blocking the hub
+        gevent.joinall([
+            spawn("blocking", busy, 0.2),
+            spawn("cooperative", gevent.sleep, 0.01)
+        ])
+        profiler.stop()
+        report = profiler.report()
+
+        # Then CPU time is attributed to the task that consumed it
+        self.assertGreater(report["cpu_time_s_by_task"]["blocking"], 0.1)
+        self.assertLess(report["cpu_time_s_by_task"]["cooperative"], 0.05)
+
+        # Then hub blocking is reported with the blocking stack
+        self.assertEqual(len(report["blocking_reports"]), 1)
+        self.assertEqual(report["blocking_reports"][0]["task"], "blocking")
+        self.assertIn("in busy", "".join(report["blocking_reports"][0]["stack"]))
+
+    def test_running_tasks_count(self):
+
+        # Given tasks that are not tracked
+        with mock.patch.object(profiling, "spawned_tasks", None):
+            spawn("sleeping", gevent.sleep, 0).join()
+
+            # Then they are not counted
+            self.assertIsNone(running_tasks_count())
+
+        # Given tasks that are running once tracking is on
+        track_tasks()
+        running_before = running_tasks_count()
+        tasks = [spawn("sleeping", gevent.sleep, 0.05) for _ in range(3)]
+
+        # Then they are counted
+        self.assertEqual(running_tasks_count(), running_before + 3)
+
+        # When they are over
+        gevent.joinall(tasks)
+
+        # Then they are no longer counted
+        self.assertEqual(running_tasks_count(), running_before)
+
+
+if __name__ == '__main__':
+    unittest.main()
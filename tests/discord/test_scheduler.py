@@ -0,0 +1,50 @@
+from gevent import monkey
+monkey.patch_all()
+import gevent
+import unittest
+
+from discord.scheduler import Scheduler
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_schedule(self):
+
+        # Given a Scheduler
+        scheduler = Scheduler()
+        fired = []
+
+        # When tasks are scheduled out of order
+        scheduler.schedule(0.2, fired.append, "late")
+        scheduler.schedule(0.1, fired.append, "early")
+        scheduler.schedule(0, fired.append, "now")
+
+        # Then nothing is called synchronously
+        self.assertEqual(fired, [])
+        self.assertEqual(scheduler.pending_count(), 3)
+
+        # Then tasks are called in deadline order
+        gevent.sleep(0.05)
+        self.assertEqual(fired, ["now"])
+        gevent.sleep(0.2)
+        self.assertEqual(fired, ["now", "early", "late"])
+        self.assertEqual(scheduler.pending_count(), 0)
+
+    def test_cancel(self):
+
+        # Given a Scheduler
+        scheduler = Scheduler()
+        fired = []
+
+        # When a scheduled task is cancelled
+        task = scheduler.schedule(0.05, fired.append, "cancelled")
+        scheduler.schedule(0.1, fired.append, "kept")
+        task.cancel()
+
+        # Then it is never called
+        gevent.sleep(0.2)
+        self.assertEqual(fired, ["kept"])
+
+
+if __name__ == '__main__':
+    unittest.main()
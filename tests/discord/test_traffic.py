@@ -0,0 +1,103 @@
+from gevent import monkey
+monkey.patch_all()
+import json
+import os
+import tempfile
+import unittest
+
+from discord.discord_client import DiscordClient
+from discord.traffic import RECORD_HEADER, TRAFFIC_LOG_MAGIC, TrafficLog, TrafficRecorder, replay, stats
+
+
+def message_create_frame(sequence: int, content: str) -> str:
+    return json.dumps({"op": 0, "s": sequence, "t": "MESSAGE_CREATE", "d": {
+        "id": str(sequence), "channel_id": "42", "content": content, "author": {"id": "7", "username": "player"}}})
+
+
+class TestTraffic(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_file_name = os.path.join(self.directory.name, "traffic.log")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_record_and_read(self):
+
+        # Given frames recorded by two compressed sessions and an uncompressed one
+        frames = [message_create_frame(sequence, "!roulette") for sequence in range(1, 31)]
+        for (session, compress) in enumerate((True, True, False)):
+            recorder = TrafficRecorder(self.log_file_name, compress=compress)
+            for (i, frame) in enumerate(frames[session * 10:(session + 1) * 10]):
+                recorder.record(frame, timestamp=100.0 + session * 10 + i)
+            recorder.close()
+
+        # When the log is read
+        records = list(TrafficLog(self.log_file_name))
+
+        # Then every frame is read back in order, with its timestamp
+        self.assertEqual([frame for (timestamp, frame) in records], frames)
+        self.assertEqual(records[12][0], 112.0)
+
+        # And compressed sessions take less room than raw frames
+        self.assertLess(os.path.getsize(self.log_file_name), sum(len(frame) for frame in frames))
+
+    def test_recovery(self):
+
+        # Given a compressed session whose recorder was killed in the middle of a record
+        frames = [message_create_frame(sequence, "!roulette") for sequence in range(1, 21)]
+        recorder = TrafficRecorder(self.log_file_name)
+        for frame in frames[:10]:
+            recorder.record(frame)
+        recorder.close()
+        with open(self.log_file_name, "r+b") as log_file:
+            log_file.truncate(os.path.getsize(self.log_file_name) - 5)
+
+        # When a new session is appended to the log
+        recorder = TrafficRecorder(self.log_file_name)
+        for frame in frames[10:]:
+            recorder.record(frame)
+        recorder.close()
+
+        # Then the cut record is dropped, and every other frame is read back
+        self.assertEqual([frame for (_, frame) in TrafficLog(self.log_file_name)], frames[:9] + frames[10:])
+
+        # When a record of the first session is corrupted
+        with open(self.log_file_name, "r+b") as log_file:
+            log_file.seek(len(TRAFFIC_LOG_MAGIC) + RECORD_HEADER.size + 2)
+            log_file.write(b"\xff" * 4)
+
+        # Then the rest of that session is skipped, and reading resumes at the next one
+        self.assertEqual([frame for (_, frame) in TrafficLog(self.log_file_name)], frames[10:])
+        self.assertEqual(stats(self.log_file_name)["frames"], 10)
+
+    def test_replay(self):
+
+        # Given a log of commands, and of events the client does not subscribe to
+        recorder = TrafficRecorder(self.log_file_name)
+        for sequence in range(1, 101):
+            recorder.record(message_create_frame(sequence, "!play" if sequence % 2 else "hello"))
+        recorder.record(json.dumps({"op": 0, "s": 101, "t": "TYPING_START", "d": {}}))
+        recorder.close()
+
+        # When it is replayed as fast as possible into a DiscordClient
+        class C:
+            def __init__(self):
+                self.played = []
+
+            def play(self, message):
+                self.played.append(message.id)
+
+        caller = C()
+        discord_client = DiscordClient(token="replay")
+        discord_client.register_callback("!play", caller, C.play)
+        frames_count = replay(discord_client, self.log_file_name, speed=0)
+
+        # Then every frame is received and every command is handled
+        self.assertEqual(frames_count, 101)
+        self.assertEqual(len(caller.played), 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+from discord.user import UserCache
+
+
+class TestUser(unittest.TestCase):
+
+    def test_user_cache(self):
+
+        # Given a User Cache holding at most 2 users
+        cache = UserCache(max_size=2)
+
+        # When the same user is interned twice
+        first = cache.intern("1", "alice")
+        second = cache.intern("1", "alice")
+
+        # Then the same instance is shared
+        self.assertIs(first, second)
+
+        # When a user is interned with a new name
+        renamed = cache.intern("1", "alicia")
+
+        # Then the shared instance is renamed
+        self.assertIs(renamed, first)
+        self.assertEqual(first.name, "alicia")
+
+        # When more users than max_size are interned
+        cache.intern("2", "bob")
+        cache.intern("1", "alicia")
+        cache.intern("3", "carol")
+
+        # Then the least recently seen user is evicted
+        self.assertEqual(len(cache), 2)
+        self.assertIs(cache.intern("1", "alicia"), first)
+        self.assertIsNot(cache.intern("2", "bob"), None)
+        self.assertEqual(len(cache), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from collections import Counter
+
+import roulette
+from roulette import BULLETS_COUNT, OutcomeStream, derive_seed, simulate
+
+
+class TestRoulette(unittest.TestCase):
+
+    def backends(self) -> list:
+        return [False, True] if roulette.numpy is not None else [False]
+
+    def test_outcome_stream(self):
+        for use_numpy in self.backends():
+
+            # Given two streams with the same seed, and one with another seed
+            stream = OutcomeStream(seed=42, batch_size=100, use_numpy=use_numpy)
+            same_stream = OutcomeStream(seed=42, batch_size=100, use_numpy=use_numpy)
+            other_stream = OutcomeStream(seed=43, batch_size=100, use_numpy=use_numpy)
+
+            # When pulling the trigger over several batches
+            pulls = [stream.pull() for _ in range(60_000)]
+
+            # Then pulls are reproducible
+            self.assertEqual(pulls, [same_stream.pull() for _ in range(60_000)])
+            self.assertNotEqual(pulls, [other_stream.pull() for _ in range(60_000)])
+            self.assertEqual(stream.pulls_count, 60_000)
+
+            # And every chamber, and only them, can be fired
+            chambers = Counter(pulls)
+            self.assertEqual(set(chambers), set(range(BULLETS_COUNT)))
+            for count in chambers.values():
+                self.assertAlmostEqual(count / 60_000, 1 / BULLETS_COUNT, delta=0.01)
+
+    def test_skip(self):
+        for use_numpy in self.backends():
+            for skipped_count in (0, 30, 100, 250):
+
+                # Given a stream, and a restarted one that pulled 10 times before skipping
+                stream = OutcomeStream(seed=42, batch_size=100, use_numpy=use_numpy)
+                pulls = [stream.pull() for _ in range(10 + skipped_count + 300)]
+                restarted_stream = OutcomeStream(seed=42, batch_size=100, use_numpy=use_numpy)
+                [restarted_stream.pull() for _ in range(10)]
+
+                # When the restarted stream skips the pulls it already made
+                restarted_stream.skip(skipped_count)
+
+                # Then it resumes where the first one stood
+                self.assertEqual([restarted_stream.pull() for _ in range(300)], pulls[10 + skipped_count:])
+                self.assertEqual(restarted_stream.pulls_count, stream.pulls_count)
+
+    def test_resume(self):
+        for use_numpy in self.backends():
+
+            # Given a stream that pulled in its third batch
+            stream = OutcomeStream(seed=42, batch_size=100, use_numpy=use_numpy)
+            [stream.pull() for _ in range(250)]
+            self.assertEqual(stream.batches_count, 3)
+
+            # When a restarted stream resumes after the batches it drew
+            restarted_stream = OutcomeStream(seed=42, batch_size=100, use_numpy=use_numpy)
+            restarted_stream.resume(stream.batches_count)
+
+            # Then it serves the pulls of the next batch, the rest of the third batch being dropped
+            stream.skip(50)
+            self.assertEqual([restarted_stream.pull() for _ in range(300)], [stream.pull() for _ in range(300)])
+            self.assertEqual(restarted_stream.pulls_count, stream.pulls_count)
+
+    def test_derive_seed(self):
+        self.assertEqual(derive_seed(1, "bot"), derive_seed(1, "bot"))
+        self.assertNotEqual(derive_seed(1, "bot"), derive_seed(1, "other bot"))
+        self.assertNotEqual(derive_seed(None, "bot"), derive_seed(None, "bot"))
+
+    def test_simulate(self):
+        for use_numpy in self.backends():
+
+            # When simulating plays of many players
+            report = simulate(200_000, players=100, seed=7, use_numpy=use_numpy)
+
+            # Then the observed odds and points match the rules
+            self.assertEqual(report["plays"], 200_000)
+            self.assertTrue(report["odds_ok"])
+            self.assertAlmostEqual(report["points_per_play"], report["expected_points_per_play"], delta=0.02)
+            self.assertLessEqual(report["player_points_p1"], report["player_points_p50"])
+            self.assertLessEqual(report["player_points_p50"], report["player_points_p99"])
+
+
+if __name__ == '__main__':
+    unittest.main()